@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.db import connections
+
+
+def use_database(path=None):
+    """
+    Point the default connection at the benchmark database for this process.
+
+    Benchmarks run the real views, which all use ``default``, so the data
+    lives in a separate SQLite file instead of the development database.
+    """
+    path = str(path or settings.BENCHMARK_DATABASE_NAME)
+    connection = connections['default']
+    connection.close()
+    connection.settings_dict['NAME'] = path
+    return path
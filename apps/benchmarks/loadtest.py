@@ -0,0 +1,159 @@
+import asyncio
+import http.client
+import io
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import Client, override_settings
+
+from apps.benchmarks.runner import HOT_PRODUCTS, LIST_PARAMS, PERCENTILES, BenchmarkError, percentile
+from apps.orders.models import Cart
+from apps.products.models import Product
+from core.asgi import AsyncHandler
+
+User = get_user_model()
+
+# Read endpoints with async views under ASGI, see core.asgi_urls.
+ENDPOINTS = ('product_list', 'product_detail', 'cart')
+
+
+def request_mix(count, seed=0):
+    """Return ``count`` seeded ``(path, query string)`` requests, cycling through the endpoints."""
+    rng = random.Random(seed)
+    product_ids = list(Product.objects.filter(is_active=True).values_list('id', flat=True)[:HOT_PRODUCTS])
+    if not product_ids or not Cart.objects.exists():
+        raise BenchmarkError('The database has no products or carts, run seed_benchmark_data first')
+    requests = []
+    for index in range(count):
+        endpoint = ENDPOINTS[index % len(ENDPOINTS)]
+        if endpoint == 'product_list':
+            requests.append(('/products/', urlencode(rng.choice(LIST_PARAMS))))
+        elif endpoint == 'product_detail':
+            requests.append((f'/products/{rng.choice(product_ids)}/', ''))
+        else:
+            requests.append(('/orders/cart/', ''))
+    return requests
+
+
+def session_cookie():
+    """Log a cart owner in and return the ``Cookie`` header for their session."""
+    client = Client()
+    client.force_login(User.objects.get(id=Cart.objects.values_list('user_id', flat=True).first()))
+    return '; '.join(f'{name}={morsel.value}' for name, morsel in client.cookies.items())
+
+
+def run(mode, requests, concurrency=50, cookie='', url=None):
+    """
+    Send ``requests`` with ``concurrency`` in flight and return throughput and latency percentiles.
+
+    ``mode`` is ``wsgi`` (the WSGI handler called from a thread pool),
+    ``asgi`` (the ASGI handler driven by one event loop) or ``http`` (a
+    running server at ``url``, e.g. gunicorn or uvicorn). The in-process
+    modes run with DEBUG and the query profiler off.
+    """
+    runners = {'wsgi': _run_wsgi, 'asgi': _run_asgi, 'http': _run_http}
+    with override_settings(DEBUG=False, QUERY_PROFILER_ENABLED=False, ALLOWED_HOSTS=['testserver']):
+        start = time.perf_counter()
+        results = runners[mode](requests, concurrency, cookie, url)
+        elapsed = time.perf_counter() - start
+
+    latencies = [latency for _, latency in results]
+    report = {
+        'requests': len(results),
+        'errors': sum(status >= 400 and status != 404 for status, _ in results),
+        'throughput_rps': round(len(results) / elapsed, 1),
+    }
+    report.update({f'p{percent}_ms': round(percentile(latencies, percent), 3) for percent in PERCENTILES})
+    report['max_ms'] = round(max(latencies), 3)
+    return report
+
+
+def _run_wsgi(requests, concurrency, cookie, url):
+    application = WSGIHandler()
+
+    def call(request):
+        path, query = request
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+            'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'testserver', 'HTTP_COOKIE': cookie,
+            'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        }
+        status = []
+        start = time.perf_counter()
+        response = application(environ, lambda line, headers: status.append(int(line.split()[0])))
+        try:
+            b''.join(response)
+        finally:
+            response.close()
+        return status[0], (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(call, requests))
+
+
+def _run_asgi(requests, concurrency, cookie, url):
+    application = AsyncHandler()
+
+    async def call(request):
+        path, query = request
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+            'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+        }
+        sent = False
+        status = []
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # The client never disconnects; Django cancels this once it has responded.
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        start = time.perf_counter()
+        await application(scope, receive, send)
+        return status[0], (time.perf_counter() - start) * 1000
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(request):
+            async with semaphore:
+                return await call(request)
+        return await asyncio.gather(*(limited(request) for request in requests))
+
+    return asyncio.run(main())
+
+
+def _run_http(requests, concurrency, cookie, url):
+    if not url:
+        raise BenchmarkError('The http mode needs the URL of a running server')
+    target = urlsplit(url)
+    local = threading.local()
+
+    def call(request):
+        path, query = request
+        if not hasattr(local, 'connection'):
+            local.connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        start = time.perf_counter()
+        local.connection.request('GET', f'{target.path.rstrip("/")}{path}?{query}', headers={'Cookie': cookie})
+        response = local.connection.getresponse()
+        response.read()
+        return response.status, (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(call, requests))
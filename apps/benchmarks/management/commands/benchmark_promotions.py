@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from apps.benchmarks import runner
+
+
+class Command(BaseCommand):
+    help = 'Measure compiling generated promotions into the rule index and pricing carts with it.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rules', type=int, default=10_000)
+        parser.add_argument('--lines', type=int, default=50)
+        parser.add_argument('--carts', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        result = runner.promotion_rules(rules=options['rules'], lines=options['lines'], carts=options['carts'])
+        self.stdout.write(
+            f'{result["rules"]} rules compiled into {result["schedules"]} schedules in {result["build_ms"]}ms; '
+            f'{result["discounted_lines"]:.1%} of lines discounted'
+        )
+        self.stdout.write(f'{result["lines"]}-line cart, {result["us_per_line"]}us per line: ' + '  '.join(
+            f'p{percent} {result[f"p{percent}_ms"]}ms' for percent in runner.PERCENTILES
+        ))
@@ -0,0 +1,36 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.benchmarks import runner
+from apps.benchmarks.database import use_database
+
+
+class Command(BaseCommand):
+    help = 'Compare ProductListSerializer with its compiled fast path on a large product page.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db', help='SQLite file, defaults to BENCHMARK_DATABASE_NAME.')
+        parser.add_argument('--rows', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--min-speedup', type=float, default=5.0,
+                            help='Fail when the fast path does not serialize at least this many times faster.')
+
+    def handle(self, *args, **options):
+        path = use_database(options['db'])
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist, run seed_benchmark_data first')
+
+        try:
+            result = runner.serializer_throughput(rows=options['rows'], repeat=options['repeat'])
+        except runner.BenchmarkError as error:
+            raise CommandError(str(error))
+        for name, timings in result['timings_ms'].items():
+            self.stdout.write(f'{name:<5} ' + '  '.join(f'{stage} {value:>8.2f}ms' for stage, value in timings.items()))
+        self.stdout.write(
+            f'{result["rows"]} rows serialized: DRF {result["drf_rows_per_s"]} rows/s, '
+            f'fast path {result["fast_rows_per_s"]} rows/s ({result["speedup"]}x, '
+            f'{result["end_to_end_speedup"]}x end to end)'
+        )
+        if result['speedup'] < options['min_speedup']:
+            raise CommandError(f'Speedup {result["speedup"]}x is below {options["min_speedup"]}x')
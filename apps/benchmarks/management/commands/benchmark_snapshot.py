@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from apps.benchmarks import runner
+
+
+class Command(BaseCommand):
+    help = 'Measure the memory and page latency of the in-process product snapshot on generated products.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000_000)
+        parser.add_argument('--queries', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        result = runner.snapshot_footprint(products=options['products'], queries=options['queries'])
+        for name, size in result['memory_bytes'].items():
+            self.stdout.write(f'{name:<24} {size / 2 ** 20:>8.1f} MB')
+        self.stdout.write(
+            f'{result["products"]} products: {result["total_mb"]} MB, {result["bytes_per_product"]} bytes '
+            f'per product ({result["mb_per_million"]} MB per million), loaded in {result["load_s"]}s, '
+            f'indexed in {result["index_s"]}s'
+        )
+        self.stdout.write('page ' + '  '.join(
+            f'p{percent} {result[f"p{percent}_ms"]}ms' for percent in runner.PERCENTILES
+        ))
@@ -0,0 +1,42 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.benchmarks import loadtest
+from apps.benchmarks.database import use_database
+from apps.benchmarks.runner import BenchmarkError
+
+
+class Command(BaseCommand):
+    help = ('Load test the catalogue and cart read endpoints through the WSGI and ASGI handlers, '
+            'or against a running server.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db', help='SQLite file, defaults to BENCHMARK_DATABASE_NAME.')
+        parser.add_argument('--mode', action='append', dest='modes', choices=('wsgi', 'asgi', 'http'),
+                            help='Handler to load (repeatable), defaults to wsgi and asgi.')
+        parser.add_argument('--url', help='Base URL of a running server for the http mode, '
+                                          'e.g. one started with uvicorn core.asgi:application.')
+        parser.add_argument('--requests', type=int, default=3000)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        path = use_database(options['db'])
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist, run seed_benchmark_data first')
+        modes = options['modes'] or (['http'] if options['url'] else ['wsgi', 'asgi'])
+
+        try:
+            requests = loadtest.request_mix(options['requests'], seed=options['seed'])
+            cookie = loadtest.session_cookie()
+            for mode in modes:
+                result = loadtest.run(mode, requests, concurrency=options['concurrency'], cookie=cookie,
+                                      url=options['url'])
+                self.stdout.write(
+                    f'{mode:<5} {result["throughput_rps"]:>8.1f} req/s  p50 {result["p50_ms"]:>8.2f}ms  '
+                    f'p95 {result["p95_ms"]:>8.2f}ms  p99 {result["p99_ms"]:>8.2f}ms  '
+                    f'max {result["max_ms"]:>8.2f}ms  {result["errors"]} errors'
+                )
+        except BenchmarkError as error:
+            raise CommandError(str(error))
@@ -0,0 +1,63 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.benchmarks import runner
+from apps.benchmarks.database import use_database
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the main endpoints on the seeded database and compare against the baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db', help='SQLite file, defaults to BENCHMARK_DATABASE_NAME.')
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=list(runner.SCENARIOS),
+                            help='Only this scenario (repeatable).')
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--memory-iterations', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='benchmark-results.json')
+        parser.add_argument('--baseline', default=str(settings.BENCHMARK_BASELINE))
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative growth of p95 latency and peak memory.')
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Store these results as the new baseline instead of comparing.')
+
+    def handle(self, *args, **options):
+        path = use_database(options['db'])
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist, run seed_benchmark_data first')
+
+        try:
+            results = runner.run(options['scenarios'], iterations=options['iterations'], warmup=options['warmup'],
+                                 memory_iterations=options['memory_iterations'], seed=options['seed'])
+        except runner.BenchmarkError as error:
+            raise CommandError(str(error))
+        self._write(options['output'], results)
+        for name, result in results['results'].items():
+            self.stdout.write(
+                f'{name:<26} p50 {result["p50_ms"]:>8.2f}ms  p95 {result["p95_ms"]:>8.2f}ms  '
+                f'p99 {result["p99_ms"]:>8.2f}ms  {result["queries_max"]:>3} queries  '
+                f'{result["peak_memory_kb"]:>9.1f}KB'
+            )
+
+        if options['update_baseline']:
+            self._write(options['baseline'], results)
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {options["baseline"]}.'))
+            return
+        if not os.path.exists(options['baseline']):
+            self.stdout.write(self.style.WARNING('No baseline to compare against, use --update-baseline.'))
+            return
+        with open(options['baseline']) as baseline:
+            regressions = runner.compare(results, json.load(baseline), tolerance=options['tolerance'])
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def _write(self, path, results):
+        with open(path, 'w') as output:
+            json.dump(results, output, indent=2)
+            output.write('\n')
@@ -0,0 +1,34 @@
+import os
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.benchmarks import seed
+from apps.benchmarks.database import use_database
+
+
+class Command(BaseCommand):
+    help = 'Create a separate SQLite database filled with synthetic benchmark data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db', help='SQLite file, defaults to BENCHMARK_DATABASE_NAME.')
+        parser.add_argument('--fresh', action='store_true', help='Delete the database file first.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=seed.BATCH_SIZE)
+        for name, default in seed.DEFAULT_VOLUMES.items():
+            parser.add_argument(f'--{name.replace("_", "-")}', type=int, default=default, dest=name)
+
+    def handle(self, *args, **options):
+        path = use_database(options['db'])
+        if options['fresh'] and os.path.exists(path):
+            os.remove(path)
+        call_command('migrate', verbosity=0)
+        if seed.Product.objects.exists():
+            raise CommandError(f'{path} already has products, use --fresh to recreate it')
+
+        volumes = {name: options[name] for name in seed.DEFAULT_VOLUMES}
+        counts = seed.seed(volumes, seed=options['seed'], batch_size=options['batch_size'],
+                           log=lambda message: self.stdout.write(f'Seeding {message}...'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {path}: ' + ', '.join(f'{count} {name}' for name, count in counts.items())
+        ))
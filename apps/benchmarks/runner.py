@@ -0,0 +1,428 @@
+import gc
+import math
+import platform
+import random
+import sqlite3
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from apps.orders.models import Cart
+from apps.orders.services import update_cart_items
+from apps.products import cache
+from apps.products.models import Category, Product
+from apps.products.serializers import ProductListSerializer, product_list_rows
+from apps.products.snapshot import Snapshot
+from apps.promotions.models import Discount
+from apps.promotions.rules import CouponRule, Line, RuleIndex
+from core.profiling import profile_queries
+
+User = get_user_model()
+
+PERCENTILES = (50, 90, 95, 99)
+LIST_PARAMS = (
+    {},
+    {'sort': 'price'},
+    {'sort': '-price', 'min_price': '10'},
+    {'in_stock': 'true', 'is_featured': 'true'},
+)
+# Hot products for the warm detail cache, as on a real storefront.
+HOT_PRODUCTS = 50
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Context:
+    """Shared state for the scenarios: a client, a seeded RNG and sampled ids."""
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.client = APIClient()
+        self.product_ids = list(Product.objects.filter(is_active=True).values_list('id', flat=True))
+        self.category_ids = list(Category.objects.filter(parent__isnull=True).values_list('id', flat=True))
+        self.cart_user_ids = list(Cart.objects.values_list('user_id', flat=True))
+        if not self.product_ids or not self.cart_user_ids:
+            raise BenchmarkError('The database has no products or carts, run seed_benchmark_data first')
+        self.hot_ids = self.product_ids[:HOT_PRODUCTS]
+        self.user = None
+
+    def login(self, user_id):
+        self.user = User(id=user_id)
+        self.client.force_authenticate(self.user)
+
+
+class Scenario:
+    """
+    One benchmarked request; ``setup`` runs untimed before every ``request``.
+
+    Error responses abort the run unless their status is in ``allowed``.
+    """
+
+    def __init__(self, name, request, setup=None, allowed=()):
+        self.name = name
+        self.request = request
+        self.setup = setup or (lambda context: None)
+        self.allowed = allowed
+
+
+def _product_list(context):
+    params = dict(context.rng.choice(LIST_PARAMS))
+    if context.rng.random() < 0.5:
+        params['cat_id'] = context.rng.choice(context.category_ids)
+    return context.client.get('/products/', params)
+
+
+def _product_detail(context):
+    return context.client.get(f'/products/{context.rng.choice(context.hot_ids)}/')
+
+
+def _product_detail_uncached(context):
+    return context.client.get(f'/products/{context.rng.choice(context.product_ids)}/')
+
+
+def _cart_retrieve(context):
+    return context.client.get('/orders/cart/')
+
+
+def _cart_add(context):
+    return context.client.post('/orders/cart/item/', {
+        'product': context.rng.choice(context.product_ids), 'quantity': 1,
+    }, format='json')
+
+
+def _cart_bulk(context):
+    items = [{'product': product_id, 'quantity': context.rng.randint(1, 3)}
+             for product_id in context.rng.sample(context.product_ids, 10)]
+    return context.client.post('/orders/cart/items/bulk/', {'items': items, 'mode': 'set'}, format='json')
+
+
+def _checkout(context):
+    return context.client.post('/orders/checkout/', {
+        'shipping_address': 'Benchmark street 1', 'phone': '+998900000000',
+    }, format='json')
+
+
+def _login_cart_user(context):
+    context.login(context.rng.choice(context.cart_user_ids))
+
+
+def _clear_cache(context):
+    cache.get_cache().clear()
+
+
+def _fill_cart(context):
+    _login_cart_user(context)
+    update_cart_items(context.user, {product_id: 1 for product_id in context.rng.sample(context.product_ids, 3)})
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (
+    # The list answers 404 when a filter combination matches nothing.
+    Scenario('product_list', _product_list, allowed=(404,)),
+    Scenario('product_detail', _product_detail),
+    Scenario('product_detail_uncached', _product_detail_uncached, setup=_clear_cache),
+    Scenario('cart_retrieve', _cart_retrieve, setup=_login_cart_user),
+    Scenario('cart_add', _cart_add, setup=_login_cart_user),
+    Scenario('cart_bulk', _cart_bulk, setup=_login_cart_user),
+    Scenario('checkout', _checkout, setup=_fill_cart),
+)}
+
+
+def percentile(values, percent):
+    """Linear-interpolated percentile of ``values``."""
+    values = sorted(values)
+    position = (len(values) - 1) * percent / 100
+    low = math.floor(position)
+    high = math.ceil(position)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def run(names=None, iterations=200, warmup=20, memory_iterations=20, seed=0):
+    """
+    Benchmark the scenarios in-process through the full middleware stack.
+
+    Every scenario gets ``warmup`` untimed requests, ``iterations`` timed ones
+    (latency and query count) and ``memory_iterations`` more under
+    tracemalloc, which would otherwise distort the timings. Runs with DEBUG
+    and the query profiler off, as in production.
+    """
+    results = {}
+    with override_settings(DEBUG=False, QUERY_PROFILER_ENABLED=False, ALLOWED_HOSTS=['testserver']):
+        context = Context(seed)
+        for name in names or SCENARIOS:
+            results[name] = _run_scenario(SCENARIOS[name], context, iterations, warmup, memory_iterations)
+    return {
+        'meta': {
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'products': len(context.product_ids),
+            'iterations': iterations,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def _run_scenario(scenario, context, iterations, warmup, memory_iterations):
+    for _ in range(warmup):
+        _call(scenario, context)
+
+    latencies = []
+    queries = []
+    for _ in range(iterations):
+        scenario.setup(context)
+        with profile_queries(using='default') as recorder:
+            start = time.perf_counter()
+            _call(scenario, context, setup=False)
+            latencies.append((time.perf_counter() - start) * 1000)
+        queries.append(recorder.count)
+
+    peak = 0
+    tracemalloc.start()
+    try:
+        for _ in range(memory_iterations):
+            scenario.setup(context)
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            _call(scenario, context, setup=False)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+
+    result = {f'p{percent}_ms': round(percentile(latencies, percent), 3) for percent in PERCENTILES}
+    result.update(
+        mean_ms=round(statistics.fmean(latencies), 3),
+        max_ms=round(max(latencies), 3),
+        queries_median=statistics.median(queries),
+        queries_max=max(queries),
+        peak_memory_kb=round(peak / 1024, 1),
+    )
+    return result
+
+
+def _call(scenario, context, setup=True):
+    if setup:
+        scenario.setup(context)
+    response = scenario.request(context)
+    if response.status_code >= 400 and response.status_code not in scenario.allowed:
+        raise BenchmarkError(f'{scenario.name} returned {response.status_code}: {response.content[:200]!r}')
+    return response
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Return the regressions of ``results`` against ``baseline``.
+
+    Latency (p95) and peak memory may grow by ``tolerance``; the query count
+    is deterministic and may not grow at all.
+    """
+    regressions = []
+    for name, current in results['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f'{name}: p95 {current["p95_ms"]}ms, baseline {previous["p95_ms"]}ms')
+        if current['queries_max'] > previous['queries_max']:
+            regressions.append(f'{name}: {current["queries_max"]} queries, baseline {previous["queries_max"]}')
+        if current['peak_memory_kb'] > previous['peak_memory_kb'] * (1 + tolerance):
+            regressions.append(
+                f'{name}: peak memory {current["peak_memory_kb"]}KB, baseline {previous["peak_memory_kb"]}KB'
+            )
+    return regressions
+
+
+def serializer_throughput(rows=10_000, repeat=5):
+    """
+    Compare ProductListSerializer with its compiled fast path on one page of ``rows`` products.
+
+    Fetching, serializing and rendering to JSON are timed separately, each
+    as the best of ``repeat`` runs. ``speedup`` is for serializing, the part
+    the fast path replaces; ``end_to_end_speedup`` covers all three.
+    """
+    products = Product.objects.filter(is_active=True).order_by('-created_at', '-id')[:rows]
+    renderer = JSONRenderer()
+    paths = {
+        'drf': (
+            lambda: list(products.with_list_data()),
+            lambda instances: ProductListSerializer(instances, many=True).data,
+        ),
+        'fast': (
+            lambda: list(product_list_rows.values(products.with_primary_image())),
+            product_list_rows.to_representation,
+        ),
+    }
+    timings = {}
+    output = {}
+    for name, (fetch, serialize) in paths.items():
+        fetched = fetch()
+        data = serialize(fetched)
+        output[name] = renderer.render(data)
+        timings[name] = {
+            'fetch': _best(fetch, repeat),
+            'serialize': _best(lambda: serialize(fetched), repeat),
+            'render': _best(lambda: renderer.render(data), repeat),
+        }
+    if output['drf'] != output['fast']:
+        raise BenchmarkError('The fast path output differs from ProductListSerializer')
+
+    count = len(fetched)
+    drf, fast = timings['drf'], timings['fast']
+    return {
+        'rows': count,
+        'timings_ms': {name: {stage: round(value * 1000, 2) for stage, value in stages.items()}
+                       for name, stages in timings.items()},
+        'drf_rows_per_s': round(count / drf['serialize']),
+        'fast_rows_per_s': round(count / fast['serialize']),
+        'speedup': round(drf['serialize'] / fast['serialize'], 2),
+        'end_to_end_speedup': round(sum(drf.values()) / sum(fast.values()), 2),
+    }
+
+
+def snapshot_footprint(products=1_000_000, queries=1000, categories=200, brands=100, seed=0):
+    """
+    Measure the product snapshot on ``products`` generated rows: memory, build time and page latency.
+
+    Nothing is read from the database. All the indexes are built before
+    memory is measured, which is what a busy process ends up holding;
+    ``queries`` random filter and sort combinations are then timed.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    snapshot = Snapshot()
+    snapshot.category_paths = {pk: f'/{pk}/' for pk in range(1, categories + 1)}
+
+    def rows():
+        for pk in range(1, products + 1):
+            cents = rng.randint(100, 200_000)
+            discount = rng.choice((0, 0, 0, 10, 25))
+            yield (pk, rng.randint(1, categories), rng.randint(1, brands), cents / 100, discount, rng.randint(0, 50),
+                   rng.random() < 0.05, round(rng.uniform(0, 5), 2), now - timedelta(seconds=products - pk), True,
+                   (cents * (100 - discount) + 50) // 100 / 100, now)
+
+    start = time.perf_counter()
+    snapshot.extend(rows())
+    load = time.perf_counter() - start
+
+    orderings = [('-created_at', '-id'), ('price', 'id'), ('-price', '-id')]
+    start = time.perf_counter()
+    snapshot.build_indexes(orderings)
+    index = time.perf_counter() - start
+    usage = snapshot.memory_usage()
+    total = sum(usage.values())
+
+    latencies = []
+    for _ in range(queries):
+        filters = {}
+        if rng.random() < 0.4:
+            filters['cat_id'] = [rng.randint(1, categories)]
+        if rng.random() < 0.4:
+            filters['brand_id'] = [rng.randint(1, brands)]
+        if rng.random() < 0.4:
+            filters['min_price'] = rng.choice((10, 100, 500))
+        if rng.random() < 0.3:
+            filters['max_price'] = rng.choice((50, 250, 1000))
+        if rng.random() < 0.3:
+            filters['in_stock'] = True
+        ordering = rng.choice(orderings)
+        start = time.perf_counter()
+        snapshot.page(filters, ordering, False, None, 21)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    report = {
+        'products': products,
+        'load_s': round(load, 2),
+        'index_s': round(index, 2),
+        'memory_bytes': usage,
+        'total_mb': round(total / 2 ** 20, 1),
+        'bytes_per_product': round(total / products, 1),
+        'mb_per_million': round(total / products * 1_000_000 / 2 ** 20, 1),
+    }
+    report.update({f'p{percent}_ms': round(percentile(latencies, percent), 3) for percent in PERCENTILES})
+    return report
+
+
+def promotion_rules(rules=10_000, lines=50, carts=1000, products=100_000, categories=200, brands=100, seed=0):
+    """
+    Time compiling ``rules`` generated promotions into a RuleIndex and pricing ``carts`` carts of ``lines`` lines.
+
+    Nothing is read from the database. Promotions target products,
+    categories two levels deep or brands, with a few for the whole
+    catalogue; one in five has quantity tiers.
+    """
+    rng = random.Random(seed)
+    roots = max(1, categories // 10)
+    category_paths = {pk: f'/{pk}/' if pk <= roots else f'/{(pk - 1) % roots + 1}/{pk}/'
+                      for pk in range(1, categories + 1)}
+    promotion_rows, tiers, targets = [], [], []
+    for pk in range(1, rules + 1):
+        kind = Discount.PERCENT if rng.random() < 0.8 else Discount.FIXED
+        value = Decimal(rng.randint(1, 30)) if kind == Discount.PERCENT else Decimal(rng.randint(100, 2000)) / 100
+        promotion_rows.append((pk, f'Promotion {pk}', kind, value, rng.choice((1, 1, 1, 2, 3))))
+        if rng.random() < 0.2:
+            tiers.extend((pk, quantity, value * step) for step, quantity in enumerate((5, 10), start=2))
+        target = rng.random()
+        if target < 0.6:
+            targets.extend((pk, 'product', rng.randint(1, products)) for _ in range(rng.randint(1, 5)))
+        elif target < 0.85:
+            targets.append((pk, 'category', rng.randint(1, categories)))
+        elif target < 0.999:
+            targets.append((pk, 'brand', rng.randint(1, brands)))
+    coupons = [CouponRule(pk, f'CODE{pk}', Discount.PERCENT, Decimal(10), Decimal(100)) for pk in range(1, 101)]
+
+    start = time.perf_counter()
+    index = RuleIndex.build(promotion_rows, tiers, targets, category_paths, coupons)
+    build = time.perf_counter() - start
+
+    latencies = []
+    discounted = 0
+    for _ in range(carts):
+        cart = []
+        for _ in range(lines):
+            quantity = rng.choice((1, 1, 1, 2, 3, 5, 10))
+            cart.append(Line(rng.randint(1, products), rng.randint(1, categories), rng.randint(1, brands), quantity,
+                             Decimal(rng.randint(100, 50_000)) / 100 * quantity))
+        code = f'CODE{rng.randint(1, 200)}'
+        start = time.perf_counter()
+        priced = index.evaluate(cart, code)
+        latencies.append((time.perf_counter() - start) * 1000)
+        discounted += sum(1 for discount in priced.line_discounts if discount)
+
+    report = {
+        'rules': rules,
+        'lines': lines,
+        'carts': carts,
+        'build_ms': round(build * 1000, 1),
+        'schedules': len(index.by_product) + len(index.by_category) + len(index.by_brand),
+        'discounted_lines': round(discounted / (carts * lines), 3),
+        'us_per_line': round(statistics.mean(latencies) * 1000 / lines, 2),
+    }
+    report.update({f'p{percent}_ms': round(percentile(latencies, percent), 3) for percent in PERCENTILES})
+    return report
+
+
+def _best(func, repeat):
+    # Like timeit: collections triggered by the other side's garbage would skew the comparison.
+    best = math.inf
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return best
@@ -0,0 +1,152 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+
+from apps.inventory.services import rebuild_stock
+from apps.orders.models import Cart, CartItem, Order, OrderItem
+from apps.products.sales import rebuild_units_sold
+from apps.products.models import Brand, Category, Product, ProductImage
+from apps.reviews.models import ProductReview
+from apps.reviews.ratings import rebuild_ratings
+
+User = get_user_model()
+
+DEFAULT_VOLUMES = {
+    'products': 100_000,
+    'reviews': 1_000_000,
+    'carts': 50_000,
+    'order_items': 500_000,
+}
+ROOT_CATEGORIES = 10
+SUBCATEGORIES = 10
+BRANDS = 200
+ITEMS_PER_ORDER = 5
+MAX_CART_ITEMS = 5
+BATCH_SIZE = 5000
+# Plenty for the cart and checkout benchmarks to never run out.
+STOCK = 1_000_000
+
+
+def seed(volumes=None, seed=0, batch_size=BATCH_SIZE, log=None):
+    """
+    Fill an empty database with a synthetic catalogue, reviews, carts and orders.
+
+    Everything is written with ``bulk_create`` in batches, so signals do not
+    run: stock counters and rating aggregates are rebuilt once and the search
+    index is kept up to date by its triggers. The same ``seed`` gives the same data.
+    Returns the number of rows created per model.
+    """
+    volumes = {**DEFAULT_VOLUMES, **(volumes or {})}
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    if connection.vendor == 'sqlite' and not connection.in_atomic_block:
+        # A throwaway database: skip fsyncs while loading it.
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous = OFF')
+
+    users = max(volumes['carts'], 100)
+    counts = {}
+    password = make_password(None)
+    log(f'{users} users')
+    counts['users'] = _bulk(User, (
+        User(username=f'bench-{i}', password=password) for i in range(users)
+    ), batch_size)
+    user_ids = list(User.objects.filter(username__startswith='bench-').order_by('id').values_list('id', flat=True))
+
+    # Categories go through save() so their materialized paths are maintained.
+    category_ids = []
+    for i in range(ROOT_CATEGORIES):
+        root = Category.objects.create(name=f'Category {i}', slug=f'bench-category-{i}', description='-')
+        for j in range(SUBCATEGORIES):
+            child = Category.objects.create(name=f'Category {i}.{j}', slug=f'bench-category-{i}-{j}',
+                                            description='-', parent=root)
+            category_ids.append(child.id)
+    counts['categories'] = ROOT_CATEGORIES * (SUBCATEGORIES + 1)
+    counts['brands'] = _bulk(Brand, (
+        Brand(name=f'Brand {i}', logo=f'https://example.com/brands/{i}.png', description='-')
+        for i in range(BRANDS)
+    ), batch_size)
+    brand_ids = list(Brand.objects.order_by('id').values_list('id', flat=True))
+
+    log(f'{volumes["products"]} products')
+    counts['products'] = _bulk(Product, (
+        Product(
+            name=f'Product {i}',
+            slug=f'bench-product-{i}',
+            description=f'Synthetic product {i} for benchmarks',
+            category_id=rng.choice(category_ids),
+            brand_id=rng.choice(brand_ids),
+            price=Decimal(rng.randrange(100, 500_000)) / 100,
+            discount_percentage=rng.choice((0, 0, 0, 5, 10, 25)),
+            stock_quantity=STOCK,
+            is_featured=rng.random() < 0.05,
+        )
+        for i in range(volumes['products'])
+    ), batch_size)
+    products = list(Product.objects.order_by('id').values_list('id', 'price', 'discount_percentage'))
+    product_ids = [product_id for product_id, _, _ in products]
+    rebuild_stock(batch_size=batch_size)
+    counts['images'] = _bulk(ProductImage, (
+        ProductImage(product_id=product_id, image_url=f'https://example.com/products/{product_id}/{order}.jpg',
+                     is_primary=order == 0, order=order)
+        for product_id in product_ids for order in range(2)
+    ), batch_size)
+
+    log(f'{volumes["reviews"]} reviews')
+    counts['reviews'] = _bulk(ProductReview, _reviews(rng, product_ids, user_ids, volumes['reviews']), batch_size)
+    rebuild_ratings(batch_size=batch_size)
+
+    log(f'{volumes["carts"]} carts')
+    counts['carts'] = _bulk(Cart, (Cart(user_id=user_id) for user_id in user_ids[:volumes['carts']]), batch_size)
+    counts['cart_items'] = _bulk(CartItem, (
+        CartItem(cart_id=cart_id, product_id=product_id, quantity=rng.randint(1, 3))
+        for cart_id in Cart.objects.order_by('id').values_list('id', flat=True)
+        for product_id in rng.sample(product_ids, rng.randint(1, MAX_CART_ITEMS))
+    ), batch_size)
+
+    log(f'{volumes["order_items"]} order items')
+    orders = volumes['order_items'] // ITEMS_PER_ORDER
+    counts['orders'] = _bulk(Order, (
+        Order(user_id=rng.choice(user_ids), order_number=f'BENCH-{i:014d}', total_amount=Decimal('0.00'),
+              shipping_address='Benchmark street 1', phone='+998900000000', status='delivered')
+        for i in range(orders)
+    ), batch_size)
+    counts['order_items'] = _bulk(OrderItem, (
+        OrderItem(order_id=order_id, product_id=product_id, quantity=1, price=price, discount_percentage=discount)
+        for order_id in Order.objects.filter(order_number__startswith='BENCH-').values_list('id', flat=True)
+        for product_id, price, discount in rng.sample(products, ITEMS_PER_ORDER)
+    ), batch_size)
+    rebuild_units_sold(batch_size=batch_size)
+    return counts
+
+
+def _reviews(rng, product_ids, user_ids, total):
+    per_product, extra = divmod(total, len(product_ids)) if product_ids else (0, 0)
+    for index, product_id in enumerate(product_ids):
+        count = min(per_product + (index < extra), len(user_ids))
+        for user_id in rng.sample(user_ids, count):
+            rating = rng.choices((1, 2, 3, 4, 5), weights=(1, 1, 2, 4, 4))[0]
+            yield ProductReview(product_id=product_id, user_id=user_id, rating=rating, title='Benchmark review',
+                                comment='Synthetic review text.', is_verified_purchase=rng.random() < 0.3)
+
+
+def _bulk(model, objects, batch_size):
+    created = 0
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) == batch_size:
+            created += _insert(model, batch)
+            batch = []
+    if batch:
+        created += _insert(model, batch)
+    return created
+
+
+def _insert(model, batch):
+    with transaction.atomic():
+        model.objects.bulk_create(batch)
+    return len(batch)
@@ -0,0 +1,62 @@
+from django.test import TestCase, TransactionTestCase
+
+from apps.benchmarks import loadtest, runner, seed
+from apps.orders.models import Order
+from apps.products.models import Product
+
+
+class BenchmarkTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.counts = seed.seed({'products': 30, 'reviews': 90, 'carts': 10, 'order_items': 25}, batch_size=20)
+
+    def test_seed_volumes(self):
+        self.assertEqual((self.counts['products'], self.counts['reviews'], self.counts['order_items']), (30, 90, 25))
+        self.assertEqual(Order.objects.count(), 5)
+        self.assertEqual(Product.objects.filter(rating_count=3).count(), 30)
+
+    def test_run_and_compare(self):
+        results = runner.run(['product_list', 'cart_retrieve', 'checkout'], iterations=3, warmup=1,
+                             memory_iterations=1)
+        cart = results['results']['cart_retrieve']
+        self.assertEqual(cart['queries_max'], 2)
+        self.assertLessEqual(cart['p50_ms'], cart['p99_ms'])
+
+        self.assertEqual(runner.compare(results, results), [])
+        baseline = {'results': {'cart_retrieve': dict(cart, queries_max=1, p95_ms=cart['p95_ms'] / 2)}}
+        self.assertEqual(len(runner.compare(results, baseline)), 2)
+
+    def test_serializer_throughput(self):
+        result = runner.serializer_throughput(rows=30, repeat=1)
+        self.assertEqual(result['rows'], 30)
+        self.assertGreater(result['speedup'], 1)
+
+    def test_snapshot_footprint(self):
+        result = runner.snapshot_footprint(products=500, queries=20)
+        self.assertEqual(result['products'], 500)
+        self.assertGreater(result['bytes_per_product'], 80)
+        self.assertIn('order:created,id', result['memory_bytes'])
+
+    def test_promotion_rules(self):
+        result = runner.promotion_rules(rules=200, lines=10, carts=20, products=500)
+        self.assertEqual((result['rules'], result['lines']), (200, 10))
+        self.assertGreater(result['schedules'], 0)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_percentile(self):
+        self.assertEqual(runner.percentile([4, 1, 3, 2], 50), 2.5)
+        self.assertEqual(runner.percentile([1, 2, 3, 4, 5], 100), 5)
+
+
+class LoadTestTest(TransactionTestCase):
+    # The handlers query from their own threads, so the data must be committed.
+
+    def test_wsgi_and_asgi(self):
+        seed.seed({'products': 10, 'reviews': 10, 'carts': 3, 'order_items': 5}, batch_size=20)
+        requests = loadtest.request_mix(12)
+        cookie = loadtest.session_cookie()
+        for mode in ('wsgi', 'asgi'):
+            with self.subTest(mode=mode):
+                result = loadtest.run(mode, requests, concurrency=4, cookie=cookie)
+                self.assertEqual((result['requests'], result['errors']), (12, 0))
+                self.assertLessEqual(result['p50_ms'], result['max_ms'])
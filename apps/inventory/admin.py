@@ -0,0 +1,32 @@
+from django.contrib import admin
+from .models import Reservation, StockCounter, StockMovement
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('id', 'product', 'quantity', 'kind', 'reference', 'created_at')
+    list_filter = ('kind', 'created_at')
+    search_fields = ('product__name', 'reference')
+    autocomplete_fields = ('product',)
+
+    # The ledger is append-only.
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockCounter)
+class StockCounterAdmin(admin.ModelAdmin):
+    list_display = ('id', 'product', 'shard', 'on_hand')
+    search_fields = ('product__name',)
+    readonly_fields = ('product', 'shard', 'on_hand')
+
+
+@admin.register(Reservation)
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'cart', 'product', 'quantity', 'expires_at')
+    list_filter = ('expires_at',)
+    search_fields = ('product__name', 'cart__user__username')
+    autocomplete_fields = ('cart', 'product')
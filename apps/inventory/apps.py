@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class InventoryConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.inventory'
+
+    def ready(self):
+        from apps.inventory import signals  # noqa: F401
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.inventory.services import rebuild_stock
+
+
+class Command(BaseCommand):
+    help = 'Reconcile the stock counters with the ledger and Product.stock_quantity with the counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--verify', action='store_true',
+                            help='Only report products whose stock is out of date.')
+
+    def handle(self, *args, **options):
+        drifted = rebuild_stock(batch_size=options['batch_size'], dry_run=options['verify'])
+        if options['verify']:
+            if drifted:
+                raise CommandError(f'{len(drifted)} product(s) have stale stock: {drifted[:20]}')
+            self.stdout.write(self.style.SUCCESS('All product stock is up to date.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt stock, {len(drifted)} product(s) updated.'))
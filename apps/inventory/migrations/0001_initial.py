@@ -0,0 +1,77 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_stock(apps, schema_editor):
+    # Every existing product starts from its stock_quantity.
+    Product = apps.get_model('products', 'Product')
+    StockCounter = apps.get_model('inventory', 'StockCounter')
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    shards = settings.INVENTORY_COUNTER_SHARDS
+    counters = []
+    movements = []
+    for product_id, stock in Product.objects.values_list('id', 'stock_quantity').iterator():
+        base, extra = divmod(max(stock, 0), shards)
+        counters.extend(StockCounter(product_id=product_id, shard=shard, on_hand=base + (shard < extra))
+                        for shard in range(shards))
+        if stock > 0:
+            movements.append(StockMovement(product_id=product_id, quantity=stock, kind='initial'))
+    StockCounter.objects.bulk_create(counters, batch_size=5000)
+    StockMovement.objects.bulk_create(movements, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('orders', '0002_order_history_index'),
+        ('products', '0009_slug_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='orders.cart')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'expires_at'], name='reservation_product_expiry_idx'), models.Index(fields=['expires_at'], name='reservation_expiry_idx')],
+                'constraints': [models.UniqueConstraint(fields=('cart', 'product'), name='reservation_cart_product_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('on_hand', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_counters', to='products.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'shard'), name='stock_counter_product_shard_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('kind', models.CharField(choices=[('initial', 'Initial'), ('adjustment', 'Adjustment'), ('import', 'Import'), ('restock', 'Restock'), ('sale', 'Sale')], max_length=20)),
+                ('reference', models.CharField(blank=True, default='', max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'created_at'], name='stock_movement_product_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_stock, migrations.RunPython.noop),
+    ]
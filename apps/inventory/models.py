@@ -0,0 +1,62 @@
+from django.db import models
+
+from apps.orders.models import Cart
+from apps.products.models import Product
+
+
+class StockMovement(models.Model):
+    # Append-only ledger: the movements of a product sum to its on-hand stock.
+    INITIAL = 'initial'
+    ADJUSTMENT = 'adjustment'
+    IMPORT = 'import'
+    RESTOCK = 'restock'
+    SALE = 'sale'
+    KIND_CHOICES = [
+        (INITIAL, 'Initial'),
+        (ADJUSTMENT, 'Adjustment'),
+        (IMPORT, 'Import'),
+        (RESTOCK, 'Restock'),
+        (SALE, 'Sale'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    quantity = models.IntegerField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    reference = models.CharField(max_length=50, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='stock_movement_product_idx'),
+        ]
+
+
+class StockCounter(models.Model):
+    # On-hand stock of a product split over INVENTORY_COUNTER_SHARDS rows, so
+    # concurrent sales of one product update different rows.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_counters')
+    shard = models.PositiveSmallIntegerField()
+    on_hand = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='stock_counter_product_shard_uniq'),
+        ]
+
+
+class Reservation(models.Model):
+    # Stock held for a cart line until expires_at; expired rows no longer
+    # count and are deleted by the expire_reservations command.
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='reservation_cart_product_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'expires_at'], name='reservation_product_expiry_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expiry_idx'),
+        ]
@@ -0,0 +1,249 @@
+import random
+from collections import namedtuple
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, PositiveIntegerField, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.inventory.models import Reservation, StockCounter, StockMovement
+from apps.products.cache import bump_versions
+from apps.products.models import Product
+
+
+StockLevel = namedtuple('StockLevel', ['is_active', 'on_hand', 'held', 'available'])
+
+
+class InventoryError(Exception):
+    def __init__(self, shortages):
+        super().__init__(shortages)
+        # {product_id: units that were available}
+        self.shortages = shortages
+
+
+def spread(quantity, shards=None):
+    """Split ``quantity`` as evenly as possible over ``shards`` counters."""
+    shards = shards or settings.INVENTORY_COUNTER_SHARDS
+    base, extra = divmod(quantity, shards)
+    return [base + (shard < extra) for shard in range(shards)]
+
+
+def _sum(queryset, field):
+    return Subquery(queryset.values('product').annotate(total=Sum(field)).values('total'))
+
+
+def on_hand():
+    """Subquery of the on-hand stock of the product in the outer query, None without counters."""
+    return _sum(StockCounter.objects.filter(product=OuterRef('pk')), 'on_hand')
+
+
+def seed_counters(product_ids):
+    """
+    Create the counters of the products among ``product_ids`` that have none, from their ``stock_quantity``.
+
+    Products written by ``bulk_create()`` or ``loaddata`` skip the signal
+    that creates them.
+    """
+    levels = dict(Product.objects.filter(id__in=product_ids).exclude(
+        Exists(StockCounter.objects.filter(product=OuterRef('pk'))),
+    ).values_list('id', 'stock_quantity'))
+    if levels:
+        set_stock(levels, kind=StockMovement.INITIAL)
+
+
+def availability(product_ids, cart=None, now=None):
+    """
+    Return ``{product_id: StockLevel}`` for ``product_ids``.
+
+    One query whatever the number of products. ``held`` counts the live
+    reservations of carts other than ``cart`` and ``available`` is what is
+    left for it. Unknown ids are missing from the result.
+    """
+    held = Reservation.objects.filter(product=OuterRef('pk'), expires_at__gt=now or timezone.now())
+    if cart is not None:
+        held = held.exclude(cart=cart)
+    rows = Product.objects.filter(id__in=product_ids).annotate(
+        # Products without counters yet have their stored stock.
+        on_hand=Coalesce(on_hand(), F('stock_quantity')),
+        held=Coalesce(_sum(held, 'quantity'), 0),
+    ).values_list('id', 'is_active', 'on_hand', 'held')
+    return {product_id: StockLevel(is_active, stock, held, stock - held) for product_id, is_active, stock, held in rows}
+
+
+def reserve(cart, quantities, timeout, now=None):
+    """
+    Hold ``quantities`` ({product_id: quantity}) for ``cart`` for ``timeout`` seconds and return the expiry.
+
+    The cart's previous holds on these products are replaced. Checking
+    ``availability()`` first is up to the caller, under the cart lock. Two
+    carts racing for the last units may both hold them where writers are not
+    serialized as on SQLite; ``take()`` still never oversells.
+    """
+    expires_at = (now or timezone.now()) + timedelta(seconds=timeout)
+    Reservation.objects.bulk_create(
+        [Reservation(cart=cart, product_id=product_id, quantity=quantity, expires_at=expires_at)
+         for product_id, quantity in quantities.items()],
+        update_conflicts=True,
+        unique_fields=['cart', 'product'],
+        update_fields=['quantity', 'expires_at'],
+    )
+    return expires_at
+
+
+def release(cart, product_ids=None):
+    """Drop the holds of ``cart``, or only those on ``product_ids``."""
+    reservations = Reservation.objects.filter(cart=cart)
+    if product_ids is not None:
+        reservations = reservations.filter(product_id__in=product_ids)
+    reservations.delete()
+
+
+def release_expired(batch_size=1000, now=None):
+    """Delete the reservations expired at ``now`` in batches and return how many there were."""
+    now = now or timezone.now()
+    released = 0
+    while True:
+        ids = list(Reservation.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return released
+        # A hold renewed since it was read is kept.
+        released += Reservation.objects.filter(id__in=ids, expires_at__lte=now).delete()[0]
+
+
+def take(quantities, kind=StockMovement.SALE, reference=''):
+    """
+    Remove ``quantities`` ({product_id: quantity}) from stock, or raise InventoryError.
+
+    Must run in a transaction. Every product is first taken from one random
+    counter shard, all in one conditional UPDATE, so concurrent sales of a
+    hot product mostly update different rows. When a picked shard runs
+    short, the shards of all the products are locked in (product, shard)
+    order and drained in turn instead. ``Product.stock_quantity`` catches up
+    once the transaction commits.
+    """
+    if not quantities:
+        return
+    shards = settings.INVENTORY_COUNTER_SHARDS
+    with transaction.atomic():
+        updated = StockCounter.objects.filter(reduce(or_, (
+            Q(product_id=product_id, shard=random.randrange(shards), on_hand__gte=quantity)
+            for product_id, quantity in quantities.items()
+        ))).update(on_hand=Case(
+            *[When(product_id=product_id, then=F('on_hand') - quantity) for product_id, quantity in quantities.items()],
+            default=F('on_hand'),
+            output_field=PositiveIntegerField(),
+        ))
+        short = updated != len(quantities)
+        if short:
+            transaction.set_rollback(True)
+    if short:
+        _take_spread(quantities)
+
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=product_id, quantity=-quantity, kind=kind, reference=reference)
+        for product_id, quantity in quantities.items()
+    ])
+    product_ids = list(quantities)
+    # After commit, so the product rows are not locked for the whole sale.
+    transaction.on_commit(lambda: refresh_stock_quantity(product_ids))
+
+
+def _take_spread(quantities):
+    seed_counters(list(quantities))
+    remaining = dict(quantities)
+    changed = []
+    counters = StockCounter.objects.select_for_update().filter(product_id__in=quantities).order_by('product_id', 'shard')
+    for counter in counters:
+        taken = min(remaining[counter.product_id], counter.on_hand)
+        if taken:
+            counter.on_hand -= taken
+            remaining[counter.product_id] -= taken
+            changed.append(counter)
+    shortages = {product_id: quantities[product_id] - left for product_id, left in remaining.items() if left}
+    if shortages:
+        raise InventoryError(shortages)
+    StockCounter.objects.bulk_update(changed, ['on_hand'])
+
+
+def set_stock(levels, kind=StockMovement.ADJUSTMENT, reference=''):
+    """
+    Set the on-hand stock of products, ``levels`` mapping ids to quantities.
+
+    For stock takes, imports and edits of ``Product.stock_quantity``, which
+    is left to the caller: the counters are locked and rewritten and the
+    differences recorded in the ledger. Negative levels count as zero.
+    """
+    levels = {product_id: max(quantity, 0) for product_id, quantity in levels.items()}
+    with transaction.atomic():
+        previous = _write_counters(levels)
+        StockMovement.objects.bulk_create([
+            StockMovement(product_id=product_id, quantity=quantity - previous[product_id], kind=kind,
+                          reference=reference)
+            for product_id, quantity in levels.items() if quantity != previous[product_id]
+        ])
+
+
+def _write_counters(levels):
+    # Returns the totals the counters held before.
+    shards = {}
+    counters = StockCounter.objects.select_for_update().filter(product_id__in=levels).order_by('product_id', 'shard')
+    for counter in counters:
+        shards.setdefault(counter.product_id, []).append(counter)
+    created = []
+    changed = []
+    previous = {}
+    for product_id, quantity in levels.items():
+        counters = shards.get(product_id, [])
+        previous[product_id] = sum(counter.on_hand for counter in counters)
+        if not counters:
+            created.extend(StockCounter(product_id=product_id, shard=shard, on_hand=on_hand)
+                           for shard, on_hand in enumerate(spread(quantity)))
+        elif previous[product_id] != quantity:
+            for counter, on_hand in zip(counters, spread(quantity, len(counters))):
+                counter.on_hand = on_hand
+            changed.extend(counters)
+    StockCounter.objects.bulk_create(created)
+    StockCounter.objects.bulk_update(changed, ['on_hand'])
+    return previous
+
+
+def refresh_stock_quantity(product_ids):
+    """Copy the counter totals into ``Product.stock_quantity``, the on-hand stock the catalogue reads."""
+    Product.objects.filter(id__in=product_ids).update(stock_quantity=Coalesce(on_hand(), F('stock_quantity')),
+                                                      updated_at=timezone.now())
+    bump_versions(product_ids)
+
+
+def rebuild_stock(batch_size=1000, dry_run=False):
+    """
+    Check the counters against the ledger and ``Product.stock_quantity`` against the counters, in id batches.
+
+    Products with neither counters nor movements, e.g. bulk-created ones,
+    start from their ``stock_quantity``; counters that disagree with the
+    ledger are rebuilt from it. Returns the ids that were out of date.
+    """
+    drifted = []
+    last_id = 0
+    movements = StockMovement.objects.filter(product=OuterRef('pk'))
+    while True:
+        rows = list(Product.objects.filter(id__gt=last_id).order_by('id').annotate(
+            on_hand=on_hand(), ledger=_sum(movements, 'quantity'),
+        ).values_list('id', 'stock_quantity', 'on_hand', 'ledger', named=True)[:batch_size])
+        if not rows:
+            return drifted
+        last_id = rows[-1].id
+        initial = {row.id: row.stock_quantity for row in rows if row.on_hand is None and row.ledger is None}
+        rebuilt = {row.id: row.ledger or 0 for row in rows
+                   if row.id not in initial and row.on_hand != (row.ledger or 0)}
+        ids = [row.id for row in rows
+               if row.id in initial or row.id in rebuilt or row.stock_quantity != row.on_hand]
+        drifted.extend(ids)
+        if ids and not dry_run:
+            with transaction.atomic():
+                set_stock(initial, kind=StockMovement.INITIAL)
+                _write_counters(rebuilt)
+                refresh_stock_quantity(ids)
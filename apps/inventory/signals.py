@@ -0,0 +1,23 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from apps.inventory.models import StockMovement
+from apps.inventory.services import refresh_stock_quantity, seed_counters, set_stock
+from apps.products.models import Product
+
+
+@receiver(post_save, sender=Product)
+def sync_stock(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # The counters follow stock_quantity when a save changes it from what was loaded.
+    if raw or (update_fields is not None and 'stock_quantity' not in update_fields):
+        return
+    if created:
+        set_stock({instance.pk: instance.stock_quantity}, kind=StockMovement.INITIAL)
+    elif instance.stock_quantity != getattr(instance, '_loaded_stock_quantity', None):
+        set_stock({instance.pk: instance.stock_quantity}, kind=StockMovement.ADJUSTMENT)
+    else:
+        # Unchanged, but possibly stale: the counters may have moved since it
+        # was loaded, so the row the save just wrote is copied back from them.
+        seed_counters([instance.pk])
+        refresh_stock_quantity([instance.pk])
+    instance._loaded_stock_quantity = instance.stock_quantity
@@ -0,0 +1,159 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from apps.inventory.models import Reservation, StockCounter
+from apps.inventory.services import InventoryError, availability, rebuild_stock, reserve, take
+from apps.orders.models import Cart
+from apps.products.models import Brand, Category, Product
+
+User = get_user_model()
+
+
+def on_hand(product):
+    return StockCounter.objects.filter(product=product).aggregate(total=Sum('on_hand'))['total']
+
+
+class StockLedgerTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Phones', slug='phones', description='-')
+        cls.brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        cls.product = Product.objects.create(name='Phone', slug='phone', description='-', category=cls.category,
+                                             brand=cls.brand, price='10.00', stock_quantity=8)
+
+    def test_product_save_sets_stock(self):
+        counters = StockCounter.objects.filter(product=self.product)
+        self.assertEqual(sorted(counters.values_list('on_hand', flat=True)), [1] * 8)
+        self.product.stock_quantity = 3
+        self.product.save()
+        self.product.name = 'Renamed'
+        self.product.save(update_fields=['name'])
+        self.assertEqual(on_hand(self.product), 3)
+        self.assertEqual(list(self.product.stock_movements.order_by('id').values_list('kind', 'quantity')),
+                         [('initial', 8), ('adjustment', -5)])
+
+    def test_stale_save_keeps_sales(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        with transaction.atomic():
+            take({self.product.id: 3}, reference='ORD-1')
+        stale.name = 'Renamed'
+        stale.save()
+        stale.refresh_from_db()
+        self.assertEqual((on_hand(self.product), stale.stock_quantity), (5, 5))
+        self.assertFalse(self.product.stock_movements.filter(kind='adjustment').exists())
+        # An edit of the loaded stock still sets it.
+        stale.stock_quantity = 7
+        stale.save()
+        self.assertEqual(on_hand(self.product), 7)
+        self.assertEqual(self.product.stock_movements.get(kind='adjustment').quantity, 2)
+
+    def test_rename_keeps_stock_without_counters(self):
+        product, = Product.objects.bulk_create([Product(
+            name='Bulk', slug='bulk', description='-', category=self.category, brand=self.brand, price='1.00',
+            stock_quantity=7,
+        )])
+        product = Product.objects.get(pk=product.pk)
+        product.name = 'Renamed'
+        product.save()
+        product.refresh_from_db()
+        self.assertEqual((product.stock_quantity, on_hand(product)), (7, 7))
+        self.assertEqual(list(product.stock_movements.values_list('kind', 'quantity')), [('initial', 7)])
+
+    def test_take_seeds_missing_counters(self):
+        product, = Product.objects.bulk_create([Product(
+            name='Bulk', slug='bulk', description='-', category=self.category, brand=self.brand, price='1.00',
+            stock_quantity=7,
+        )])
+        with transaction.atomic():
+            take({product.id: 3})
+        self.assertEqual(on_hand(product), 4)
+
+    def test_take_falls_back_to_all_shards(self):
+        # No single shard holds 5 units.
+        with transaction.atomic():
+            take({self.product.id: 5}, reference='ORD-1')
+        self.assertEqual(on_hand(self.product), 3)
+        self.assertEqual(self.product.stock_movements.get(kind='sale').quantity, -5)
+
+        with self.assertRaises(InventoryError) as raised, transaction.atomic():
+            take({self.product.id: 4})
+        self.assertEqual(raised.exception.shortages, {self.product.id: 3})
+        self.assertEqual(on_hand(self.product), 3)
+
+    def test_availability_counts_live_holds_of_other_carts(self):
+        first, second = (Cart.objects.create(user=User.objects.create_user(username=name)) for name in 'ab')
+        reserve(first, {self.product.id: 3}, timeout=60)
+        reserve(second, {self.product.id: 2}, timeout=-1)
+        with self.assertNumQueries(1):
+            levels = availability([self.product.id, 999], cart=second)
+        self.assertEqual(levels, {self.product.id: (True, 8, 3, 5)})
+        self.assertEqual(availability([self.product.id], cart=first)[self.product.id].available, 8)
+
+    def test_rebuild_stock(self):
+        bulk = Product.objects.bulk_create([Product(name='Bulk', slug='bulk', description='-', category=self.category,
+                                                    brand=self.brand, price='1.00', stock_quantity=4)])[0]
+        StockCounter.objects.filter(product=self.product, shard=0).update(on_hand=5)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_stock', '--verify', stdout=StringIO())
+
+        self.assertEqual(rebuild_stock(), [self.product.id, bulk.id])
+        self.assertEqual((on_hand(self.product), on_hand(bulk)), (8, 4))
+        self.assertEqual(bulk.stock_movements.get().quantity, 4)
+        self.assertEqual(rebuild_stock(dry_run=True), [])
+
+
+class ReservationAPITest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones', description='-')
+        brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        cls.product = Product.objects.create(name='Phone', slug='phone', description='-', category=category,
+                                             brand=brand, price='10.00', stock_quantity=5)
+        cls.first = User.objects.create_user(username='first')
+        cls.second = User.objects.create_user(username='second')
+
+    def add(self, user, quantity):
+        self.client.force_authenticate(user)
+        return self.client.post('/orders/cart/item/', {'product': self.product.id, 'quantity': quantity},
+                                format='json')
+
+    def test_holds_block_other_carts_until_they_expire(self):
+        self.assertEqual(self.add(self.first, 4).status_code, 201)
+        response = self.add(self.second, 2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['product'], ['Only 1 left in stock'])
+
+        Reservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.add(self.second, 2).status_code, 201)
+        out = StringIO()
+        call_command('expire_reservations', stdout=out)
+        self.assertIn('Released 1', out.getvalue())
+        self.assertEqual(list(Reservation.objects.values_list('cart__user', 'quantity')), [(self.second.id, 2)])
+
+    def test_product_without_counters_can_be_added(self):
+        self.product.stock_movements.all().delete()
+        StockCounter.objects.filter(product=self.product).delete()
+        response = self.add(self.first, 6)
+        self.assertEqual(response.data['product'], ['Only 5 left in stock'])
+        self.assertEqual(self.add(self.first, 5).status_code, 201)
+
+    def test_checkout_start_and_checkout_release_holds(self):
+        self.client.force_authenticate(self.first)
+        self.assertEqual(self.client.post('/orders/checkout/start/').status_code, 400)
+        self.add(self.first, 2)
+        response = self.client.post('/orders/checkout/start/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Reservation.objects.get().expires_at, response.data['expires_at'])
+
+        response = self.client.post('/orders/checkout/', {'shipping_address': 'Tashkent, Amir Temur 1',
+                                                          'phone': '+998901234567'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(Reservation.objects.exists())
+        self.assertEqual(on_hand(self.product), 3)
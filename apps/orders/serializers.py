@@ -1,10 +1,14 @@
-from decimal import Decimal
-
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from rest_framework import serializers
 
-from apps.orders.models import Cart, CartItem, Order
-from apps.products.serializers import ProductListSerializer
+from apps.orders.models import Cart, CartItem, Order, OrderItem
+from apps.orders.services import cart_line
+from apps.products import pricing
+from apps.products.models import Product
+from apps.products.serializers import InlineBrandSerializer, InlineCategorySerializer
+from apps.promotions.rules import Line, get_rules
+from core.fastpath import Method, RowSerializer, datetime_converter
 
 User = get_user_model()
 
@@ -15,8 +19,36 @@ class InlineUserSerializer(serializers.ModelSerializer):
         fields = ('id', 'username',)
 
 
+def cart_line_total(item):
+    return pricing.line_total(item.quantity, item.product.final_price)
+
+
+class InlineCartProductSerializer(serializers.ModelSerializer):
+    category = InlineCategorySerializer(read_only=True)
+    brand = InlineBrandSerializer(read_only=True)
+    final_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    in_stock = serializers.SerializerMethodField()
+    primary_image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = ('id', 'name', 'slug', 'price', 'discount_percentage', 'final_price', 'in_stock', 'primary_image',
+                  'category', 'brand')
+
+    def get_in_stock(self, obj):
+        return obj.stock_quantity > 0
+
+    # primary_images is a Prefetch(to_attr=...) of the primary images; the
+    # fallback covers plain instances.
+    def get_primary_image(self, obj):
+        images = getattr(obj, 'primary_images', None)
+        if images is None:
+            images = [image for image in obj.images.all() if image.is_primary]
+        return images[0].image_url if images else None
+
+
 class InlineCartItems(serializers.ModelSerializer):
-    product = ProductListSerializer(read_only=True)
+    product = InlineCartProductSerializer(read_only=True)
     sub_total = serializers.SerializerMethodField()
 
     class Meta:
@@ -24,28 +56,92 @@ class InlineCartItems(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_sub_total(self, obj):
-        return Decimal(obj.quantity) * Decimal(obj.product.price) * Decimal(1 - Decimal(obj.product.discount_percentage) / 100)
+        return cart_line_total(obj)
 
 
 class CartViewSerializer(serializers.ModelSerializer):
     user = InlineUserSerializer(read_only=True)
     items = InlineCartItems(many=True, read_only=True)
     items_count = serializers.SerializerMethodField()
+    promotions = serializers.SerializerMethodField()
+    coupon_discount = serializers.SerializerMethodField()
+    discount_amount = serializers.SerializerMethodField()
     total_amount = serializers.SerializerMethodField()
 
     class Meta:
         model = Cart
         fields = '__all__'
 
+    # All read the prefetched items, so none issues a query.
     def get_items_count(self, obj):
-        return obj.items.count()
+        return len(obj.items.all())
+
+    def get_promotions(self, obj):
+        return self.priced(obj).promotions
+
+    def get_coupon_discount(self, obj):
+        return self.priced(obj).coupon_discount
+
+    def get_discount_amount(self, obj):
+        return self.priced(obj).discount
 
     def get_total_amount(self, obj):
-        summ = Decimal(0)
-        for item in obj.items.all():
-            summ += Decimal(item.quantity) * Decimal(item.product.price) * Decimal(
-                1 - Decimal(item.product.discount_percentage) / 100)
-        return summ
+        return self.priced(obj).total
+
+    def priced(self, obj):
+        # Priced once per cart by the compiled promotions.
+        if getattr(self, '_priced', (None,))[0] != obj.pk:
+            lines = [cart_line(item.product, item.quantity) for item in obj.items.all()]
+            self._priced = (obj.pk, get_rules().evaluate(lines, obj.coupon_code))
+        return self._priced[1]
+
+
+# Same output as InlineCartItems from values() rows of cart items annotated
+# with the product's primary_image.
+cart_line_rows = RowSerializer(InlineCartItems, methods={
+    'sub_total': Method(pricing.line_total, 'quantity', 'product__final_price'),
+    'product.in_stock': Method(lambda stock: stock > 0, 'product__stock_quantity'),
+    'product.primary_image': 'primary_image',
+})
+_datetime = datetime_converter(serializers.DateTimeField())
+
+
+def cart_data(cart, items, rules):
+    """
+    CartViewSerializer output for ``cart`` (with its user loaded) and ``cart_line_rows.values()`` of its items.
+
+    ``rules`` is the RuleIndex pricing the cart, from ``get_rules()``.
+    """
+    lines = cart_line_rows.to_representation(items)
+    priced = rules.evaluate([
+        Line(line['product']['id'], line['product']['category']['id'], line['product']['brand']['id'],
+             line['quantity'], line['sub_total'])
+        for line in lines
+    ], cart.coupon_code)
+    tz = timezone.get_current_timezone()
+    return {
+        'id': cart.id,
+        'user': {'id': cart.user.id, 'username': cart.user.username},
+        'items': lines,
+        'items_count': len(lines),
+        'promotions': priced.promotions,
+        'coupon_discount': priced.coupon_discount,
+        'discount_amount': priced.discount,
+        'total_amount': priced.total,
+        'created_at': _datetime(cart.created_at, tz),
+        'updated_at': _datetime(cart.updated_at, tz),
+        'coupon_code': cart.coupon_code,
+    }
+
+
+class CartCouponSerializer(serializers.Serializer):
+    code = serializers.CharField(max_length=50)
+
+    def validate_code(self, code):
+        code = code.strip().upper()
+        if code not in get_rules().coupons:
+            raise serializers.ValidationError('Invalid or expired coupon')
+        return code
 
 
 class CartItemCreateSerializer(serializers.ModelSerializer):
@@ -59,9 +155,7 @@ class CartItemCreateSerializer(serializers.ModelSerializer):
     def validate_product(self, value):
         if not value.is_active:
             raise serializers.ValidationError('Product is bot exists')
-
-        if value.stock_quantity <= 0:
-            raise serializers.ValidationError('This product no in stock')
+        # Stock, after other carts' reservations, is checked by update_cart_items().
         return value
 
     def validate_quantity(self, value):
@@ -70,6 +164,28 @@ class CartItemCreateSerializer(serializers.ModelSerializer):
         return value
 
 
+class CartItemBulkEntrySerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class CartItemBulkSerializer(serializers.Serializer):
+    MODE_CHOICES = ['add', 'set']
+
+    items = CartItemBulkEntrySerializer(many=True, allow_empty=False, max_length=100)
+    mode = serializers.ChoiceField(choices=MODE_CHOICES, default='add')
+
+    def validate(self, attrs):
+        quantities = {}
+        for entry in attrs['items']:
+            product = entry['product']
+            if product in quantities and attrs['mode'] == 'set':
+                raise serializers.ValidationError(f'Product {product} is listed more than once')
+            quantities[product] = quantities.get(product, 0) + entry['quantity']
+        attrs['quantities'] = quantities
+        return attrs
+
+
 class CartItemUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
@@ -81,21 +197,22 @@ class CartItemUpdateSerializer(serializers.ModelSerializer):
             'cart': {'read_only': True},
         }
 
-        def validate_quantity(self, quantity):
-            if quantity <= 0:
-                raise serializers.ValidationError('Quantity must be positive')
-            return quantity
+    # Stock is checked by update_cart_items(), which also renews the line's reservation.
+    def validate_quantity(self, quantity):
+        if quantity <= 0:
+            raise serializers.ValidationError('Quantity must be positive')
+        return quantity
+
 
-        def validate(self, attrs):
-            product = attrs.get('product')
-            quantity = attrs.get('quantity')
-            if product.stock_quantity < quantity:
-                raise serializers.ValidationError('This product no in stock')
-            return attrs
+class InlineOrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderItem
+        fields = ('id', 'product', 'quantity', 'price', 'discount_percentage', 'discount_amount')
 
 
 class OrderCreateSerializer(serializers.ModelSerializer):
     user = InlineUserSerializer(read_only=True)
+    items = InlineOrderItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
@@ -106,25 +223,24 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             'order_number': {'read_only': True},
             'status': {'read_only': True},
             'total_amount': {'read_only': True},
+            'discount_amount': {'read_only': True},
+            'coupon_code': {'read_only': True},
             'created_at': {'read_only': True},
             'updated_at': {'read_only': True},
         }
 
-        def validate_phone(self, phone):
-            if not phone.startswith('+998') and not (6 < len(phone) < 15) and not phone[1:].isdigit():
-                raise serializers.ValidationError('Invalid phone number')
-            return phone
-
-        def validate_shipping_address(self, address):
-            if len(address.strip()) < 10:
-                raise serializers.ValidationError('Address must have at least 10 characters')
-            return address
-
-
-
-
-
-
+    def validate_phone(self, phone):
+        if not (phone.startswith('+998') and phone[1:].isdigit() and 6 < len(phone) < 15):
+            raise serializers.ValidationError('Invalid phone number')
+        return phone
 
+    def validate_shipping_address(self, address):
+        if len(address.strip()) < 10:
+            raise serializers.ValidationError('Address must have at least 10 characters')
+        return address
 
 
+class OrderListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Order
+        fields = ('id', 'order_number', 'status', 'total_amount', 'created_at')
@@ -0,0 +1,178 @@
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+from apps.inventory import services as inventory
+from apps.orders.models import Cart, CartItem, Order, OrderItem
+from apps.products import pricing, sales
+from apps.products.models import Product
+from apps.promotions import rules as promotions
+
+
+class CheckoutError(Exception):
+    pass
+
+
+def cart_line(product, quantity):
+    """The promotions' view of ``quantity`` units of ``product``."""
+    return promotions.Line(product.id, product.category_id, product.brand_id, quantity,
+                           pricing.line_total(quantity, product.final_price))
+
+
+def order_number(order_id):
+    return f'ORD-{order_id:016d}'
+
+
+def checkout(user, shipping_address, phone, notes=None):
+    """
+    Turn the user's cart into an order in a single transaction.
+
+    Stock is checked for the whole cart in one query, counting the other
+    carts' reservations, then taken from the sharded stock counters by
+    ``apps.inventory.services.take()``, which never oversells: if anything
+    sold out in between the whole transaction is rolled back. Product rows
+    are not locked, so checkouts of the same product do not queue on them.
+    The total is priced by the compiled promotions, with the cart's coupon,
+    whose use is counted here.
+    """
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update().filter(user=user).first()
+        items = list(CartItem.objects.filter(cart=cart).order_by('product_id')) if cart else []
+        if not items:
+            raise CheckoutError('Cart is empty')
+
+        quantities = {item.product_id: item.quantity for item in items}
+        if any(quantity <= 0 for quantity in quantities.values()):
+            raise CheckoutError('Cart contains an invalid quantity')
+
+        products = Product.objects.only(
+            'id', 'name', 'category_id', 'brand_id', 'price', 'discount_percentage', 'final_price', 'is_active',
+        ).in_bulk(list(quantities))
+        unavailable = [product_id for product_id in quantities
+                       if product_id not in products or not products[product_id].is_active]
+        if unavailable:
+            raise CheckoutError(f'Products are no longer available: {unavailable}')
+        levels = inventory.availability(quantities, cart=cart)
+        _check_stock(products, quantities, [product_id for product_id, quantity in quantities.items()
+                                            if levels[product_id].available < quantity])
+
+        lines = [cart_line(products[item.product_id], item.quantity) for item in items]
+        priced = promotions.get_rules().evaluate(lines, cart.coupon_code)
+        if priced.coupon is not None and not promotions.redeem(priced.coupon):
+            raise CheckoutError(f'Coupon {priced.coupon.code} is no longer available')
+        # The placeholder only has to be unique until the id-based number
+        # replaces it in the same transaction.
+        order = Order.objects.create(
+            user=user,
+            order_number=uuid.uuid4().hex[:20],
+            total_amount=priced.total,
+            discount_amount=priced.discount,
+            coupon_code=priced.coupon.code if priced.coupon else '',
+            shipping_address=shipping_address,
+            phone=phone,
+            notes=notes,
+        )
+        order.order_number = order_number(order.id)
+        Order.objects.filter(pk=order.pk).update(order_number=order.order_number)
+        try:
+            inventory.take(quantities, reference=order.order_number)
+        except inventory.InventoryError as exc:
+            _check_stock(products, quantities, list(exc.shortages))
+
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=item.product_id,
+                quantity=item.quantity,
+                price=products[item.product_id].price,
+                discount_percentage=products[item.product_id].discount_percentage,
+                discount_amount=discount,
+            )
+            for item, discount in zip(items, priced.line_discounts)
+        ])
+        CartItem.objects.filter(cart=cart).delete()
+        if cart.coupon_code:
+            Cart.objects.filter(pk=cart.pk).update(coupon_code='')
+        inventory.release(cart)
+        transaction.on_commit(lambda: sales.add_sales(quantities))
+    return order
+
+
+def _check_stock(products, quantities, sold_out):
+    if sold_out:
+        names = [products[product_id].name for product_id in sold_out]
+        raise CheckoutError(f'Not enough stock for: {", ".join(names)}')
+
+
+def start_checkout(user):
+    """
+    Hold the stock of every line of the user's cart while they pay.
+
+    The holds last ``INVENTORY_CHECKOUT_HOLD_TIMEOUT`` seconds. Returns
+    their expiry, or raises CheckoutError when something is out of stock.
+    """
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update().filter(user=user).first()
+        quantities = dict(CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity')) if cart else {}
+        if not quantities:
+            raise CheckoutError('Cart is empty')
+        levels = inventory.availability(quantities, cart=cart)
+        unavailable = [product_id for product_id in quantities
+                       if product_id not in levels or not levels[product_id].is_active]
+        if unavailable:
+            raise CheckoutError(f'Products are no longer available: {unavailable}')
+        sold_out = [product_id for product_id, quantity in quantities.items()
+                    if levels[product_id].available < quantity]
+        if sold_out:
+            names = Product.objects.filter(id__in=sold_out).order_by('id').values_list('name', flat=True)
+            raise CheckoutError(f'Not enough stock for: {", ".join(names)}')
+        return inventory.reserve(cart, quantities, settings.INVENTORY_CHECKOUT_HOLD_TIMEOUT)
+
+
+class CartError(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def update_cart_items(user, quantities, mode='add'):
+    """
+    Add to (``mode='add'``) or overwrite (``mode='set'``) many cart lines at once.
+
+    ``quantities`` maps product ids to quantities. The cart row is locked so
+    concurrent mutations of the same cart queue instead of losing updates;
+    stock left after other carts' reservations and the existing lines are
+    read with one query each, and all lines and their reservations are
+    written with one upsert each, whatever the number of products.
+    Returns ``{product_id: new quantity}``.
+    """
+    with transaction.atomic():
+        cart, _ = Cart.objects.select_for_update().get_or_create(user=user)
+        levels = inventory.availability(list(quantities), cart=cart)
+        existing = dict(
+            CartItem.objects.filter(cart=cart, product_id__in=quantities).values_list('product_id', 'quantity')
+        )
+
+        result = {}
+        errors = {}
+        for product_id, quantity in quantities.items():
+            if mode == 'add':
+                quantity += existing.get(product_id, 0)
+            level = levels.get(product_id)
+            if level is None or not level.is_active:
+                errors[product_id] = 'Product does not exist'
+            elif level.available < quantity:
+                errors[product_id] = f'Only {max(level.available, 0)} left in stock'
+            result[product_id] = quantity
+        if errors:
+            raise CartError(errors)
+
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product_id=product_id, quantity=quantity) for product_id, quantity in result.items()],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity'],
+        )
+        inventory.reserve(cart, result, settings.INVENTORY_CART_HOLD_TIMEOUT)
+    return result
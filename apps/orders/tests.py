@@ -1,3 +1,279 @@
-from django.test import TestCase
+import threading
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from apps.inventory.models import Reservation, StockMovement
+from apps.orders.models import Cart, CartItem, Order, OrderItem
+from apps.orders.serializers import CartViewSerializer
+from apps.orders.services import CheckoutError, checkout
+from apps.products.models import Brand, Category, Product, ProductImage
+from apps.promotions.rules import get_rules
+
+User = get_user_model()
+
+
+class OrderHistoryAPITest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer')
+        other = User.objects.create_user(username='other')
+        for i in range(3):
+            Order.objects.create(user=cls.user, order_number=f'A{i}', total_amount='10.00',
+                                 shipping_address='Somewhere 1', phone='+998900000000')
+        Order.objects.create(user=other, order_number='B0', total_amount='10.00',
+                             shipping_address='Somewhere 1', phone='+998900000000')
+
+    def test_history_lists_own_orders(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/orders/history/', {'page_size': 2})
+        self.assertEqual([row['order_number'] for row in response.data['results']], ['A2', 'A1'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['order_number'] for row in response.data['results']], ['A0'])
+        self.assertIsNone(response.data['next'])
+
+    def test_history_requires_authentication(self):
+        self.assertEqual(self.client.get('/orders/history/').status_code, 403)
+
+
+class CheckoutTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones', description='-')
+        brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        cls.phone = Product.objects.create(name='Phone', slug='phone', description='-', category=category,
+                                           brand=brand, price='99.99', discount_percentage=15, stock_quantity=5)
+        cls.case = Product.objects.create(name='Case', slug='case', description='-', category=category,
+                                          brand=brand, price='10.00', stock_quantity=1)
+        cls.user = User.objects.create_user(username='buyer')
+        cls.cart = Cart.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def checkout(self):
+        return self.client.post('/orders/checkout/', {'shipping_address': 'Tashkent, Amir Temur 1',
+                                                      'phone': '+998901234567'}, format='json')
+
+    def test_checkout_creates_order(self):
+        CartItem.objects.create(cart=self.cart, product=self.phone, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.case, quantity=1)
+        # Product.stock_quantity is refreshed once the order is committed.
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.checkout()
+        self.assertEqual(response.status_code, 201)
+
+        order = Order.objects.get()
+        self.assertEqual(response.data['order_number'], f'ORD-{order.id:016d}')
+        self.assertEqual(order.total_amount, Decimal('179.98'))
+        self.assertEqual(sorted(order.items.values_list('product__slug', 'quantity', 'price', 'discount_percentage')),
+                         [('case', 1, Decimal('10.00'), 0), ('phone', 2, Decimal('99.99'), 15)])
+        self.assertFalse(self.cart.items.exists())
+        self.phone.refresh_from_db()
+        self.case.refresh_from_db()
+        self.assertEqual((self.phone.stock_quantity, self.case.stock_quantity), (3, 0))
+        self.assertEqual((self.phone.units_sold, self.case.units_sold), (2, 1))
+        self.assertEqual(sorted(StockMovement.objects.filter(kind='sale').values_list('product__slug', 'quantity',
+                                                                                      'reference')),
+                         [('case', -1, order.order_number), ('phone', -2, order.order_number)])
+
+    def test_insufficient_stock_rolls_back(self):
+        CartItem.objects.create(cart=self.cart, product=self.phone, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.case, quantity=2)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Case', response.data['detail'])
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock_quantity, 5)
+        self.assertEqual(self.cart.items.count(), 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_empty_cart(self):
+        self.assertEqual(self.checkout().status_code, 400)
+
+    def test_invalid_address(self):
+        CartItem.objects.create(cart=self.cart, product=self.phone, quantity=1)
+        response = self.client.post('/orders/checkout/', {'shipping_address': 'short', 'phone': '+998901234567'},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('shipping_address', response.data)
+
+    def test_invalid_phone(self):
+        CartItem.objects.create(cart=self.cart, product=self.phone, quantity=1)
+        for phone in ('12345678abc', '+998901234abc', '+9989012345678901'):
+            with self.subTest(phone=phone):
+                response = self.client.post('/orders/checkout/', {'shipping_address': 'Tashkent, Amir Temur 1',
+                                                                  'phone': phone}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('phone', response.data)
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    buyers = 200
+    stock = 50
+
+    def test_no_overselling(self):
+        category = Category.objects.create(name='Phones', slug='phones', description='-')
+        brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        product = Product.objects.create(name='Phone', slug='phone', description='-', category=category,
+                                         brand=brand, price='10.00', stock_quantity=self.stock)
+        users = User.objects.bulk_create([User(username=f'buyer{i}') for i in range(self.buyers)])
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=1) for cart in carts])
+
+        start = threading.Barrier(self.buyers)
+        results = []
+
+        def buy(user):
+            start.wait()
+            try:
+                checkout(user, 'Tashkent, Amir Temur 1', '+998901234567')
+                results.append('ok')
+            except CheckoutError:
+                results.append('sold out')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(results.count('ok'), self.stock)
+        self.assertEqual(results.count('sold out'), self.buyers - self.stock)
+        self.assertEqual(product.stock_quantity, 0)
+        self.assertEqual(OrderItem.objects.count(), self.stock)
+        self.assertEqual(Order.objects.values('order_number').distinct().count(), self.stock)
+
+
+class CartRetrieveAPITest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones', description='-')
+        brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        cls.user = User.objects.create_user(username='buyer')
+        cart = Cart.objects.create(user=cls.user)
+        for i in range(50):
+            product = Product.objects.create(name=f'P{i}', slug=f'p{i}', description='-', category=category,
+                                             brand=brand, price='10.00', discount_percentage=10, stock_quantity=i)
+            ProductImage.objects.create(product=product, image_url=f'https://example.com/{i}.png', is_primary=True)
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+
+    def test_cart_query_count_is_fixed(self):
+        self.client.force_authenticate(self.user)
+        # Compiled once per process, not per request.
+        get_rules()
+        with self.assertNumQueries(2):
+            response = self.client.get('/orders/cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items_count'], 50)
+        self.assertEqual(response.data['total_amount'], Decimal('900'))
+        first = response.data['items'][0]
+        self.assertEqual(first['sub_total'], Decimal('18'))
+        self.assertEqual(first['product']['primary_image'], 'https://example.com/0.png')
+        self.assertEqual(first['product']['category']['slug'], 'phones')
+        self.assertFalse(first['product']['in_stock'])
+
+    async def test_async_view_matches(self):
+        self.client.force_authenticate(self.user)
+        expected = await sync_to_async(self.client.get)('/orders/cart/')
+        await self.async_client.aforce_login(self.user)
+        with override_settings(ROOT_URLCONF='core.asgi_urls'):
+            response = await self.async_client.get('/orders/cart/')
+        self.assertEqual(response.content, expected.content)
+
+    def test_matches_serializer_output(self):
+        cart = Cart.objects.get(user=self.user)
+        product = Product.objects.create(name='Odd', slug='odd', description='-', category=Category.objects.get(),
+                                         brand=Brand.objects.get(), price='19.99', discount_percentage=15,
+                                         stock_quantity=3)
+        CartItem.objects.create(cart=cart, product=product, quantity=3)
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/orders/cart/')
+        cart.refresh_from_db()
+        self.assertEqual(response.content, JSONRenderer().render(CartViewSerializer(cart).data))
+        # 19.99 less 15% is 16.9915, charged as 16.99 a unit.
+        line = next(line for line in response.data['items'] if line['product']['id'] == product.id)
+        self.assertEqual((line['product']['final_price'], line['sub_total']), ('16.99', Decimal('50.97')))
+        self.assertEqual(response.data['total_amount'], Decimal('950.97'))
+
+
+class CartBulkAPITest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones', description='-')
+        brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        cls.products = [
+            Product.objects.create(name=f'P{i}', slug=f'p{i}', description='-', category=category, brand=brand,
+                                   price='10.00', stock_quantity=5)
+            for i in range(30)
+        ]
+        cls.user = User.objects.create_user(username='buyer')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def post(self, items, mode='add'):
+        return self.client.post('/orders/cart/items/bulk/', {'items': items, 'mode': mode}, format='json')
+
+    def test_bulk_add_is_constant_query(self):
+        items = [{'product': product.id, 'quantity': 2} for product in self.products]
+        # Savepoints and the reservations upsert included; the first call also creates the cart.
+        with self.assertNumQueries(10):
+            response = self.post(items)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(7):
+            self.post(items)
+        self.assertEqual(CartItem.objects.filter(cart__user=self.user).count(), 30)
+        self.assertEqual(CartItem.objects.get(product=self.products[0]).quantity, 4)
+        self.assertEqual(self.post(items).status_code, 400)
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        response = self.post([{'product': self.products[0].id, 'quantity': 1}])
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_set_mode_and_stock_validation(self):
+        first = self.products[0].id
+        self.post([{'product': first, 'quantity': 4}])
+        self.assertEqual(self.post([{'product': first, 'quantity': 1}], mode='set').data['items'],
+                         [{'product': first, 'quantity': 1}])
+
+        response = self.post([{'product': first, 'quantity': 5}, {'product': 999, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data['items']), {first, 999})
+        self.assertEqual(CartItem.objects.get(product_id=first).quantity, 1)
+
+    def test_single_item_endpoint_accumulates(self):
+        product = self.products[0]
+        for _ in range(2):
+            response = self.client.post('/orders/cart/item/', {'product': product.id, 'quantity': 2}, format='json')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['quantity'], 4)
+        response = self.client.post('/orders/cart/item/', {'product': product.id, 'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_update_and_delete_keep_reservations_in_step(self):
+        product = self.products[0]
+        self.post([{'product': product.id, 'quantity': 2}])
+        item = CartItem.objects.get(product=product)
+
+        self.assertEqual(self.client.patch(f'/orders/cart/item/{item.id}', {'quantity': 0}, format='json').status_code,
+                         400)
+        self.assertEqual(self.client.patch(f'/orders/cart/item/{item.id}', {'quantity': 6}, format='json').status_code,
+                         400)
+        response = self.client.patch(f'/orders/cart/item/{item.id}', {'quantity': 5}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['quantity'], 5)
+        self.assertEqual(Reservation.objects.get(product=product).quantity, 5)
+
+        self.assertEqual(self.client.delete(f'/orders/cart/item/{item.id}/delete/').status_code, 204)
+        self.assertFalse(Reservation.objects.exists())
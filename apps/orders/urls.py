@@ -6,8 +6,12 @@ app_name = 'orders'
 
 urlpatterns = [
     path('cart/', views.CartRetrieveAPIView.as_view()),
+    path('cart/coupon/', views.CartCouponAPIView.as_view()),
     path('cart/item/', views.CartItemCreateAPIView.as_view()),
+    path('cart/items/bulk/', views.CartItemBulkAPIView.as_view()),
     path('cart/item/<int:pk>', views.CartItemUpdateAPIView.as_view()),
     path('cart/item/<int:pk>/delete/', views.CartItemDeleteAPIView.as_view()),
     path('checkout/', views.OrderCreateAPIView.as_view()),
+    path('checkout/start/', views.CheckoutStartAPIView.as_view()),
+    path('history/', views.OrderListAPIView.as_view()),
 ]
\ No newline at end of file
@@ -1,25 +1,72 @@
+import asyncio
+
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import GenericAPIView
-from rest_framework.mixins import RetrieveModelMixin, CreateModelMixin, UpdateModelMixin, DestroyModelMixin
+from rest_framework.mixins import RetrieveModelMixin, CreateModelMixin, UpdateModelMixin, DestroyModelMixin, \
+    ListModelMixin
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from apps.orders.models import Cart, CartItem
-from apps.orders.serializers import CartViewSerializer, CartItemCreateSerializer
-from apps.products.models import Product
+from apps.orders.models import Cart, CartItem, Order
+from apps.inventory.services import release
+from apps.orders.serializers import CartViewSerializer, CartCouponSerializer, CartItemCreateSerializer, \
+    CartItemBulkSerializer, CartItemUpdateSerializer, OrderCreateSerializer, OrderListSerializer, cart_data, \
+    cart_line_rows
+from apps.orders.services import CartError, CheckoutError, checkout, start_checkout, update_cart_items
+from apps.products.models import Product, primary_image_url
+from apps.promotions.rules import aget_rules, get_rules
+from core.pagination import KeysetPagination
+from core.views import AsyncAPIView
 
 
 class CartRetrieveAPIView(GenericAPIView, RetrieveModelMixin):
     serializer_class = CartViewSerializer
 
+    # Renders serializer_class's output through the compiled cart_data() path.
     def get(self, request, *args, **kwargs):
-        obj = self.get_object()
-        serializer = self.serializer_class(obj)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        cart = self.get_object()
+        return Response(cart_data(cart, self.get_items(), get_rules()), status=status.HTTP_200_OK)
 
     def get_object(self):
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
+        cart, created = Cart.objects.select_related('user').get_or_create(user=self.request.user)
         return cart
 
+    def get_items(self):
+        return cart_line_rows.values(CartItem.objects.filter(cart__user=self.request.user).annotate(
+            primary_image=primary_image_url('product'),
+        ).order_by('added_at', 'id'))
+
+
+class AsyncCartRetrieveAPIView(AsyncAPIView, CartRetrieveAPIView):
+    async def get(self, request, *args, **kwargs):
+        # Items are looked up by user, so they load alongside the cart.
+        (cart, created), items, rules = await asyncio.gather(
+            Cart.objects.select_related('user').aget_or_create(user=request.user),
+            self.aget_items(),
+            aget_rules(),
+        )
+        return Response(cart_data(cart, items, rules), status=status.HTTP_200_OK)
+
+    async def aget_items(self):
+        return [row async for row in self.get_items()]
+
+
+class CartCouponAPIView(GenericAPIView):
+    serializer_class = CartCouponSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        code = serializer.validated_data['code']
+        Cart.objects.update_or_create(user=request.user, defaults={'coupon_code': code})
+        return Response(data={'code': code}, status=status.HTTP_200_OK)
+
+    def delete(self, request, *args, **kwargs):
+        Cart.objects.filter(user=request.user).update(coupon_code='')
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class CartItemCreateAPIView(GenericAPIView, CreateModelMixin):
     serializer_class = CartItemCreateSerializer
@@ -33,21 +80,33 @@ class CartItemCreateAPIView(GenericAPIView, CreateModelMixin):
         )
 
     def perform_create(self, serializer):
-        user = self.request.user
-        cart, _ = Cart.objects.get_or_create(user=user)
+        product = serializer.validated_data['product']
+        quantity = serializer.validated_data.get('quantity', 1)
+        try:
+            update_cart_items(self.request.user, {product.id: quantity})
+        except CartError as exc:
+            raise ValidationError({'product': list(exc.errors.values())})
+        serializer.instance = CartItem.objects.get(cart__user=self.request.user, product=product)
 
-        product_id = self.request.data.get('product')
-        quantity = int(self.request.data.get('quantity'))
-        item = cart.items.filter(product_id=product_id).first()
-        if item:
-            item.quantity += quantity
-            item.save()
-        else:
-            serializer.save(cart=cart)
+
+class CartItemBulkAPIView(GenericAPIView):
+    serializer_class = CartItemBulkSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            quantities = update_cart_items(request.user, serializer.validated_data['quantities'],
+                                           mode=serializer.validated_data['mode'])
+        except CartError as exc:
+            return Response(data={'items': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+        items = [{'product': product, 'quantity': quantity} for product, quantity in quantities.items()]
+        return Response(data={'items': items}, status=status.HTTP_200_OK)
 
 
 class CartItemUpdateAPIView(GenericAPIView, UpdateModelMixin):
-    serializer_class = CartItemCreateSerializer
+    serializer_class = CartItemUpdateSerializer
 
     def get_queryset(self):
         return self.request.user.cart.items.all()
@@ -59,7 +118,13 @@ class CartItemUpdateAPIView(GenericAPIView, UpdateModelMixin):
         instance = self.get_object()
         serializer = self.get_serializer(instance,data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save(cart=instance.cart)
+        if 'quantity' in serializer.validated_data:
+            try:
+                update_cart_items(request.user, {instance.product_id: serializer.validated_data['quantity']},
+                                  mode='set')
+            except CartError as exc:
+                raise ValidationError({'quantity': list(exc.errors.values())})
+            instance.refresh_from_db()
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -73,28 +138,43 @@ class CartItemDeleteAPIView(GenericAPIView, DestroyModelMixin):
     def destroy(self, request, *args, **kwargs):
         item = self.get_object()
         item.delete()
+        release(item.cart_id, [item.product_id])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class OrderCreateAPIView(GenericAPIView, CreateModelMixin):
+    serializer_class = OrderCreateSerializer
+    permission_classes = [IsAuthenticated]
+
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        cart = self.request.user.cart
-        if not cart.items.all().exists():
-            return Response({'detail': 'No items available'}, status=status.HTTP_404_NOT_FOUND)
-
-        if not all(item.quantity for item in cart.items.all()):
-            return Response({'detail': 'No items available'}, status=status.HTTP_404_NOT_FOUND)
-
-
-
-
+        try:
+            serializer.instance = checkout(self.request.user, **serializer.validated_data)
+        except CheckoutError as exc:
+            raise ValidationError({'detail': str(exc)})
 
 
+class CheckoutStartAPIView(GenericAPIView):
+    permission_classes = [IsAuthenticated]
 
+    # Holds the cart's stock for the payment step; checkout/ then places the order.
+    def post(self, request, *args, **kwargs):
+        try:
+            expires_at = start_checkout(request.user)
+        except CheckoutError as exc:
+            return Response(data={'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data={'expires_at': expires_at}, status=status.HTTP_200_OK)
 
 
+class OrderListAPIView(GenericAPIView, ListModelMixin):
+    serializer_class = OrderListSerializer
+    pagination_class = KeysetPagination
+    permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        return Order.objects.filter(user=self.request.user)
 
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
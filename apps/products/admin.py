@@ -1,12 +1,13 @@
 from django.contrib import admin
-from .models import Category, Brand, Product, ProductImage
+from .models import Category, Brand, Product, ProductImage, SlugHistory
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'parent', 'is_active', 'created_at')
+    list_display = ('id', 'name', 'parent', 'path', 'is_active', 'created_at')
     list_filter = ('is_active',)
     search_fields = ('name', 'slug')
+    ordering = ('path',)
     prepopulated_fields = {'slug': ('name',)}
 
 
@@ -27,6 +28,7 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ('is_active', 'is_featured', 'category', 'brand')
     search_fields = ('name', 'slug', 'description')
     prepopulated_fields = {'slug': ('name',)}
+    readonly_fields = Product.RATING_FIELDS
     inlines = [ProductImageInline]
 
 
@@ -34,3 +36,10 @@ class ProductAdmin(admin.ModelAdmin):
 class ProductImageAdmin(admin.ModelAdmin):
     list_display = ('id', 'product', 'is_primary', 'order')
     list_filter = ('is_primary',)
+
+
+@admin.register(SlugHistory)
+class SlugHistoryAdmin(admin.ModelAdmin):
+    list_display = ('slug', 'product', 'created_at')
+    search_fields = ('slug',)
+    raw_id_fields = ('product',)
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+LOCK_TIMEOUT = 5
+LOCK_POLL_INTERVAL = 0.02
+
+# In-process single-flight: one lock stripe per key hash, shared by all threads.
+_stripes = [threading.Lock() for _ in range(64)]
+
+
+def get_cache():
+    return caches[getattr(settings, 'PRODUCT_CACHE_ALIAS', 'default')]
+
+
+def version_key(product_id):
+    return f'product:{product_id}:version'
+
+
+def variant(fields=None, expand=None):
+    """Short digest naming a sparse (``?fields=``/``?expand=``) response; '' for the full one."""
+    if fields is None:
+        return ''
+    signature = f'{",".join(sorted(fields))};{",".join(sorted(expand or ()))}'
+    return hashlib.md5(signature.encode(), usedforsecurity=False).hexdigest()[:16]
+
+
+def detail_key(product_id, version, fields=None, expand=None):
+    key = f'product:{product_id}:detail:{version}'
+    if fields is not None:
+        key = f'{key}:{variant(fields, expand)}'
+    return key
+
+
+def get_version(product_id):
+    """
+    Return the product's current cache version.
+
+    Versions are nanosecond timestamps rather than counters starting at 1, so a
+    version key that was evicted can never come back with a value that matches
+    a payload cached under an older version.
+    """
+    cache = get_cache()
+    key = version_key(product_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+async def aget_version(product_id):
+    """Async get_version()."""
+    cache = get_cache()
+    key = version_key(product_id)
+    version = await cache.aget(key)
+    if version is None:
+        version = time.time_ns()
+        if not await cache.aadd(key, version, None):
+            version = await cache.aget(key, version)
+    return version
+
+
+def bump_versions(product_ids):
+    product_ids = set(product_ids)
+    _set_versions(product_ids)
+    # A reader may rebuild from pre-commit data under the new version while
+    # the transaction is still open, so bump once more after it commits.
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _set_versions(product_ids))
+
+
+def _set_versions(product_ids):
+    version = time.time_ns()
+    get_cache().set_many({version_key(product_id): version for product_id in product_ids}, None)
+
+
+def etag(product_id, version, fields=None, expand=None):
+    if fields is None:
+        return f'"{product_id}-{version}"'
+    return f'"{product_id}-{version}-{variant(fields, expand)}"'
+
+
+def get_or_build(key, build, timeout=None):
+    """
+    Return the cached value for ``key``, building it at most once at a time.
+
+    Threads of this process queue on a striped lock; other processes see the
+    ``<key>:lock`` entry and poll for the result instead of rebuilding it.
+    """
+    cache = get_cache()
+    if timeout is None:
+        timeout = getattr(settings, 'PRODUCT_DETAIL_CACHE_TIMEOUT', 300)
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    with _stripes[zlib.crc32(key.encode()) % len(_stripes)]:
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+        lock_key = f'{key}:lock'
+        if cache.add(lock_key, 1, LOCK_TIMEOUT):
+            try:
+                value = build()
+                cache.set(key, value, timeout)
+            finally:
+                cache.delete(lock_key)
+            return value
+
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            value = cache.get(key)
+            if value is not None:
+                return value
+        return build()
+
+
+async def aget_or_build(key, build, timeout=None):
+    """
+    Async get_or_build(), ``build`` being a coroutine function.
+
+    Concurrent requests of this process rely on the ``<key>:lock`` entry like
+    other processes do, polling without blocking the event loop.
+    """
+    cache = get_cache()
+    if timeout is None:
+        timeout = getattr(settings, 'PRODUCT_DETAIL_CACHE_TIMEOUT', 300)
+    value = await cache.aget(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:lock'
+    if await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = await build()
+            await cache.aset(key, value, timeout)
+        finally:
+            await cache.adelete(lock_key)
+        return value
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        value = await cache.aget(key)
+        if value is not None:
+            return value
+    return await build()
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.db import transaction
+
+from apps.products.cache import get_cache, get_or_build
+from apps.products.models import Category
+from core.renderers import JSONRenderer
+
+TREE_KEY = 'category:tree'
+
+
+def build_tree():
+    """
+    Return the active category tree as nested dicts, children sorted by name.
+
+    Two queries whatever the depth: the categories ordered by path, so parents
+    always come before their children, and the grouped subtree product counts.
+    A category below an inactive one is left out with its parent.
+    """
+    counts = Category.subtree_product_counts()
+    nodes = {}
+    roots = []
+    for category in Category.objects.filter(is_active=True).order_by('path').only(
+            'id', 'name', 'slug', 'parent_id', 'path', 'depth'):
+        node = {
+            'id': category.id,
+            'name': category.name,
+            'slug': category.slug,
+            'depth': category.depth,
+            'product_count': counts.get(category.id, 0),
+            'children': [],
+        }
+        if category.parent_id is None:
+            roots.append(node)
+        elif category.parent_id in nodes:
+            nodes[category.parent_id]['children'].append(node)
+        else:
+            continue
+        nodes[category.id] = node
+
+    for node in nodes.values():
+        node['children'].sort(key=lambda child: child['name'])
+    roots.sort(key=lambda root: root['name'])
+    return roots
+
+
+def tree_json():
+    """
+    Return the rendered tree, cached as bytes so hits skip serialization entirely.
+
+    Category changes drop the cache; product counts are only refreshed by the
+    timeout, as invalidating on every product save would defeat the cache.
+    """
+    return get_or_build(
+        TREE_KEY,
+        lambda: JSONRenderer().render(build_tree()),
+        timeout=getattr(settings, 'CATEGORY_TREE_CACHE_TIMEOUT', 600),
+    )
+
+
+def invalidate_tree():
+    get_cache().delete(TREE_KEY)
+    # Drop it again after commit, in case a reader cached pre-commit data.
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: get_cache().delete(TREE_KEY))
@@ -0,0 +1,117 @@
+import hashlib
+from collections import Counter
+from decimal import Decimal
+from functools import reduce
+from operator import and_, or_
+
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+from apps.products.cache import get_or_build
+from apps.products.filters import ProductFilter
+from apps.products.models import Brand, Category, Product
+from core.renderers import JSONRenderer
+
+FACETS = sorted(set(ProductFilter.FACETS.values()))
+
+
+def price_buckets():
+    """``(low, high)`` discounted price ranges of the price facet; the last one is open ended."""
+    edges = [Decimal(edge) for edge in settings.PRODUCT_PRICE_FACET_BUCKETS]
+    return list(zip(edges, edges[1:] + [None]))
+
+
+def facet_counts(filters):
+    """
+    Return the catalogue sidebar counts for a validated ProductFilter.
+
+    Each facet is counted with every filter but its own, so picking a brand
+    leaves the other brands' counts in place for a multi-select. Two grouped
+    queries with a conditional count per facet do it all: one by brand and
+    price bucket, one by category; category counts include descendants.
+    The names of the categories and brands take one more query each.
+    """
+    conditions = filters.facet_conditions()
+
+    def others(facet):
+        return reduce(and_, (condition for name, condition in conditions.items() if name != facet), Q())
+
+    products = filters.filter_queryset(Product.objects.filter(is_active=True), exclude=FACETS)
+    if len(conditions) > 1:
+        # Rows failing two facet filters count nowhere.
+        products = products.filter(reduce(or_, (others(facet) for facet in conditions)))
+
+    buckets = price_buckets()
+    bucket = Case(
+        *[When(final_price__lt=high, then=Value(index)) for index, (_, high) in enumerate(buckets[:-1])],
+        default=Value(len(buckets) - 1),
+        output_field=IntegerField(),
+    )
+    totals = Counter()
+    brands = Counter()
+    prices = Counter()
+    for row in products.values('brand_id', bucket=bucket).annotate(
+        total=Count('id', filter=others(None)),
+        brand_total=Count('id', filter=others('brand')),
+        price_total=Count('id', filter=others('price')),
+        is_featured=Count('id', filter=Q(is_featured=True) & others('is_featured')),
+        in_stock=Count('id', filter=Q(stock_quantity__gt=0) & others('in_stock')),
+    ).order_by():
+        brands[row['brand_id']] += row['brand_total']
+        prices[row['bucket']] += row['price_total']
+        totals.update({name: row[name] for name in ('total', 'is_featured', 'in_stock')})
+    direct = dict(products.values_list('category_id').annotate(
+        category_total=Count('id', filter=others('category')),
+    ).order_by())
+
+    return {
+        'count': totals['total'],
+        'categories': _categories(direct),
+        'brands': [
+            {'id': brand_id, 'name': name, 'count': brands[brand_id]}
+            for brand_id, name in Brand.objects.filter(
+                id__in=[brand_id for brand_id, count in brands.items() if count],
+            ).order_by('name', 'id').values_list('id', 'name')
+        ],
+        'price': [
+            {'min': str(low), 'max': None if high is None else str(high), 'count': prices[index]}
+            for index, (low, high) in enumerate(buckets)
+        ],
+        'is_featured': totals['is_featured'],
+        'in_stock': totals['in_stock'],
+    }
+
+
+def _categories(direct):
+    # Active categories with products in their subtree, parents first.
+    categories = list(Category.objects.filter(is_active=True).order_by('path').values_list(
+        'id', 'name', 'parent_id', 'path',
+    ))
+    paths = {category_id: path for category_id, _, _, path in categories}
+    counts = Counter()
+    for category_id, count in direct.items():
+        if count and category_id in paths:
+            for ancestor in paths[category_id].strip('/').split('/'):
+                counts[int(ancestor)] += count
+    return [
+        {'id': category_id, 'name': name, 'parent': parent_id, 'count': counts[category_id]}
+        for category_id, name, parent_id, _ in categories if counts[category_id]
+    ]
+
+
+def signature(filters):
+    """Digest of the validated filters, naming their facet counts in the cache."""
+    return hashlib.md5(repr(sorted(filters.validated_data.items())).encode(), usedforsecurity=False).hexdigest()
+
+
+def facets_json(filters):
+    """
+    Return the rendered facet counts, cached per filter signature.
+
+    Counts are only refreshed by the timeout, like the category tree's.
+    """
+    return get_or_build(
+        f'products:facets:{signature(filters)}',
+        lambda: JSONRenderer().render(facet_counts(filters)),
+        timeout=getattr(settings, 'PRODUCT_FACETS_CACHE_TIMEOUT', 60),
+    )
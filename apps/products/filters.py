@@ -0,0 +1,116 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from rest_framework import serializers
+
+from apps.products import search
+from apps.products.models import Category, subtree_upper_bound
+
+
+class IdListField(serializers.CharField):
+    """Comma separated ids, e.g. ``3,7``, as a sorted list; a single id is a list of one."""
+    default_error_messages = {
+        'invalid': 'Enter positive integers separated by commas.',
+    }
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        try:
+            ids = {int(part) for part in value.split(',') if part.strip()}
+        except ValueError:
+            self.fail('invalid')
+        if not ids or min(ids) < 1:
+            self.fail('invalid')
+        return sorted(ids)
+
+
+class ProductFilter(serializers.Serializer):
+    """
+    Validates the product list query parameters and applies them to a queryset.
+
+    Every parameter maps to a ``filter_<name>`` method that narrows the queryset
+    it receives, so filters always chain instead of replacing each other. The
+    parameters that are also facets (see ``FACETS`` and apps.products.facets)
+    are ``condition_<name>`` methods returning a Q instead, so facet counts
+    can leave their own out.
+    ``cat_id`` and ``brand_id`` take several comma separated ids.
+    """
+    cat_id = IdListField(required=False, max_length=1000)
+    brand_id = IdListField(required=False, max_length=1000)
+    min_price = serializers.DecimalField(required=False, max_digits=10, decimal_places=2, min_value=0)
+    max_price = serializers.DecimalField(required=False, max_digits=10, decimal_places=2, min_value=0)
+    is_featured = serializers.BooleanField(required=False)
+    in_stock = serializers.BooleanField(required=False)
+    min_rating = serializers.FloatField(required=False, min_value=0, max_value=5)
+    s = serializers.CharField(required=False, max_length=100)
+
+    # The facet each facet parameter filters.
+    FACETS = {
+        'cat_id': 'category',
+        'brand_id': 'brand',
+        'min_price': 'price',
+        'max_price': 'price',
+        'is_featured': 'is_featured',
+        'in_stock': 'in_stock',
+    }
+
+    def validate(self, attrs):
+        min_price = attrs.get('min_price')
+        max_price = attrs.get('max_price')
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise serializers.ValidationError('min_price can not be greater than max_price')
+        return attrs
+
+    def filter_queryset(self, queryset, exclude=()):
+        """Apply the parameters, leaving out the filters of the facets in ``exclude``."""
+        conditions = self.facet_conditions(exclude)
+        if conditions:
+            queryset = queryset.filter(*conditions.values())
+        for name, value in self.validated_data.items():
+            if name not in self.FACETS:
+                queryset = getattr(self, f'filter_{name}')(queryset, value)
+        return queryset
+
+    def facet_conditions(self, exclude=()):
+        """Return ``{facet: Q}`` for the facets filtered on, but those in ``exclude``."""
+        conditions = {}
+        for name, value in self.validated_data.items():
+            facet = self.FACETS.get(name)
+            if facet is not None and facet not in exclude:
+                conditions[facet] = conditions.get(facet, Q()) & getattr(self, f'condition_{name}')(value)
+        return conditions
+
+    def condition_cat_id(self, value):
+        paths = list(Category.objects.filter(pk__in=value).values_list('path', flat=True))
+        if not paths:
+            # Unknown ids: a subquery matching nothing.
+            return Q(category__in=Category.objects.filter(pk__in=value))
+        subtrees = [Q(path__gte=path, path__lt=subtree_upper_bound(path)) for path in paths]
+        return Q(category__in=Category.objects.filter(reduce(or_, subtrees)))
+
+    def condition_brand_id(self, value):
+        return Q(brand_id__in=value)
+
+    def condition_min_price(self, value):
+        # The discounted price never exceeds the list price, so the extra
+        # price bound lets the (category/brand, price) indexes
+        # narrow the range before the discount is applied.
+        return Q(price__gte=value, final_price__gte=value)
+
+    def condition_max_price(self, value):
+        return Q(final_price__lte=value)
+
+    def condition_is_featured(self, value):
+        return Q(is_featured=value)
+
+    def condition_in_stock(self, value):
+        if value:
+            return Q(stock_quantity__gt=0)
+        return Q(stock_quantity__lte=0)
+
+    def filter_min_rating(self, queryset, value):
+        return queryset.filter(average_rating__gte=value)
+
+    def filter_s(self, queryset, value):
+        return search.search(queryset, value)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.products import related
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored related products from co-purchases, wishlists and catalogue similarity.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--top-n', type=int, default=related.TOP_N)
+        parser.add_argument('--since', help='Only products ordered or updated since this ISO datetime.')
+        parser.add_argument('--product', type=int, action='append', dest='products',
+                            help='Only this product id (repeatable).')
+
+    def handle(self, *args, **options):
+        product_ids = options['products']
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError('--since must be an ISO 8601 datetime')
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            product_ids = set(product_ids or ()) | related.products_changed_since(since)
+
+        processed = related.recompute(product_ids, batch_size=options['batch_size'], top_n=options['top_n'])
+        self.stdout.write(self.style.SUCCESS(f'Related products computed for {processed} product(s).'))
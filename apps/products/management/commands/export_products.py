@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.products import transfer
+
+
+class Command(BaseCommand):
+    help = 'Stream the catalogue as CSV, JSONL or JSON in the import format.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=transfer.EXPORT_FORMATS, default='csv', dest='file_format')
+        parser.add_argument('--output', help='File to write, defaults to stdout.')
+        parser.add_argument('--chunk-size', type=int, default=transfer.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        chunks = transfer.export_products(options['file_format'], chunk_size=options['chunk_size'])
+        if not options['output']:
+            for text in chunks:
+                self.stdout.write(text, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            output.writelines(chunks)
@@ -0,0 +1,34 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products import transfer
+
+
+class Command(BaseCommand):
+    help = 'Upsert products and images from a CSV or JSONL file, streamed in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=transfer.FORMATS, dest='file_format',
+                            help='Defaults to the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=transfer.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        file_format = options['file_format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if file_format not in transfer.FORMATS:
+            raise CommandError(f'Unknown format {file_format!r}, use --format')
+
+        try:
+            with open(options['path'], 'rb') as stream:
+                result = transfer.import_products(stream, file_format, chunk_size=options['chunk_size'])
+        except OSError as error:
+            raise CommandError(str(error))
+
+        for error in result.errors:
+            self.stderr.write(f'line {error["line"]}: {error["errors"]}')
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... {result.error_count - len(result.errors)} more error(s)')
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.created} created, {result.updated} updated, {result.error_count} error(s).'
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index from the product table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not search.is_supported(using):
+            raise CommandError('Full-text search index is only available on SQLite (FTS5).')
+        search.install(using=using)
+        search.rebuild(using=using)
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products.sales import rebuild_units_sold
+
+
+class Command(BaseCommand):
+    help = 'Recompute Product.units_sold, the bestseller sort key, from the order lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--verify', action='store_true',
+                            help='Only report products whose units sold are out of date.')
+
+    def handle(self, *args, **options):
+        drifted = rebuild_units_sold(batch_size=options['batch_size'], dry_run=options['verify'])
+        if options['verify']:
+            if drifted:
+                raise CommandError(f'{len(drifted)} product(s) have stale units sold: {drifted[:20]}')
+            self.stdout.write(self.style.SUCCESS('All units sold are up to date.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt units sold, {len(drifted)} product(s) updated.'))
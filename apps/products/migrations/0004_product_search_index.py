@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:30
+
+import apps.products.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchIndex',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='products.product')),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+                ('document', apps.products.models.SearchDocumentField(db_column='products_product_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'products_product_fts',
+                'managed': False,
+            },
+        ),
+    ]
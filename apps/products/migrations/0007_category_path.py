@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:37
+
+from django.db import migrations, models
+
+
+def backfill_paths(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    paths = {}
+
+    def path_of(category_id):
+        if category_id not in paths:
+            parent_id = parents[category_id]
+            paths[category_id] = (path_of(parent_id) if parent_id else '/') + f'{category_id}/'
+        return paths[category_id]
+
+    categories = list(Category.objects.only('id'))
+    for category in categories:
+        category.path = path_of(category.id)
+        category.depth = category.path.count('/') - 2
+    Category.objects.bulk_update(categories, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_related_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:41
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_images(apps, schema_editor):
+    ProductImage = apps.get_model('products', 'ProductImage')
+    keep = ProductImage.objects.values('product_id', 'image_url').annotate(first=Min('id')).values('first')
+    ProductImage.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_category_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_images, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productimage',
+            constraint=models.UniqueConstraint(fields=('product', 'image_url'), name='product_image_unique_url'),
+        ),
+    ]
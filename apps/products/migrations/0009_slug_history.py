@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_image_unique_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlugHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slug_history', to='products.product')),
+            ],
+            options={
+                'verbose_name_plural': 'slug history',
+            },
+        ),
+    ]
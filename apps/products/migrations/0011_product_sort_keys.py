@@ -0,0 +1,96 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:39
+
+from django.db import migrations, models
+from django.db.models import Func, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+class FinalPriceKey(Func):
+    # The discounted price expression product_active_final_price_idx was on,
+    # before Product.final_price was stored.
+    output_field = models.FloatField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        (price, price_params), (discount, discount_params) = (
+            compiler.compile(expression) for expression in self.get_source_expressions()
+        )
+        float_type = connection.data_types['FloatField']
+        return f'((CAST({price} AS {float_type}) * (100 - {discount})) / 100)', (*price_params, *discount_params)
+
+
+def backfill_units_sold(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    units = OrderItem.objects.filter(product=OuterRef('pk')).exclude(order__status='cancelled').values(
+        'product',
+    ).annotate(total=Sum('quantity')).values('total')
+    Product.objects.update(units_sold=Coalesce(Subquery(units), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_order_history_index'),
+        ('products', '0010_product_updated_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_active_cat_price_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_active_brand_price_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_active_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_active_price_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_active_rating_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='units_sold',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'price'], name='product_active_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['brand', 'price'], name='product_active_brand_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at', 'id'], name='product_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['price', 'id'], name='product_active_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(FinalPriceKey('price', 'discount_percentage'), models.F('id'), condition=models.Q(('is_active', True)), name='product_active_final_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['average_rating', 'id'], name='product_active_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['rating_count', 'id'], name='product_active_reviews_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['units_sold', 'id'], name='product_active_units_sold_idx'),
+        ),
+        migrations.RunPython(backfill_units_sold, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:44
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+import django.db.models.functions.math
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_sort_keys'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_active_final_price_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='final_price',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast(django.db.models.functions.math.Round(django.db.models.expressions.CombinedExpression(models.F('price'), '*', models.Value(100))), models.BigIntegerField()), '*', django.db.models.expressions.CombinedExpression(models.Value(100), '-', models.F('discount_percentage'))), '+', models.Value(50)), '/', models.Value(100)), '/', models.Value(100.0)), output_field=models.DecimalField(decimal_places=2, max_digits=10)),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['final_price', 'id'], name='product_active_final_price_idx'),
+        ),
+    ]
@@ -1,4 +1,9 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Count, F, Lookup, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Concat, Substr
+
+from apps.products import pricing
 
 
 class Category(models.Model):
@@ -8,6 +13,72 @@ class Category(models.Model):
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Materialized path of ids from the root, e.g. '/1/5/12/'. Maintained by save().
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(editable=False, default=0)
+
+    def clean(self):
+        if self.pk and self.parent_id and f'/{self.pk}/' in Category.objects.get(pk=self.parent_id).path:
+            raise ValidationError({'parent': 'A category can not be moved under its own subtree.'})
+
+    def save(self, *args, **kwargs):
+        parent_path = '/'
+        if self.parent_id:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
+            if self.pk and f'/{self.pk}/' in parent_path:
+                raise ValidationError('A category can not be moved under its own subtree.')
+        with transaction.atomic():
+            old_path = ''
+            if self.pk:
+                old_path = Category.objects.filter(pk=self.pk).values_list('path', flat=True).first() or ''
+            super().save(*args, **kwargs)
+
+            path = f'{parent_path}{self.pk}/'
+            if path == old_path:
+                return
+            depth = path.count('/') - 2
+            Category.objects.filter(pk=self.pk).update(path=path, depth=depth)
+            if old_path:
+                # Move the whole subtree in one statement by swapping the prefix.
+                Category.objects.filter(path__gt=old_path, path__lt=subtree_upper_bound(old_path)).update(
+                    path=Concat(Value(path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (depth - (old_path.count('/') - 2)),
+                )
+            self.path, self.depth = path, depth
+
+    def descendants(self, include_self=False):
+        lookup = 'path__gte' if include_self else 'path__gt'
+        return Category.objects.filter(**{lookup: self.path, 'path__lt': subtree_upper_bound(self.path)})
+
+    def ancestors(self, include_self=False):
+        ids = [int(part) for part in self.path.strip('/').split('/') if part]
+        if not include_self:
+            ids = ids[:-1]
+        return Category.objects.filter(id__in=ids).order_by('depth')
+
+    def product_count(self):
+        return Product.objects.filter(
+            is_active=True, category__path__gte=self.path, category__path__lt=subtree_upper_bound(self.path),
+        ).count()
+
+    @classmethod
+    def subtree_product_counts(cls):
+        """Return {category_id: active products in the category and its descendants}."""
+        direct = dict(
+            Product.objects.filter(is_active=True).values_list('category_id').annotate(count=Count('id')).order_by()
+        )
+        counts = {}
+        for category_id, path in cls.objects.values_list('id', 'path'):
+            for ancestor in path.strip('/').split('/'):
+                if ancestor:
+                    counts[int(ancestor)] = counts.get(int(ancestor), 0) + direct.get(category_id, 0)
+        return counts
+
+
+def subtree_upper_bound(path):
+    # '/' sorts right before '0', so every path starting with '/1/5/' is
+    # below '/1/50': the subtree is a plain index range scan.
+    return path[:-1] + '0'
 
 
 class Brand(models.Model):
@@ -17,6 +88,21 @@ class Brand(models.Model):
     website = models.URLField(blank=True, null=True)
 
 
+def primary_image_url(product='pk'):
+    """Subquery of the primary image URL of the product referenced by the ``product`` field."""
+    return Subquery(ProductImage.objects.filter(
+        product=OuterRef(product), is_primary=True
+    ).order_by('order', 'id').values('image_url')[:1])
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_primary_image(self):
+        return self.annotate(primary_image=primary_image_url())
+
+    def with_list_data(self):
+        return self.select_related('category', 'brand').with_primary_image()
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
@@ -25,15 +111,129 @@ class Product(models.Model):
     brand = models.ForeignKey(Brand, on_delete=models.CASCADE, related_name='products')
     price = models.DecimalField(max_digits=10, decimal_places=2)
     discount_percentage = models.IntegerField(default=0)
+    # What every price is read from: lists, filters, carts and checkout.
+    final_price = models.GeneratedField(
+        expression=pricing.final_price_expression(),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        db_persist=True,
+    )
     stock_quantity = models.IntegerField(default=0)
     is_featured = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Review aggregates, maintained incrementally by apps.reviews.ratings.
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
+    RATING_COUNTER_FIELDS = (
+        'rating_sum', 'rating_count',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+    )
+    RATING_FIELDS = RATING_COUNTER_FIELDS + ('average_rating',)
+
+    # Units in orders that were not cancelled, maintained by apps.products.sales.
+    units_sold = models.PositiveIntegerField(default=0)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        # Partial on is_active: Django filters on the bare boolean column, which
+        # SQLite can match against an index's WHERE but not use as a key prefix.
+        indexes = [
+            models.Index(fields=['category', 'price'], condition=Q(is_active=True), name='product_active_cat_price_idx'),
+            models.Index(fields=['brand', 'price'], condition=Q(is_active=True), name='product_active_brand_price_idx'),
+            # One per ProductPagination ordering.
+            models.Index(fields=['created_at', 'id'], condition=Q(is_active=True), name='product_active_created_idx'),
+            models.Index(fields=['price', 'id'], condition=Q(is_active=True), name='product_active_price_idx'),
+            models.Index(fields=['final_price', 'id'], condition=Q(is_active=True), name='product_active_final_price_idx'),
+            models.Index(fields=['average_rating', 'id'], condition=Q(is_active=True), name='product_active_rating_idx'),
+            models.Index(fields=['rating_count', 'id'], condition=Q(is_active=True), name='product_active_reviews_idx'),
+            models.Index(fields=['units_sold', 'id'], condition=Q(is_active=True), name='product_active_units_sold_idx'),
+            # Changes since a watermark, see apps.products.snapshot.
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+        ]
+
+    # The stock_quantity read from the database, so that saving a copy loaded
+    # before a sale does not put the sold units back; see apps.inventory.signals.
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stock_quantity = instance.__dict__.get('stock_quantity')
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'stock_quantity' in fields:
+            self._loaded_stock_quantity = self.stock_quantity
+
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image_url = models.URLField()
     is_primary = models.BooleanField(default=False)
-    order = models.IntegerField(default=0)
\ No newline at end of file
+    order = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'image_url'], name='product_image_unique_url'),
+        ]
+
+
+class RelatedProduct(models.Model):
+    # Precomputed by apps.products.related; read back ordered by rank.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank_uniq'),
+        ]
+
+
+class SlugHistory(models.Model):
+    # Former product slugs, so renamed products keep their old URLs.
+    slug = models.SlugField(unique=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='slug_history')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'slug history'
+
+
+class SearchDocumentField(models.TextField):
+    pass
+
+
+@SearchDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class ProductSearchIndex(models.Model):
+    # SQLite FTS5 external-content table over Product.name/description. It is
+    # created and kept in sync by triggers installed in apps.products.search.
+    product = models.OneToOneField(Product, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+                                   related_name='search_index')
+    name = models.TextField()
+    description = models.TextField()
+    document = SearchDocumentField(db_column='products_product_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'products_product_fts'
@@ -0,0 +1,51 @@
+from core.pagination import KeysetPagination
+
+
+class ProductPagination(KeysetPagination):
+    # All but relevance are served by an index of Product.
+    orderings = {
+        'newest': ('-created_at', '-id'),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+        'final_price': ('final_price', 'id'),
+        '-final_price': ('-final_price', '-id'),
+        'top_rated': ('-average_rating', '-id'),
+        'most_reviewed': ('-rating_count', '-id'),
+        'bestseller': ('-units_sold', '-id'),
+        'relevance': ('search_rank', 'id'),
+    }
+
+    def get_ordering(self, request):
+        # Relevance only exists for text searches, where it is also the default.
+        searching = bool(request.query_params.get('s'))
+        sort = request.query_params.get(self.sort_query_param)
+        if sort == 'relevance' and not searching:
+            sort = None
+        if sort not in self.orderings:
+            sort = 'relevance' if searching else 'newest'
+        return sort, self.orderings[sort]
+
+    def paginate_snapshot(self, snapshot, queryset, filters, request):
+        """
+        Like paginate_queryset(), with the page picked by ``snapshot`` and only its rows read from ``queryset``.
+
+        ``filters`` is the validated data ``queryset`` was filtered with,
+        which still applies to the page. Returns None when the snapshot can
+        not serve the request, including when a product on the page no
+        longer matches since the last refresh: a short page would end the
+        list early, so the database answers instead.
+        """
+        reverse, position = self._prepare(request, queryset.model)
+        ids = snapshot.page(filters, self.ordering, reverse, position, self.page_size + 1)
+        if ids is None:
+            return None
+        rows = {row.id: row for row in queryset.filter(id__in=ids)}
+        if len(rows) < len(ids):
+            return None
+        return self._paginate([rows[pk] for pk in ids], reverse, position)
+
+
+class ProductSearchPagination(KeysetPagination):
+    orderings = {
+        'relevance': ('search_rank', 'id'),
+    }
@@ -0,0 +1,30 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Round
+
+CENT = Decimal('0.01')
+
+
+def final_price_expression():
+    """
+    SQL for ``Product.final_price``: the discounted price rounded half up to the cent.
+
+    Rounded in integer cents, so it is exact although SQLite keeps prices as
+    floats. The cents are divided by a float, which SQLite would otherwise
+    divide as integers; the result is the float SQLite reads ``'84.99'`` as,
+    so the price filters find equal prices equal.
+    """
+    cents = Cast(Round(F('price') * 100), models.BigIntegerField())
+    return (cents * (100 - F('discount_percentage')) + 50) / 100 / Value(100.0)
+
+
+def line_total(quantity, final_price):
+    """The total of ``quantity`` units at a final price; being whole cents, sums of these need no rounding."""
+    return quantity * final_price
+
+
+def percent_of(amount, percent):
+    """``percent`` of ``amount``, rounded half up to the cent like ``Product.final_price``."""
+    return (amount * percent / 100).quantize(CENT, rounding=ROUND_HALF_UP)
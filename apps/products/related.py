@@ -0,0 +1,152 @@
+import heapq
+import math
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from apps.orders.models import OrderItem
+from apps.products.cache import bump_versions
+from apps.products.models import Product, RelatedProduct
+from apps.reviews.models import Wishlist
+
+TOP_N = 10
+# Nearest-priced products on each side taken from the same category.
+PRICE_NEIGHBOURS = 20
+
+CO_PURCHASE_WEIGHT = 3.0
+CO_WISHLIST_WEIGHT = 1.5
+SAME_CATEGORY_WEIGHT = 1.0
+SAME_BRAND_WEIGHT = 0.5
+PRICE_WEIGHT = 1.0
+
+
+def co_purchases(product_ids):
+    """Return {product_id: {other_id: number of orders containing both}}."""
+    rows = OrderItem.objects.filter(product_id__in=product_ids).annotate(
+        other=F('order__items__product_id'),
+    ).exclude(other=F('product_id')).values('product_id', 'other').annotate(
+        orders=Count('order_id', distinct=True),
+    ).order_by()
+    result = defaultdict(dict)
+    for row in rows:
+        result[row['product_id']][row['other']] = row['orders']
+    return result
+
+
+def co_wishlists(product_ids):
+    """Return {product_id: {other_id: number of wishlists containing both}}."""
+    rows = Wishlist.products.through.objects.filter(product_id__in=product_ids).annotate(
+        other=F('wishlist__products__id'),
+    ).exclude(other=F('product_id')).values('product_id', 'other').annotate(
+        wishlists=Count('wishlist_id', distinct=True),
+    ).order_by()
+    result = defaultdict(dict)
+    for row in rows:
+        result[row['product_id']][row['other']] = row['wishlists']
+    return result
+
+
+def price_similarity(price, other_price):
+    high = max(price, other_price)
+    if not high:
+        return 1.0
+    return 1.0 - float(abs(price - other_price) / high)
+
+
+def score_batch(sources, catalogue, prices, top_n):
+    """
+    Rank related products for every ``(id, brand_id, price)`` in ``sources``.
+
+    ``catalogue`` is the category's active products sorted by price and
+    ``prices`` their prices; co-purchased and co-wishlisted products from any
+    category are added as candidates on top of the nearest-priced neighbours.
+    """
+    source_ids = [product_id for product_id, _, _ in sources]
+    purchases = co_purchases(source_ids)
+    wishlists = co_wishlists(source_ids)
+    outside = list({other for scores in (purchases, wishlists) for row in scores.values() for other in row})
+    active = set()
+    for chunk in _chunks(outside):
+        active.update(Product.objects.filter(id__in=chunk, is_active=True).values_list('id', flat=True))
+
+    rows = []
+    for product_id, brand_id, price in sources:
+        scores = defaultdict(float)
+        position = bisect_left(prices, price)
+        for other_id, other_brand, other_price in catalogue[max(0, position - PRICE_NEIGHBOURS):
+                                                            position + PRICE_NEIGHBOURS + 1]:
+            if other_id == product_id:
+                continue
+            scores[other_id] = (
+                SAME_CATEGORY_WEIGHT
+                + SAME_BRAND_WEIGHT * (other_brand == brand_id)
+                + PRICE_WEIGHT * price_similarity(price, other_price)
+            )
+        for other_id, count in purchases.get(product_id, {}).items():
+            if other_id in active:
+                scores[other_id] += CO_PURCHASE_WEIGHT * math.log1p(count)
+        for other_id, count in wishlists.get(product_id, {}).items():
+            if other_id in active:
+                scores[other_id] += CO_WISHLIST_WEIGHT * math.log1p(count)
+
+        best = heapq.nsmallest(top_n, scores.items(), key=lambda item: (-item[1], item[0]))
+        rows.extend(
+            RelatedProduct(product_id=product_id, related_id=other_id, rank=rank, score=score)
+            for rank, (other_id, score) in enumerate(best)
+        )
+    return rows
+
+
+def recompute(product_ids=None, batch_size=500, top_n=TOP_N):
+    """
+    Recompute stored related products, one category at a time.
+
+    Each category's active catalogue is loaded once, sorted by price, and its
+    products are scored in batches of ``batch_size``: two grouped queries for
+    the co-occurrence counts and one replace per batch, so the work grows with
+    the number of order lines rather than the number of product pairs.
+    Returns the number of products processed.
+    """
+    active = Product.objects.filter(is_active=True)
+    if product_ids is None:
+        wanted = None
+        category_ids = list(active.values_list('category_id', flat=True).distinct().order_by('category_id'))
+    else:
+        wanted = set(product_ids)
+        category_ids = set()
+        for chunk in _chunks(list(wanted)):
+            category_ids.update(active.filter(id__in=chunk).values_list('category_id', flat=True).distinct())
+        category_ids = sorted(category_ids)
+
+    processed = 0
+    for category_id in category_ids:
+        catalogue = list(
+            Product.objects.filter(category_id=category_id, is_active=True).order_by('price', 'id').values_list(
+                'id', 'brand_id', 'price',
+            )
+        )
+        prices = [price for _, _, price in catalogue]
+        targets = [row for row in catalogue if wanted is None or row[0] in wanted]
+        for start in range(0, len(targets), batch_size):
+            batch = targets[start:start + batch_size]
+            rows = score_batch(batch, catalogue, prices, top_n)
+            batch_ids = [product_id for product_id, _, _ in batch]
+            with transaction.atomic():
+                RelatedProduct.objects.filter(product_id__in=batch_ids).delete()
+                RelatedProduct.objects.bulk_create(rows, batch_size=1000)
+            bump_versions(batch_ids)
+            processed += len(batch)
+    return processed
+
+
+def products_changed_since(since):
+    ordered = OrderItem.objects.filter(order__created_at__gte=since).values_list('product_id', flat=True)
+    updated = Product.objects.filter(updated_at__gte=since).values_list('id', flat=True)
+    return set(ordered.distinct()) | set(updated)
+
+
+def _chunks(items, size=10000):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
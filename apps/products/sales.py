@@ -0,0 +1,53 @@
+from django.db.models import Case, F, PositiveIntegerField, Sum, When
+from django.utils import timezone
+
+from apps.orders.models import OrderItem
+from apps.products.models import Product
+
+
+def add_sales(quantities):
+    """Add the units of a placed order, ``quantities`` mapping product ids to units, to ``Product.units_sold``."""
+    if not quantities:
+        return
+    Product.objects.filter(id__in=quantities).update(
+        units_sold=Case(
+            *[When(id=product_id, then=F('units_sold') + quantity) for product_id, quantity in quantities.items()],
+            default=F('units_sold'),
+            output_field=PositiveIntegerField(),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def compute_units_sold(product_ids):
+    """Return ``{product_id: units}`` recomputed from the order lines of orders that were not cancelled."""
+    rows = OrderItem.objects.filter(product_id__in=product_ids).exclude(order__status='cancelled').values(
+        'product_id',
+    ).annotate(units=Sum('quantity')).order_by().values_list('product_id', 'units')
+    return {product_id: 0 for product_id in product_ids} | dict(rows)
+
+
+def rebuild_units_sold(batch_size=1000, dry_run=False):
+    """
+    Recompute ``Product.units_sold`` for every product in id batches.
+
+    Checkout only ever adds, so this is what takes cancelled orders back
+    out. Only drifted rows are written. Returns the ids that were out of date.
+    """
+    drifted = []
+    last_id = 0
+    while True:
+        products = list(Product.objects.filter(id__gt=last_id).order_by('id').only('id', 'units_sold')[:batch_size])
+        if not products:
+            return drifted
+        last_id = products[-1].id
+        expected = compute_units_sold([product.id for product in products])
+        changed = []
+        for product in products:
+            if product.units_sold != expected[product.id]:
+                product.units_sold = expected[product.id]
+                product.updated_at = timezone.now()
+                changed.append(product)
+        drifted.extend(product.id for product in changed)
+        if changed and not dry_run:
+            Product.objects.bulk_update(changed, ['units_sold', 'updated_at'])
@@ -0,0 +1,134 @@
+import re
+
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from apps.products.models import Product, ProductSearchIndex
+
+FTS_TABLE = ProductSearchIndex._meta.db_table
+PRODUCT_TABLE = Product._meta.db_table
+
+# Matches in the name weigh ten times more than matches in the description.
+RANK_FUNCTION = 'bm25(10.0, 1.0)'
+
+CREATE_TABLE = f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description,
+        content='{PRODUCT_TABLE}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+'''
+
+TRIGGERS = {
+    f'{FTS_TABLE}_ai': f'''
+        CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {PRODUCT_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END
+    ''',
+    f'{FTS_TABLE}_ad': f'''
+        CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {PRODUCT_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END
+    ''',
+    f'{FTS_TABLE}_au': f'''
+        CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF name, description ON {PRODUCT_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END
+    ''',
+}
+
+SNIPPET_SQL = f"snippet({FTS_TABLE}, 1, %s, %s, '…', 12)"
+HIGHLIGHT_SQL = f'highlight({FTS_TABLE}, 0, %s, %s)'
+# FTS5 copies the text around the matches as is: matches are delimited by
+# control characters, which mark_matches() turns into tags once the text is
+# escaped.
+MARKERS = ('\x02', '\x03')
+MARK = ('<mark>', '</mark>')
+
+
+def is_supported(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+
+def install(using='default', **kwargs):
+    """
+    Create the FTS5 table and its sync triggers if they are missing.
+
+    Runs on post_migrate: SQLite migrations that rebuild the product table drop
+    its triggers, so they are recreated here and the index is rebuilt from the
+    product table whenever that happens.
+    """
+    if not is_supported(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [PRODUCT_TABLE]
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        cursor.execute(CREATE_TABLE)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', %s)", [RANK_FUNCTION])
+        missing = [name for name in TRIGGERS if name not in existing]
+        for name in missing:
+            cursor.execute(TRIGGERS[name])
+        if missing:
+            rebuild(using)
+
+
+def rebuild(using='default'):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def build_match_query(text):
+    # Every word must match, the last one as a prefix so results follow typing.
+    terms = re.findall(r'\w+', text.lower())
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search(queryset, text):
+    """
+    Narrow a Product queryset to ``text`` and annotate ``search_rank``.
+
+    Lower ranks are better, so results sort ascending by ``search_rank``.
+    Backends without FTS5 fall back to a substring scan with a constant rank.
+    """
+    if not is_supported(queryset.db):
+        return queryset.filter(Q(name__icontains=text) | Q(description__icontains=text)).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+    query = build_match_query(text)
+    if query is None:
+        return queryset.none()
+    return queryset.filter(search_index__document__match=query).annotate(search_rank=F('search_index__rank'))
+
+
+def with_highlights(queryset):
+    """
+    Annotate ``name_highlight`` and ``snippet`` on a queryset returned by search().
+
+    Both are plain text with the matches between MARKERS; mark_matches()
+    makes them HTML.
+    """
+    if not is_supported(queryset.db):
+        return queryset.annotate(name_highlight=F('name'), snippet=F('description'))
+    return queryset.annotate(
+        name_highlight=RawSQL(HIGHLIGHT_SQL, MARKERS),
+        snippet=RawSQL(SNIPPET_SQL, MARKERS),
+    )
+
+
+def mark_matches(text):
+    """HTML-escape a with_highlights() value and wrap its matches in ``<mark>``."""
+    text = escape(text)
+    for marker, tag in zip(MARKERS, MARK):
+        text = text.replace(marker, tag)
+    return text
@@ -1,10 +1,10 @@
-from decimal import Decimal
-
-from django.utils.text import slugify
 from rest_framework import serializers
 
+from apps.products import search, slugs
 from apps.products.models import Product, Category, Brand, ProductImage
 from apps.reviews.models import ProductReview
+from core.fastpath import Method, RowSerializer
+from core.serializers import SparseFieldsMixin
 
 
 class InlineCategorySerializer(serializers.ModelSerializer):
@@ -13,16 +13,36 @@ class InlineCategorySerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'slug')
 
 
+class CategoryDetailSerializer(serializers.ModelSerializer):
+    breadcrumbs = serializers.SerializerMethodField()
+    children = serializers.SerializerMethodField()
+    product_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Category
+        fields = ('id', 'name', 'slug', 'description', 'depth', 'breadcrumbs', 'children', 'product_count')
+
+    def get_breadcrumbs(self, obj):
+        return InlineCategorySerializer(obj.ancestors(include_self=True).only('id', 'name', 'slug'), many=True).data
+
+    def get_children(self, obj):
+        children = obj.children.filter(is_active=True).order_by('name').only('id', 'name', 'slug')
+        return InlineCategorySerializer(children, many=True).data
+
+    def get_product_count(self, obj):
+        return obj.product_count()
+
+
 class InlineBrandSerializer(serializers.ModelSerializer):
     class Meta:
         model = Brand
         fields = ('id', 'name', 'logo')
 
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category = InlineCategorySerializer()
     brand = InlineBrandSerializer()
-    final_price = serializers.SerializerMethodField()
+    final_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     in_stock = serializers.SerializerMethodField()
     primary_image = serializers.SerializerMethodField()
     reviews_count = serializers.SerializerMethodField()
@@ -30,33 +50,47 @@ class ProductListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
-        fields = '__all__'
-
-    def get_final_price(self, obj):
-        return Decimal(obj.price) * Decimal(1 - Decimal(obj.discount_percentage) / 100)
+        exclude = Product.RATING_COUNTER_FIELDS
+        field_sources = {
+            'in_stock': ('stock_quantity',),
+            'reviews_count': ('rating_count',),
+            'average_rating': ('average_rating',),
+            'primary_image': (),
+        }
+        field_querysets = {
+            'primary_image': lambda queryset: queryset.with_primary_image(),
+        }
 
     def get_in_stock(self, obj):
         return obj.stock_quantity > 0
 
     def get_reviews_count(self, obj):
-        return obj.reviews.count()
+        return obj.rating_count
 
     def get_average_rating(self, obj):
-        summa = 0
-        count = 0
-        for rating in obj.reviews.all():
-            summa += rating.rating
-            count += 1
-
-        return summa / count if count else 0
+        return obj.average_rating
 
+    # primary_image is annotated by Product.objects.with_list_data(); the
+    # fallback covers plain instances.
     def get_primary_image(self, obj):
+        if hasattr(obj, 'primary_image'):
+            return obj.primary_image
         for image in obj.images.all():
             if image.is_primary:
                 return image.image_url
         return None
 
 
+# Same output as ProductListSerializer from values() rows of a queryset
+# annotated with_list_data(), for full (non-sparse) pages.
+product_list_rows = RowSerializer(ProductListSerializer, methods={
+    'in_stock': Method(lambda stock: stock > 0, 'stock_quantity'),
+    'primary_image': 'primary_image',
+    'reviews_count': 'rating_count',
+    'average_rating': 'average_rating',
+})
+
+
 class ProductCreateSerializer(serializers.ModelSerializer):
     category = serializers.PrimaryKeyRelatedField(
         queryset=Category.objects.all()
@@ -66,7 +100,7 @@ class ProductCreateSerializer(serializers.ModelSerializer):
     )
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ('final_price', *Product.RATING_FIELDS)
         extra_kwargs = {
             'slug':{'read_only':True},
             'id':{'read_only':True}}
@@ -103,9 +137,7 @@ class ProductCreateSerializer(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data):
-        name = validated_data.get('name')
-        slug = slugify(name)
-        return Product.objects.create(slug=slug, **validated_data)
+        return slugs.save_with_unique_slug(Product(**validated_data))
 
 
 class InlineImagesSerializer(serializers.ModelSerializer):
@@ -126,44 +158,75 @@ class InlineProductSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug', 'price']
 
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class HighlightField(serializers.CharField):
+    # HTML: the product's text escaped, with the search matches marked.
+    def to_representation(self, value):
+        return search.mark_matches(value)
+
+
+class ProductSearchSerializer(serializers.ModelSerializer):
+    name_highlight = HighlightField(read_only=True)
+    snippet = HighlightField(read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ('id', 'name', 'slug', 'price', 'discount_percentage', 'name_highlight', 'snippet')
+
+
+class ProductDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category = InlineCategorySerializer()
     brand = InlineBrandSerializer()
     images = InlineImagesSerializer(many=True, read_only=True)
     reviews = InlineReviewsSerializer(many=True, read_only=True)
-    final_price = serializers.SerializerMethodField()
+    final_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     in_stock = serializers.SerializerMethodField()
     reviews_count = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
+    rating_histogram = serializers.SerializerMethodField()
     related_products = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = '__all__'
-
-    def get_final_price(self, obj):
-        return Decimal(obj.price) * Decimal((1 - Decimal(obj.discount_percentage) / 100))
+        exclude = Product.RATING_COUNTER_FIELDS
+        field_sources = {
+            'in_stock': ('stock_quantity',),
+            'reviews_count': ('rating_count',),
+            'average_rating': ('average_rating',),
+            'rating_histogram': tuple(f'rating_{rating}_count' for rating in range(1, 6)),
+            'related_products': ('category',),
+        }
 
     def get_in_stock(self, obj):
         return obj.stock_quantity > 0
 
     def get_reviews_count(self, obj):
-        return obj.reviews.count()
+        return obj.rating_count
 
     def get_average_rating(self, obj):
-        summa = 0
-        count = 0
-        for rating in obj.reviews.all():
-            summa += rating.rating
-            count += 1
+        return obj.average_rating
 
-        return summa / count
+    def get_rating_histogram(self, obj):
+        return {str(rating): getattr(obj, f'rating_{rating}_count') for rating in range(1, 6)}
 
+    # related_products may be loaded ahead, as the async detail view does.
     def get_related_products(self, obj):
-        related = Product.objects.filter(category=obj.category).exclude(id=obj.id)[:5]
+        related = getattr(obj, 'related_products', None)
+        if related is None:
+            related = related_products(obj)
         return InlineProductSerializer(related, many=True).data
 
 
+def related_products(product):
+    entries = product.related_entries.filter(related__is_active=True).select_related('related').order_by('rank')[:5]
+    related = [entry.related for entry in entries]
+    if not related:
+        # Not computed yet (see the compute_related_products command).
+        related = list(Product.objects.filter(category_id=product.category_id, is_active=True).exclude(
+            id=product.id
+        ).order_by('price', 'id')[:5])
+    return related
+
+
 class ProductUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
@@ -194,16 +257,15 @@ class ProductUpdateSerializer(serializers.ModelSerializer):
         return discount
 
     def update(self, instance, validated_data):
-        name = validated_data.get('name')
-        instance.slug = slugify(name)
-        instance.save()
-        return instance
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        return slugs.save_with_unique_slug(instance)
 
 
 class ProductPartialUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        exclude = ['id', 'created_at', 'updated_at']
+        exclude = ['id', 'created_at', 'updated_at', 'final_price', *Product.RATING_FIELDS]
         extra_kwargs = {
             'slug':{'read_only':True},
         }
@@ -240,12 +302,7 @@ class ProductPartialUpdateSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         for field, value in validated_data.items():
             setattr(instance, field, value)
-
-        if 'name' in validated_data:
-            instance.slug = slugify(validated_data['name'])
-
-        instance.save()
-        return instance
+        return slugs.save_with_unique_slug(instance)
 
 
 
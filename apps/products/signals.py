@@ -0,0 +1,33 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.products.cache import bump_versions
+from apps.products.categories import invalidate_tree
+from apps.products.models import Brand, Category, Product, ProductImage
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    bump_versions([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def invalidate_image_product(sender, instance, **kwargs):
+    bump_versions([instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+def invalidate_category_products(sender, instance, created, **kwargs):
+    if not created:
+        bump_versions(instance.products.values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_tree(sender, instance, **kwargs):
+    invalidate_tree()
+
+
+@receiver(post_save, sender=Brand)
+def invalidate_brand_products(sender, instance, created, **kwargs):
+    if not created:
+        bump_versions(instance.products.values_list('id', flat=True))
@@ -0,0 +1,114 @@
+import re
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+from apps.products.models import Product, SlugHistory
+
+SLUG_LENGTH = Product._meta.get_field('slug').max_length
+# Leaves room for a '-<counter>' suffix of up to seven digits.
+PREFIX_LENGTH = SLUG_LENGTH - 8
+# Keeps the OR of slug ranges well below SQLite's expression depth limit.
+RANGES_PER_QUERY = 200
+# A conflict means someone committed the same slug in between, and the
+# next allocation sees it, so a few attempts are plenty.
+MAX_ATTEMPTS = 5
+
+
+def base_slug(name):
+    return slugify(name)[:SLUG_LENGTH].strip('-') or 'product'
+
+
+def matches_base(slug, base):
+    """Whether ``slug`` is ``base`` itself or one of its numbered variants."""
+    return slug == base or re.fullmatch(rf'{re.escape(base[:PREFIX_LENGTH])}-\d+', slug or '') is not None
+
+
+def allocate_slugs(names, reserved=()):
+    """
+    Return a unique slug for every name, in order.
+
+    Two queries for a typical batch: the bare slugs that are taken, then the
+    numbered ``<slug>-<n>`` variants of only those, read as index ranges.
+    ``reserved`` slugs are treated as taken too.
+    """
+    bases = [base_slug(name) for name in names]
+    taken = set(reserved)
+    taken.update(Product.objects.filter(slug__in=set(bases)).values_list('slug', flat=True))
+    repeated = Counter(bases)
+    clashing = sorted({base for base in bases if base in taken or repeated[base] > 1})
+    for start in range(0, len(clashing), RANGES_PER_QUERY):
+        # '.' sorts right after '-', so [base-, base.) holds every base-<n>.
+        ranges = Q()
+        for base in clashing[start:start + RANGES_PER_QUERY]:
+            prefix = base[:PREFIX_LENGTH]
+            ranges |= Q(slug__gte=f'{prefix}-', slug__lt=f'{prefix}.')
+        taken.update(Product.objects.filter(ranges).values_list('slug', flat=True))
+
+    slugs = []
+    counters = {}
+    for base in bases:
+        slug = base
+        if slug in taken:
+            counter = counters.get(base, 1)
+            while slug in taken:
+                counter += 1
+                slug = f'{base[:PREFIX_LENGTH]}-{counter}'
+            counters[base] = counter
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def create_with_unique_slugs(products, reserved=()):
+    """
+    Insert ``products`` with slugs allocated from their names.
+
+    The insert runs in a savepoint; if a concurrent writer took one of the
+    slugs meanwhile, the batch is re-allocated and inserted again.
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        for product, slug in zip(products, allocate_slugs([product.name for product in products], reserved)):
+            product.slug = slug
+        try:
+            with transaction.atomic():
+                return Product.objects.bulk_create(products)
+        except IntegrityError:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+
+
+def save_with_unique_slug(product):
+    """
+    Save ``product``, deriving its slug from the name when it is new or renamed.
+
+    A product whose slug still fits its name keeps it. When the slug changes
+    the old one is recorded in SlugHistory so its URLs keep resolving.
+    """
+    base = base_slug(product.name)
+    old_slug = product.slug if product.pk else None
+    if old_slug and matches_base(old_slug, base):
+        product.save()
+        return product
+
+    for attempt in range(MAX_ATTEMPTS):
+        product.slug = allocate_slugs([product.name])[0]
+        try:
+            with transaction.atomic():
+                product.save()
+                if old_slug:
+                    SlugHistory.objects.update_or_create(slug=old_slug, defaults={'product': product})
+            return product
+        except IntegrityError:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+
+
+def resolve(slug):
+    """Return ``(product id, current slug)`` for a current or former slug, or None."""
+    row = Product.objects.filter(slug=slug).values_list('id', 'slug').first()
+    if row is None:
+        row = SlugHistory.objects.filter(slug=slug).values_list('product_id', 'product__slug').first()
+    return row
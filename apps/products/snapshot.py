@@ -0,0 +1,396 @@
+import heapq
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import chain
+
+from django.conf import settings
+
+from apps.products.models import Category, Product
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+# Column: (array typecode, Product field). Rows are kept in id order.
+COLUMNS = {
+    'id': ('q', 'id'),
+    'category': ('q', 'category_id'),
+    'brand': ('q', 'brand_id'),
+    'price': ('d', 'price'),
+    'discount': ('h', 'discount_percentage'),
+    'stock': ('q', 'stock_quantity'),
+    'featured': ('b', 'is_featured'),
+    'rating': ('d', 'average_rating'),
+    'created': ('q', 'created_at'),
+    'active': ('b', 'is_active'),
+    'final_price': ('d', 'final_price'),
+}
+FIELDS = [field for _, field in COLUMNS.values()]
+
+# Ordering fields the snapshot can sort on and the columns holding them.
+ORDERING_COLUMNS = {
+    'id': 'id', 'created_at': 'created', 'price': 'price', 'final_price': 'final_price', 'average_rating': 'rating',
+}
+
+EMPTY = array('q')
+
+
+class PositionRange:
+    # positions[start:stop] without copying them.
+    def __init__(self, positions, start, stop):
+        self.positions = positions
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        positions = self.positions
+        return (positions[index] for index in range(self.start, self.stop))
+
+
+def _micros(value):
+    return (value - EPOCH) // MICROSECOND
+
+
+CONVERTERS = {'price': float, 'final_price': float, 'rating': float, 'created': _micros}
+
+
+class Snapshot:
+    """
+    The product list's filter and sort columns of the catalogue, held in memory as ``array`` columns.
+
+    ``page()`` answers a product list page with the ids to load, so the
+    database only reads the rows of that page by primary key. Orderings are
+    position arrays sorted by their key and the category, brand and featured
+    columns have position lists per value, all built on first use. A page is
+    the first matches of a walk along the ordering from the cursor, or when
+    an indexed filter leaves fewer rows than the walk is expected to read,
+    the best of those candidates. Price orderings only walk the price range.
+    ``refresh()`` applies the products updated since the last one and keeps
+    the built indexes up to date for small batches of changes.
+    """
+
+    def __init__(self):
+        self.columns = {name: array(typecode) for name, (typecode, _) in COLUMNS.items()}
+        self.category_paths = {}
+        self.watermark = None
+        self.built_at = self.refreshed_at = time.monotonic()
+        self.lock = threading.RLock()
+        self._orders = {}
+        self._groups = {}
+        self._max_discount = None
+
+    @classmethod
+    def load(cls, batch_size=5000):
+        """Read the active products into a new snapshot."""
+        snapshot = cls()
+        snapshot.category_paths = dict(Category.objects.values_list('id', 'path'))
+        rows = Product.objects.filter(is_active=True).order_by('id').values_list(*FIELDS, 'updated_at')
+        snapshot.extend(rows.iterator(chunk_size=batch_size))
+        return snapshot
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def extend(self, rows):
+        """Append ``rows`` of ``FIELDS`` plus ``updated_at``, with ids above the last one."""
+        columns = list(self.columns.values())
+        converters = [CONVERTERS.get(name, int) for name in COLUMNS]
+        watermark = self.watermark
+        for row in rows:
+            for column, convert, value in zip(columns, converters, row):
+                column.append(convert(value))
+            if watermark is None or row[-1] > watermark:
+                watermark = row[-1]
+        self.watermark = watermark
+        self._orders.clear()
+        self._groups.clear()
+        self._max_discount = None
+
+    def refresh(self):
+        """
+        Apply the products updated since the watermark and return how many rows were read.
+
+        The watermark is taken back by PRODUCT_SNAPSHOT_REFRESH_LAG seconds,
+        so transactions committing a little after they saved are still seen;
+        rows read twice are simply written again. Deleted products stay
+        until the next full load, the list skips them when loading the page.
+        """
+        rows = Product.objects.order_by('id').values_list(*FIELDS, 'updated_at')
+        if self.watermark is not None:
+            lag = timedelta(seconds=settings.PRODUCT_SNAPSHOT_REFRESH_LAG)
+            rows = rows.filter(updated_at__gte=self.watermark - lag)
+        rows = list(rows)
+        category_paths = dict(Category.objects.values_list('id', 'path'))
+        with self.lock:
+            self.category_paths = category_paths
+            self._apply(rows)
+            self.refreshed_at = time.monotonic()
+        return len(rows)
+
+    def _apply(self, rows):
+        ids = self.columns['id']
+        names = list(COLUMNS)
+        converters = [CONVERTERS.get(name, int) for name in names]
+        # Rebuilding the indexes beats moving every position of a large batch.
+        if len(rows) > max(1000, len(ids) // 100):
+            self._orders.clear()
+            self._groups.clear()
+        for row in rows:
+            record = {name: convert(value) for name, convert, value in zip(names, converters, row)}
+            if self._max_discount is not None:
+                self._max_discount = max(self._max_discount, record['discount'])
+            position = bisect_left(ids, record['id'])
+            if position < len(ids) and ids[position] == record['id']:
+                self._unindex(position)
+                for name, value in record.items():
+                    self.columns[name][position] = value
+                self._index(position)
+            elif record['active']:
+                if position < len(ids):
+                    # An id below the last one shifts every later position.
+                    self._orders.clear()
+                    self._groups.clear()
+                for name, value in record.items():
+                    self.columns[name].insert(position, value)
+                self._index(position)
+            if self.watermark is None or row[-1] > self.watermark:
+                self.watermark = row[-1]
+
+    def build_indexes(self, orderings=()):
+        """Build the indexes of the filters and of ``orderings`` now rather than on first use."""
+        with self.lock:
+            for ordering in orderings:
+                self._order(tuple(ORDERING_COLUMNS[field.lstrip('-')] for field in ordering))
+            self._order(('final_price', 'id'))
+            for name in ('category', 'brand', 'featured'):
+                self._group(name)
+
+    def _key(self, names):
+        columns = [self.columns[name] for name in names]
+        if len(columns) == 2:
+            first, second = columns
+            return lambda position: (first[position], second[position])
+        return lambda position: tuple(column[position] for column in columns)
+
+    def _order(self, names):
+        # Positions sorted by the ``names`` columns, the last one being id.
+        order = self._orders.get(names)
+        if order is None:
+            order = self._orders[names] = array('q', sorted(range(len(self)), key=self._key(names)))
+        return order
+
+    def _group(self, name):
+        # {value: ascending positions with that value in column ``name``}
+        groups = self._groups.get(name)
+        if groups is None:
+            groups = self._groups[name] = {}
+            for position, value in enumerate(self.columns[name]):
+                groups.setdefault(value, array('q')).append(position)
+        return groups
+
+    def _unindex(self, position):
+        for names, order in self._orders.items():
+            key = self._key(names)
+            del order[bisect_left(order, key(position), key=key)]
+        for name, groups in self._groups.items():
+            positions = groups[self.columns[name][position]]
+            del positions[bisect_left(positions, position)]
+
+    def _index(self, position):
+        for names, order in self._orders.items():
+            insort(order, position, key=self._key(names))
+        for name, groups in self._groups.items():
+            insort(groups.setdefault(self.columns[name][position], array('q')), position)
+
+    def page(self, filters, ordering, reverse, position, limit):
+        """
+        Return the ids of the first ``limit`` products matching ``filters`` after ``position`` in ``ordering``.
+
+        ``filters`` is the validated data of a ProductFilter and the rest
+        comes from a keyset pagination, ``reverse`` walking the ordering
+        backwards. Returns None for what the snapshot can not answer: text
+        searches and orderings on other fields or in mixed directions.
+        """
+        names = tuple(ORDERING_COLUMNS.get(field.lstrip('-')) for field in ordering)
+        if 's' in filters or None in names or names[-1] != 'id':
+            return None
+        if len({field.startswith('-') for field in ordering}) != 1:
+            return None
+        descending = ordering[0].startswith('-') != reverse
+        after = None
+        if position is not None:
+            after = tuple(CONVERTERS.get(name, int)(value) for name, value in zip(names, position))
+
+        with self.lock:
+            key = self._key(names)
+            matches = self._predicate(filters)
+            indexed = self._indexed(filters)
+            bounds = self._bounds(names[0], filters)
+            # The rows a walk reads before ``limit`` matches, when the filters are independent.
+            walk = limit
+            for name, parts in indexed.items():
+                if not (bounds and name == 'price'):
+                    walk *= len(self) / max(sum(len(part) for part in parts), 0.5)
+            narrowest = min(indexed.values(), key=lambda parts: sum(len(part) for part in parts), default=None)
+            if narrowest is not None and sum(len(part) for part in narrowest) < min(walk, len(self)):
+                candidates = filter(matches, chain.from_iterable(narrowest))
+                if after is not None:
+                    candidates = (p for p in candidates if (key(p) < after if descending else key(p) > after))
+                best = heapq.nlargest if descending else heapq.nsmallest
+                chosen = best(limit, candidates, key=key)
+            else:
+                chosen = self._walk(names, key, matches, descending, after, bounds, limit)
+            ids = self.columns['id']
+            return [ids[position] for position in chosen]
+
+    def _walk(self, names, key, matches, descending, after, bounds, limit):
+        # The first matches along the ordering from the cursor, within the price bounds.
+        order = self._order(names)
+        low, high = 0, len(order)
+        if bounds:
+            minimum, maximum = bounds
+            if minimum is not None:
+                low = bisect_left(order, (minimum,), key=key)
+            if maximum is not None:
+                high = bisect_right(order, (maximum, float('inf')), key=key)
+        if descending:
+            if after is not None:
+                high = min(high, bisect_left(order, after, key=key))
+            indexes = range(high - 1, low - 1, -1)
+        else:
+            if after is not None:
+                low = max(low, bisect_right(order, after, key=key))
+            indexes = range(low, high)
+        chosen = []
+        for position in filter(matches, (order[index] for index in indexes)):
+            chosen.append(position)
+            if len(chosen) == limit:
+                break
+        return chosen
+
+    def _bounds(self, column, filters):
+        # (min, max) of ``column`` implied by the price filters, for an
+        # ordering starting with it; None when it is not a price column.
+        if column not in ('price', 'final_price') or not ('min_price' in filters or 'max_price' in filters):
+            return None
+        minimum = maximum = None
+        if 'min_price' in filters:
+            minimum = float(filters['min_price'])
+        if 'max_price' in filters:
+            maximum = float(filters['max_price'])
+            if column == 'price':
+                # A list price discounted to at most max_price once rounded to
+                # the cent; a little higher than exact so float error never
+                # hides a product.
+                if self._max_discount is None:
+                    self._max_discount = max(self.columns['discount'], default=0)
+                maximum = None if self._max_discount >= 100 else (
+                    (maximum + 0.005) * 100 / (100 - self._max_discount) * (1 + 1e-9)
+                )
+        return minimum, maximum
+
+    def _categories(self, category_ids):
+        # The ids of the categories in the subtrees of ``category_ids``.
+        paths = tuple(self.category_paths[pk] for pk in category_ids if pk in self.category_paths)
+        if not paths:
+            return frozenset()
+        return frozenset(pk for pk, path in self.category_paths.items() if path.startswith(paths))
+
+    def _predicate(self, filters):
+        # One generated function testing a position against all the filters.
+        conditions = ['active[p]']
+        namespace = dict(self.columns)
+        if 'cat_id' in filters:
+            namespace['categories'] = self._categories(filters['cat_id'])
+            conditions.append('category[p] in categories')
+        if 'brand_id' in filters:
+            namespace['brands'] = frozenset(filters['brand_id'])
+            conditions.append('brand[p] in brands')
+        if 'min_price' in filters:
+            namespace['min_price'] = float(filters['min_price'])
+            conditions.append('price[p] >= min_price and final_price[p] >= min_price')
+        if 'max_price' in filters:
+            namespace['max_price'] = float(filters['max_price'])
+            conditions.append('final_price[p] <= max_price')
+        if 'is_featured' in filters:
+            conditions.append(f'featured[p] == {int(filters["is_featured"])}')
+        if 'in_stock' in filters:
+            conditions.append('stock[p] > 0' if filters['in_stock'] else 'stock[p] <= 0')
+        if 'min_rating' in filters:
+            namespace['min_rating'] = filters['min_rating']
+            conditions.append('rating[p] >= min_rating')
+        return eval(f'lambda p: {" and ".join(conditions)}', namespace)
+
+    def _indexed(self, filters):
+        # {filter: position lists} of the filters with an index, the union
+        # of the lists being the rows that pass that filter.
+        indexed = {}
+        if 'cat_id' in filters:
+            groups = self._group('category')
+            indexed['cat_id'] = [groups.get(pk, EMPTY) for pk in self._categories(filters['cat_id'])]
+        if 'brand_id' in filters:
+            groups = self._group('brand')
+            indexed['brand_id'] = [groups.get(pk, EMPTY) for pk in filters['brand_id']]
+        if filters.get('is_featured'):
+            indexed['is_featured'] = [self._group('featured').get(1, EMPTY)]
+        if 'min_price' in filters or 'max_price' in filters:
+            order = self._order(('final_price', 'id'))
+            key = self._key(('final_price', 'id'))
+            low = 0 if 'min_price' not in filters else bisect_left(order, (float(filters['min_price']),), key=key)
+            high = len(order)
+            if 'max_price' in filters:
+                high = bisect_right(order, (float(filters['max_price']), float('inf')), key=key)
+            indexed['price'] = [PositionRange(order, low, max(low, high))]
+        return indexed
+
+    def memory_usage(self):
+        """Return ``{name: bytes}`` for the columns and the indexes built so far."""
+        usage = {name: sys.getsizeof(column) for name, column in self.columns.items()}
+        for names, order in self._orders.items():
+            usage[f'order:{",".join(names)}'] = sys.getsizeof(order)
+        for name, groups in self._groups.items():
+            usage[f'group:{name}'] = sys.getsizeof(groups) + sum(
+                sys.getsizeof(positions) for positions in groups.values()
+            )
+        return usage
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def get_snapshot():
+    """
+    Return this process's snapshot, or None when PRODUCT_SNAPSHOT_ENABLED is off.
+
+    The first call loads it; later ones refresh it once it is older than
+    PRODUCT_SNAPSHOT_REFRESH_INTERVAL seconds and load it again from
+    scratch every PRODUCT_SNAPSHOT_RELOAD_INTERVAL seconds, which drops
+    deleted products and compacts the columns.
+    """
+    global _snapshot
+    if not settings.PRODUCT_SNAPSHOT_ENABLED:
+        return None
+    snapshot = _snapshot
+    now = time.monotonic()
+    if snapshot is not None and now - snapshot.refreshed_at < settings.PRODUCT_SNAPSHOT_REFRESH_INTERVAL:
+        return snapshot
+    with _lock:
+        if _snapshot is None or now - _snapshot.built_at >= settings.PRODUCT_SNAPSHOT_RELOAD_INTERVAL:
+            _snapshot = Snapshot.load()
+        elif now - _snapshot.refreshed_at >= settings.PRODUCT_SNAPSHOT_REFRESH_INTERVAL:
+            _snapshot.refresh()
+        return _snapshot
+
+
+def clear_snapshot():
+    """Drop this process's snapshot, the next get_snapshot() loads it again."""
+    global _snapshot
+    with _lock:
+        _snapshot = None
@@ -1,3 +1,936 @@
-from django.test import TestCase
+import datetime
+import json
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APITestCase
+
+from apps.orders.models import Cart, CartItem, Order, OrderItem
+from apps.products import cache, categories, related, slugs, snapshot, transfer
+from apps.products.models import Brand, Category, Product, ProductImage, RelatedProduct
+from apps.products.serializers import ProductListSerializer
+from apps.reviews.models import ProductReview
+from core import parsers, profiling
+from core.renderers import JSONRenderer, stream_list
+
+User = get_user_model()
+
+
+class ProductListAPITest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Phones', slug='phones', description='Phones')
+        cls.brand = Brand.objects.create(name='Acme', logo='https://example.com/acme.png', description='Acme')
+        cls.users = [User.objects.create_user(username=f'user{i}') for i in range(3)]
+        for i in range(10):
+            product = Product.objects.create(
+                name=f'Phone {i}', slug=f'phone-{i}', description='A phone',
+                category=cls.category, brand=cls.brand, price='100.00', stock_quantity=5,
+            )
+            ProductImage.objects.create(product=product, image_url=f'https://example.com/{i}-b.png', order=1)
+            ProductImage.objects.create(product=product, image_url=f'https://example.com/{i}.png',
+                                        is_primary=True, order=0)
+            for rating, user in zip((5, 4, 3), cls.users[:i % 4]):
+                ProductReview.objects.create(product=product, user=user, rating=rating, title='t', comment='c')
+
+    def test_list_query_count_is_fixed(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/products/', {'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_fast_path_matches_serializer_output(self):
+        Product.objects.create(name='Odd', slug='odd', description='-', category=self.category, brand=self.brand,
+                               price='19.99', discount_percentage=15, stock_quantity=0)
+        response = self.client.get('/products/', {'page_size': 100})
+        ids = [row['id'] for row in response.data['results']]
+        products = sorted(Product.objects.with_list_data().filter(id__in=ids), key=lambda p: ids.index(p.id))
+        expected = renderers.JSONRenderer().render(ProductListSerializer(products, many=True).data)
+        self.assertTrue(response.content.endswith(b'"results":' + expected + b'}'))
+
+    def test_keyset_pages(self):
+        seen = []
+        url = '/products/?page_size=3'
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+        response = self.client.get('/products/', {'page_size': 3, 'sort': 'price'})
+        second = self.client.get(response.data['next'])
+        previous = self.client.get(second.data['previous'])
+        self.assertEqual(previous.data['results'], response.data['results'])
+        self.assertIsNone(previous.data['previous'])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/products/', {'cursor': 'garbage'}).status_code, 404)
+
+    def test_list_annotations(self):
+        response = self.client.get('/products/', {'page_size': 100})
+        rows = {row['slug']: row for row in response.data['results']}
+        self.assertEqual(rows['phone-0']['reviews_count'], 0)
+        self.assertEqual(rows['phone-0']['average_rating'], 0)
+        self.assertEqual(rows['phone-3']['reviews_count'], 3)
+        self.assertEqual(rows['phone-3']['average_rating'], 4)
+        self.assertEqual(rows['phone-2']['primary_image'], 'https://example.com/2.png')
+        self.assertEqual(rows['phone-2']['category']['slug'], 'phones')
+
+    def test_sparse_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/products/', {'fields': 'id,name,final_price,primary_image', 'page_size': 3})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'final_price', 'primary_image'})
+        [query] = queries.captured_queries
+        self.assertNotIn('description', query['sql'])
+        self.assertNotIn('products_category', query['sql'])
+
+        with self.assertNumQueries(1):
+            page = self.client.get(response.data['next'])
+        self.assertEqual(len(page.data['results']), 3)
+
+    def test_expand(self):
+        row = self.client.get('/products/', {'fields': 'id,category'}).data['results'][0]
+        self.assertEqual(row['category'], self.category.id)
+        row = self.client.get('/products/', {'fields': 'id', 'expand': 'category'}).data['results'][0]
+        self.assertEqual(row['category']['slug'], 'phones')
+
+        self.assertEqual(self.client.get('/products/', {'fields': 'id,secret'}).status_code, 400)
+        self.assertEqual(self.client.get('/products/', {'expand': 'name'}).status_code, 400)
+
+    def test_sparse_detail(self):
+        product = Product.objects.get(slug='phone-3')
+        cache.get_cache().clear()
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/products/{product.id}/', {'fields': 'id,name,images'})
+        self.assertEqual(set(response.data), {'id', 'name', 'images'})
+        self.assertEqual(len(response.data['images']), 2)
+        full = self.client.get(f'/products/{product.id}/')
+        self.assertEqual(len(full.data['reviews']), 3)
+        self.assertNotEqual(full['ETag'], response['ETag'])
+
+
+class ProductFilterAPITest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.electronics = Category.objects.create(name='Electronics', slug='electronics', description='-')
+        cls.phones = Category.objects.create(name='Phones', slug='phones', description='-', parent=cls.electronics)
+        cls.books = Category.objects.create(name='Books', slug='books', description='-')
+        cls.acme = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        cls.other = Brand.objects.create(name='Other', logo='https://example.com/o.png', description='-')
+
+        def make(slug, category, brand, price, **kwargs):
+            return Product.objects.create(name=slug, slug=slug, description=f'{slug} description',
+                                          category=category, brand=brand, price=price, **kwargs)
+
+        make('tv', cls.electronics, cls.acme, '500.00', stock_quantity=1)
+        make('phone', cls.phones, cls.acme, '300.00', discount_percentage=50, is_featured=True)
+        make('phone-other', cls.phones, cls.other, '300.00', stock_quantity=3)
+        make('novel', cls.books, cls.acme, '20.00', stock_quantity=3)
+        make('hidden', cls.phones, cls.acme, '300.00', is_active=False)
+
+    def setUp(self):
+        cache.get_cache().clear()
+
+    def slugs(self, **params):
+        response = self.client.get('/products/', {'page_size': 100, **params})
+        if response.status_code == 404:
+            return set()
+        self.assertEqual(response.status_code, 200)
+        return {row['slug'] for row in response.data['results']}
+
+    def test_category_includes_descendants(self):
+        self.assertEqual(self.slugs(cat_id=self.electronics.id), {'tv', 'phone', 'phone-other'})
+        self.assertEqual(self.slugs(cat_id=self.phones.id), {'phone', 'phone-other'})
+
+    def test_filters_are_combined(self):
+        self.assertEqual(self.slugs(brand_id=self.acme.id, min_price='100'), {'tv', 'phone'})
+        self.assertEqual(self.slugs(brand_id=self.acme.id, cat_id=self.phones.id, is_featured='true'), {'phone'})
+        self.assertEqual(self.slugs(in_stock='true', s='phone'), {'phone-other'})
+
+    def test_price_range_uses_discounted_price(self):
+        self.assertEqual(self.slugs(min_price='100', max_price='200'), {'phone'})
+        self.assertEqual(self.slugs(min_price='200', max_price='400'), {'phone-other'})
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/products/', {'brand_id': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/products/', {'brand_id': '1,0'}).status_code, 400)
+        self.assertEqual(self.client.get('/products/', {'min_price': '5', 'max_price': '1'}).status_code, 400)
+        self.assertEqual(self.client.get('/products/facets/', {'cat_id': 'x'}).status_code, 400)
+
+    def test_multi_select(self):
+        self.assertEqual(self.slugs(brand_id=f'{self.acme.id},{self.other.id}', cat_id=self.phones.id),
+                         {'phone', 'phone-other'})
+        self.assertEqual(self.slugs(cat_id=f'{self.phones.id},{self.books.id}'), {'phone', 'phone-other', 'novel'})
+        self.assertEqual(self.slugs(cat_id='999'), set())
+
+    def test_facets(self):
+        response = self.client.get('/products/facets/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 4)
+        self.assertEqual([(row['name'], row['count']) for row in data['brands']], [('Acme', 3), ('Other', 1)])
+        self.assertEqual([(row['name'], row['count']) for row in data['categories']],
+                         [('Electronics', 3), ('Phones', 2), ('Books', 1)])
+        self.assertEqual([row['count'] for row in data['price']], [1, 0, 0, 1, 1, 1, 0])
+        self.assertEqual(data['price'][3], {'min': '100', 'max': '250', 'count': 1})
+        self.assertEqual((data['is_featured'], data['in_stock']), (1, 3))
+
+    def test_facets_leave_out_their_own_filter(self):
+        params = {'brand_id': self.acme.id, 'cat_id': self.phones.id}
+        # The category lookup, two grouped counts and the category and brand names.
+        with self.assertNumQueries(5):
+            data = self.client.get('/products/facets/', params).json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual([(row['name'], row['count']) for row in data['brands']], [('Acme', 1), ('Other', 1)])
+        self.assertEqual([(row['name'], row['count']) for row in data['categories']],
+                         [('Electronics', 2), ('Phones', 1), ('Books', 1)])
+        self.assertEqual([row['count'] for row in data['price']], [0, 0, 0, 1, 0, 0, 0])
+        self.assertEqual((data['is_featured'], data['in_stock']), (1, 0))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/products/facets/', params).json(), data)
+        data = self.client.get('/products/facets/', {**params, 'min_price': '200', 's': 'phone'}).json()
+        self.assertEqual((data['count'], data['brands']), (0, [{'id': self.other.id, 'name': 'Other', 'count': 1}]))
+        self.assertEqual([row['count'] for row in data['price']], [0, 0, 0, 1, 0, 0, 0])
+
+
+class ProductSortTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones', description='-')
+        brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        rows = [
+            # slug, price, discount, average rating, ratings, units sold
+            ('a', '100', 50, 4.5, 2, 7),
+            ('b', '60.00', 0, 3.0, 9, 7),
+            ('c', '80.00', 30, 4.5, 1, 0),
+            ('d', '99.99', 10, 0, 0, 12),
+            ('e', '55.50', 0, 5.0, 4, 1),
+        ]
+        for slug, price, discount, rating, ratings, sold in rows:
+            Product.objects.create(name=slug, slug=slug, description='-', category=category, brand=brand,
+                                   price=price, discount_percentage=discount, average_rating=rating,
+                                   rating_count=ratings, units_sold=sold)
+        cls.ids = dict(Product.objects.values_list('slug', 'id'))
+
+    def sorted_slugs(self, sort):
+        slugs = []
+        url, params = '/products/', {'page_size': 2, 'sort': sort}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            slugs.extend(row['slug'] for row in response.data['results'])
+            url, params = response.data['next'], None
+        return slugs
+
+    def test_sorts(self):
+        # Final prices: a 50, b 60, c 56, d 89.99, e 55.50.
+        self.assertEqual(self.sorted_slugs('final_price'), ['a', 'e', 'c', 'b', 'd'])
+        self.assertEqual(self.sorted_slugs('-final_price'), ['d', 'b', 'c', 'e', 'a'])
+        self.assertEqual(self.sorted_slugs('top_rated'), ['e', 'c', 'a', 'b', 'd'])
+        self.assertEqual(self.sorted_slugs('most_reviewed'), ['b', 'e', 'a', 'c', 'd'])
+        self.assertEqual(self.sorted_slugs('bestseller'), ['d', 'b', 'a', 'e', 'c'])
+
+    def test_whole_prices_are_discounted_exactly(self):
+        # 100 stored as an integer still comes to 50 rather than 50 rounded down by integer division.
+        response = self.client.get('/products/', {'min_price': '50', 'max_price': '50', 'sort': 'final_price'})
+        self.assertEqual([row['slug'] for row in response.data['results']], ['a'])
+        response = self.client.get('/products/', {'min_price': '55.6', 'max_price': '60'})
+        self.assertEqual({row['slug'] for row in response.data['results']}, {'b', 'c'})
+
+    def test_rebuild_units_sold(self):
+        user = User.objects.create_user(username='buyer')
+        orders = [Order.objects.create(user=user, order_number=f'A{i}', total_amount='10.00', status=status,
+                                       shipping_address='Somewhere 1', phone='+998900000000')
+                  for i, status in enumerate(('delivered', 'cancelled'))]
+        for order in orders:
+            OrderItem.objects.create(order=order, product_id=self.ids['c'], quantity=3, price='80.00')
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_units_sold', '--verify', stdout=out)
+        call_command('rebuild_units_sold', stdout=out)
+        self.assertIn('5 product(s) updated', out.getvalue())
+        self.assertEqual(dict(Product.objects.values_list('slug', 'units_sold')),
+                         {'a': 0, 'b': 0, 'c': 3, 'd': 0, 'e': 0})
+
+
+class ProductPricingTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones', description='-')
+        brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        cls.prices = {}
+        for slug, price, discount in [('half', '0.05', 50), ('round-down', '99.99', 15), ('whole', '100', 33),
+                                      ('round-up', '1.15', 50), ('full', '12.34', 0), ('free', '9.99', 100)]:
+            product = Product.objects.create(name=slug, slug=slug, description='-', category=category, brand=brand,
+                                             price=price, discount_percentage=discount, stock_quantity=5)
+            cls.prices[slug] = product.final_price
+
+    def test_final_price_is_rounded_half_up_to_the_cent(self):
+        expected = {'half': '0.03', 'round-down': '84.99', 'whole': '67.00', 'round-up': '0.58', 'full': '12.34',
+                    'free': '0.00'}
+        self.assertEqual({slug: str(price) for slug, price in self.prices.items()}, expected)
+        self.assertEqual({slug: str(price) for slug, price in Product.objects.values_list('slug', 'final_price')},
+                         expected)
+        rows = self.client.get('/products/', {'page_size': 100}).data['results']
+        self.assertEqual({row['slug']: row['final_price'] for row in rows}, expected)
+        product = Product.objects.get(slug='round-down')
+        self.assertEqual(self.client.get(f'/products/{product.id}/').data['final_price'], '84.99')
+
+        product.discount_percentage = 20
+        product.save()
+        self.assertEqual(Product.objects.get(pk=product.pk).final_price, Decimal('79.99'))
+
+    def test_filters_match_the_stored_price(self):
+        response = self.client.get('/products/', {'min_price': '84.99', 'max_price': '84.99'})
+        self.assertEqual([row['slug'] for row in response.data['results']], ['round-down'])
+        response = self.client.get('/products/', {'max_price': '0.58', 'sort': 'final_price'})
+        self.assertEqual([row['slug'] for row in response.data['results']], ['free', 'half', 'round-up'])
+
+
+class CategoryTreeTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.electronics = Category.objects.create(name='Electronics', slug='electronics', description='-')
+        cls.phones = Category.objects.create(name='Phones', slug='phones', description='-', parent=cls.electronics)
+        cls.android = Category.objects.create(name='Android', slug='android', description='-', parent=cls.phones)
+        cls.books = Category.objects.create(name='Books', slug='books', description='-')
+        brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        for slug, category in (('tv', cls.electronics), ('pixel', cls.android), ('novel', cls.books)):
+            Product.objects.create(name=slug, slug=slug, description='-', category=category, brand=brand,
+                                   price='10.00')
+
+    def setUp(self):
+        cache.get_cache().clear()
+
+    def test_paths_follow_the_tree(self):
+        self.assertEqual(self.android.path, f'/{self.electronics.id}/{self.phones.id}/{self.android.id}/')
+        self.assertEqual(self.android.depth, 2)
+        self.assertEqual(set(self.electronics.descendants()), {self.phones, self.android})
+        self.assertEqual(list(self.android.ancestors()), [self.electronics, self.phones])
+        self.assertEqual(self.electronics.product_count(), 2)
+
+    def test_move_updates_the_subtree(self):
+        self.phones.parent = self.books
+        self.phones.save()
+        self.android.refresh_from_db()
+        self.assertEqual(self.android.path, f'/{self.books.id}/{self.phones.id}/{self.android.id}/')
+        self.assertEqual(self.books.product_count(), 2)
+
+        self.books.parent = self.android
+        with self.assertRaises(ValidationError):
+            self.books.save()
+
+    def test_tree_is_cached(self):
+        response = self.client.get('/products/categories/')
+        self.assertEqual(response.status_code, 200)
+        electronics = response.json()[1]
+        self.assertEqual((electronics['name'], electronics['product_count']), ('Electronics', 2))
+        self.assertEqual(electronics['children'][0]['children'][0]['slug'], 'android')
+
+        with self.assertNumQueries(0):
+            self.client.get('/products/categories/')
+
+        Category.objects.create(name='Toys', slug='toys', description='-')
+        self.assertEqual(len(self.client.get('/products/categories/').json()), 3)
+
+    def test_detail_has_breadcrumbs(self):
+        response = self.client.get(f'/products/categories/{self.android.id}/')
+        self.assertEqual([row['slug'] for row in response.data['breadcrumbs']], ['electronics', 'phones', 'android'])
+        self.assertEqual(response.data['product_count'], 1)
+
+
+class ProductSearchTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Phones', slug='phones', description='-')
+        cls.brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        Product.objects.create(name='Leather case', slug='case', description='Fits every smartphone model',
+                               category=cls.category, brand=cls.brand, price='10.00')
+        Product.objects.create(name='Smartphone X', slug='smartphone-x', description='A fast phone',
+                               category=cls.category, brand=cls.brand, price='500.00')
+        Product.objects.create(name='Smartphone Old', slug='smartphone-old', description='Retired',
+                               category=cls.category, brand=cls.brand, price='50.00', is_active=False)
+
+    def slugs(self, **params):
+        response = self.client.get('/products/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['slug'] for row in response.data['results']]
+
+    def test_ranked_prefix_search(self):
+        self.assertEqual(self.slugs(s='smartph'), ['smartphone-x', 'case'])
+        self.assertEqual(self.slugs(s='smartphone fast'), ['smartphone-x'])
+        self.assertEqual(self.slugs(s='smartphone', sort='price'), ['case', 'smartphone-x'])
+
+    def test_index_follows_api_writes(self):
+        payload = {'name': 'Tablet Pro', 'description': 'Large screen device', 'category': self.category.id,
+                   'brand': self.brand.id, 'price': '300.00'}
+        created = self.client.post('/products/create/', payload, format='json')
+        self.assertEqual(created.status_code, 201)
+        self.assertEqual(self.slugs(s='tablet'), ['tablet-pro'])
+
+        product_id = created.data['id']
+        response = self.client.patch(f'/products/{product_id}/partial-update/', {'name': 'Reader'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/products/', {'s': 'tablet'}).status_code, 404)
+        self.assertEqual(self.slugs(s='reader'), ['reader'])
+
+    def test_search_endpoint_highlights(self):
+        response = self.client.get('/products/search/', {'q': 'smartphone'})
+        first, second = response.data['results']
+        self.assertEqual(first['name_highlight'], '<mark>Smartphone</mark> X')
+        self.assertIn('<mark>smartphone</mark>', second['snippet'])
+        self.assertEqual(self.client.get('/products/search/').status_code, 400)
+
+    def test_highlights_escape_product_text(self):
+        Product.objects.create(name='<img src=x onerror=alert(1)> Gadget', slug='xss', description='A "gadget" & more',
+                               category=self.category, brand=self.brand, price='1.00')
+        result, = self.client.get('/products/search/', {'q': 'gadget'}).data['results']
+        self.assertEqual(result['name_highlight'], '&lt;img src=x onerror=alert(1)&gt; <mark>Gadget</mark>')
+        self.assertEqual(result['snippet'], 'A &quot;<mark>gadget</mark>&quot; &amp; more')
+
+
+class ProductDetailCacheTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Phones', slug='phones', description='-')
+        cls.brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        cls.product = Product.objects.create(name='Phone', slug='phone', description='-', category=cls.category,
+                                             brand=cls.brand, price='10.00')
+        cls.user = User.objects.create_user(username='reviewer')
+
+    def setUp(self):
+        cache.get_cache().clear()
+
+    def detail(self, **headers):
+        return self.client.get(f'/products/{self.product.id}/', headers=headers)
+
+    def test_cached_detail_and_etag(self):
+        first = self.detail()
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.detail()
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+        with self.assertNumQueries(0):
+            not_modified = self.detail(if_none_match=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_invalidation(self):
+        changes = [
+            lambda: Product.objects.filter(pk=self.product.pk).first().save(),
+            lambda: ProductImage.objects.create(product=self.product, image_url='https://example.com/1.png'),
+            lambda: ProductReview.objects.create(product=self.product, user=self.user, rating=4, title='t',
+                                                 comment='c'),
+            lambda: Category.objects.filter(pk=self.category.pk).first().save(),
+            lambda: Brand.objects.filter(pk=self.brand.pk).first().save(),
+        ]
+        etag = self.detail()['ETag']
+        for change in changes:
+            change()
+            response = self.detail(if_none_match=etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+        self.assertEqual(response.data['reviews_count'], 1)
+        self.assertEqual(len(response.data['images']), 1)
+
+    def test_missing_product(self):
+        self.assertEqual(self.client.get('/products/999/').status_code, 404)
+
+    def test_file_based_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+            with self.settings(CACHES={'default': backend}):
+                first = self.detail()
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.detail().data, first.data)
+                self.product.save()
+                self.assertNotEqual(self.detail()['ETag'], first['ETag'])
+
+    def test_single_flight(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.05)
+            return {'ok': True}
+
+        threads = [threading.Thread(target=cache.get_or_build, args=('single-flight', build)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+
+
+class RelatedProductsTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        phones = Category.objects.create(name='Phones', slug='phones', description='-')
+        cases = Category.objects.create(name='Cases', slug='cases', description='-')
+        acme = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        other = Brand.objects.create(name='Other', logo='https://example.com/o.png', description='-')
+
+        def make(slug, category, brand, price, **kwargs):
+            return Product.objects.create(name=slug, slug=slug, description='-', category=category, brand=brand,
+                                          price=price, **kwargs)
+
+        cls.phone = make('phone', phones, acme, '500.00')
+        cls.similar = make('similar', phones, acme, '520.00')
+        cls.cheap = make('cheap', phones, other, '50.00')
+        cls.hidden = make('hidden', phones, acme, '500.00', is_active=False)
+        cls.case = make('case', cases, other, '20.00')
+        cls.unrelated = make('unrelated', cases, other, '25.00')
+
+        buyer = User.objects.create_user(username='buyer')
+        for i in range(3):
+            order = Order.objects.create(user=buyer, order_number=f'N{i}', total_amount='1.00',
+                                         shipping_address='-', phone='-')
+            OrderItem.objects.create(order=order, product=cls.phone, quantity=1, price='500.00')
+            OrderItem.objects.create(order=order, product=cls.case, quantity=1, price='20.00')
+            OrderItem.objects.create(order=order, product=cls.hidden, quantity=1, price='500.00')
+
+    def test_ranking(self):
+        self.assertEqual(related.recompute(top_n=3), 5)
+        ranked = list(RelatedProduct.objects.filter(product=self.phone).order_by('rank')
+                      .values_list('related__slug', flat=True))
+        self.assertEqual(ranked, ['case', 'similar', 'cheap'])
+        self.assertEqual(list(RelatedProduct.objects.filter(product=self.case).order_by('rank')
+                              .values_list('related__slug', flat=True)), ['phone', 'unrelated'])
+
+    def test_detail_reads_stored_rows(self):
+        call_command('compute_related_products', '--product', str(self.phone.id), stdout=StringIO())
+        self.assertFalse(RelatedProduct.objects.filter(product=self.similar).exists())
+        response = self.client.get(f'/products/{self.phone.id}/')
+        self.assertEqual([row['slug'] for row in response.data['related_products']], ['case', 'similar', 'cheap'])
+
+        response = self.client.get(f'/products/{self.similar.id}/')
+        self.assertEqual([row['slug'] for row in response.data['related_products']], ['cheap', 'phone'])
+
+
+class ProductTransferTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', is_staff=True)
+        cls.category = Category.objects.create(name='Phones', slug='phones', description='-')
+        cls.brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        cls.existing = Product.objects.create(name='Old', slug='phone-x', description='-', category=cls.category,
+                                              brand=cls.brand, price='1.00')
+        ProductImage.objects.create(product=cls.existing, image_url='https://example.com/old.png')
+
+    def import_jsonl(self, *rows):
+        self.client.force_authenticate(self.admin)
+        upload = SimpleUploadedFile('products.jsonl', ''.join(f'{json.dumps(row)}\n' for row in rows).encode())
+        return self.client.post('/products/import/', {'file': upload})
+
+    def test_import_upserts_and_reports_errors(self):
+        row = {'name': 'Phone X', 'description': 'Fast', 'category': 'phones', 'brand': 'Acme', 'price': '499.90',
+               'images': ['https://example.com/1.png', 'https://example.com/2.png']}
+        response = self.import_jsonl(
+            {**row, 'slug': 'phone-x', 'stock_quantity': 4},
+            {**row, 'images': []},
+            {**row, 'name': 'Phone X'},
+            {**row, 'slug': 'bad', 'category': 'missing', 'price': '-1'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated']), (2, 1))
+        self.assertEqual(response.data['errors'], [{'line': 4, 'errors': {
+            'category': ["Category 'missing' does not exist."], 'price': ['Price must be positive number!'],
+        }}])
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.stock_quantity), ('Phone X', 4))
+        self.assertEqual(list(self.existing.images.order_by('order').values_list('image_url', 'is_primary')),
+                         [('https://example.com/1.png', True), ('https://example.com/2.png', False)])
+        self.assertEqual(set(Product.objects.filter(name='Phone X').values_list('slug', flat=True)),
+                         {'phone-x', 'phone-x-2', 'phone-x-3'})
+
+    def test_failing_row_does_not_fail_the_chunk(self):
+        row = {'name': 'Phone', 'description': '-', 'category': 'phones', 'brand': 'Acme', 'price': '9.99'}
+        set_stock = transfer.set_stock
+
+        def rejecting_set_stock(levels, **kwargs):
+            if 13 in levels.values():
+                raise IntegrityError('CHECK constraint failed')
+            return set_stock(levels, **kwargs)
+
+        with mock.patch.object(transfer, 'set_stock', rejecting_set_stock):
+            response = self.import_jsonl(
+                {**row, 'slug': 'phone-x', 'stock_quantity': 2},
+                {**row, 'slug': 'phone-y', 'stock_quantity': 13},
+                {**row, 'stock_quantity': 3},
+            )
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1))
+        self.assertEqual(response.data['errors'], [{'line': 2, 'errors': {
+            'non_field_errors': ['CHECK constraint failed'],
+        }}])
+        self.assertEqual(sorted(Product.objects.values_list('slug', 'stock_quantity')),
+                         [('phone', 3), ('phone-x', 2)])
+
+    def test_export_round_trips(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/products/export/', {'file_format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        exported = b''.join(response.streaming_content)
+        self.assertIn(b'phone-x,Old,-,phones,Acme,1.00,0,0,False,True,https://example.com/old.png', exported)
+
+        result = transfer.import_products(BytesIO(exported), 'csv')
+        self.assertEqual((result.created, result.updated, result.error_count), (0, 1, 0))
+
+    def test_json_export_streams(self):
+        ProductImage.objects.create(product=self.existing, image_url='https://example.com/new.png', order=1)
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/products/export/', {'file_format': 'json'})
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'application/json'))
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(rows, [{
+            'slug': 'phone-x', 'name': 'Old', 'description': '-', 'category': 'phones', 'brand': 'Acme',
+            'price': '1.00', 'discount_percentage': 0, 'stock_quantity': 0, 'is_featured': False, 'is_active': True,
+            'images': ['https://example.com/old.png', 'https://example.com/new.png'],
+        }])
+        chunks = list(transfer.export_products('json', chunk_size=1))
+        self.assertEqual(json.loads(''.join(chunks)), rows)
+        self.assertGreater(len(chunks), 2)
+
+    def test_requires_staff(self):
+        self.assertEqual(self.client.get('/products/export/').status_code, 403)
+
+
+class ProductSlugTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Phones', slug='phones', description='-')
+        cls.brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+
+    def create(self, name):
+        payload = {'name': name, 'description': 'A phone', 'category': self.category.id, 'brand': self.brand.id,
+                   'price': '10.00'}
+        response = self.client.post('/products/create/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Product.objects.get(id=response.data['id'])
+
+    def test_same_name_gets_suffixes(self):
+        self.assertEqual([self.create('Phone X').slug for _ in range(3)], ['phone-x', 'phone-x-2', 'phone-x-3'])
+        with self.assertNumQueries(2):
+            self.assertEqual(slugs.allocate_slugs(['Phone X', 'Phone X', 'Tablet']),
+                             ['phone-x-4', 'phone-x-5', 'tablet'])
+
+    def test_conflict_is_retried(self):
+        product = Product(name='Phone X', description='-', category=self.category, brand=self.brand, price='1.00')
+        allocate = slugs.allocate_slugs
+        calls = []
+
+        def racing_allocate(names, reserved=()):
+            allocated = allocate(names, reserved)
+            if not calls:
+                # Another writer commits the same slug between allocation and insert.
+                Product.objects.create(name='Phone X', slug='phone-x', description='-', category=self.category,
+                                       brand=self.brand, price='1.00')
+            calls.append(allocated)
+            return allocated
+
+        with mock.patch.object(slugs, 'allocate_slugs', racing_allocate):
+            slugs.save_with_unique_slug(product)
+        self.assertEqual(calls, [['phone-x'], ['phone-x-2']])
+        self.assertEqual(product.slug, 'phone-x-2')
+
+    def test_rename_keeps_old_url(self):
+        product = self.create('Phone X')
+        response = self.client.put(f'/products/{product.id}/update/', {
+            'name': 'Phone Y', 'price': '12.00', 'stock_quantity': 3, 'discount_percentage': 0,
+        }, format='json')
+        self.assertEqual(response.data['slug'], 'phone-y')
+        product.refresh_from_db()
+        self.assertEqual((product.price, product.stock_quantity), (Decimal('12.00'), 3))
+
+        response = self.client.get('/products/slug/phone-x/')
+        self.assertEqual((response.status_code, response['Location']), (301, '/products/slug/phone-y/'))
+        self.assertEqual(self.client.get('/products/slug/phone-y/').data['id'], product.id)
+        self.assertEqual(self.client.get('/products/slug/missing/').status_code, 404)
+
+
+@override_settings(QUERY_PROFILER_ENABLED=True, QUERY_PROFILER_N_PLUS_ONE_THRESHOLD=3)
+class QueryProfilerTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Phones', slug='phones', description='-')
+        brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        cls.products = [
+            Product.objects.create(name=f'P{i}', slug=f'p{i}', description='-', category=cls.category, brand=brand,
+                                   price='1.00')
+            for i in range(4)
+        ]
+
+    def test_server_timing_header(self):
+        response = self.client.get('/products/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="1 queries"$')
+
+    def test_repeated_queries_are_flagged(self):
+        with profiling.profile_queries() as recorder:
+            for product in self.products:
+                Category.objects.get(id=product.category_id)
+            Category.objects.get(id=self.category.id)
+        report = recorder.report()
+        self.assertEqual((report['queries'], report['duplicates']), (5, 4))
+        [shape] = report['n_plus_one']
+        self.assertEqual(shape['count'], 5)
+        self.assertEqual(sum(shape['sites'].values()), 5)
+        self.assertTrue(all(site.startswith('apps/products/tests.py:') for site in shape['sites']))
+
+    def test_query_budget(self):
+        with profiling.query_budget(1):
+            self.client.get('/products/')
+        with self.assertRaisesMessage(profiling.QueryBudgetExceeded, '2 queries executed, budget is 1'):
+            with profiling.query_budget(1):
+                list(Product.objects.filter(id=self.products[0].id))
+                list(Product.objects.filter(id=self.products[1].id))
+
+
+class JSONRendererTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer')
+        category = Category.objects.create(name='Телефоны', slug='phones', description='-')
+        brand = Brand.objects.create(name='Acme\u2028', logo='https://example.com/a.png', description='-')
+        cls.product = Product.objects.create(name='Smartphone X', slug='smartphone-x', description='Ёмкий\u2029',
+                                             category=category, brand=brand, price='19.99', discount_percentage=15,
+                                             stock_quantity=3)
+        ProductImage.objects.create(product=cls.product, image_url='https://example.com/x.png', is_primary=True)
+        ProductReview.objects.create(product=cls.product, user=cls.user, rating=4, title='Good', comment='Fine')
+        cart = Cart.objects.create(user=cls.user)
+        CartItem.objects.create(cart=cart, product=cls.product, quantity=3)
+        order = Order.objects.create(user=cls.user, order_number='A1', total_amount='50.97',
+                                     shipping_address='Somewhere 1', phone='+998900000000')
+        OrderItem.objects.create(order=order, product=cls.product, quantity=3, price='19.99', discount_percentage=15)
+
+    def test_endpoints_match_drf_renderer(self):
+        self.client.force_authenticate(self.user)
+        product = self.product
+        urls = [
+            '/products/', '/products/?sort=price', '/products/?fields=id,final_price&expand=category',
+            '/products/search/?q=smartphone', f'/products/categories/{product.category_id}/',
+            f'/products/{product.id}/', f'/products/slug/{product.slug}/', '/products/0/',
+            f'/reviews/products/{product.id}/', '/orders/cart/', '/orders/history/',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.content, renderers.JSONRenderer().render(response.data))
+        self.assertEqual(self.client.get('/products/categories/').content,
+                         renderers.JSONRenderer().render(categories.build_tree()))
+
+    def test_values_match_drf_renderer(self):
+        moment = datetime.datetime(2025, 1, 2, 3, 4, 5, 6, tzinfo=datetime.timezone.utc)
+        values = [
+            {'price': Decimal('4800000.00'), 'tiny': Decimal('0.00001'), 'huge': Decimal('1E+20')},
+            {'at': moment, 'day': moment.date(), 'time': datetime.time(1, 2), 'seconds': datetime.timedelta(1.5)},
+            {1: 'int key', None: 'null key', 'big': 2 ** 70, 'text': 'line\u2028break \u2029 ✓'},
+            [], 0.1, None,
+        ]
+        for value in values:
+            with self.subTest(value=value):
+                self.assertEqual(JSONRenderer().render(value), renderers.JSONRenderer().render(value))
+        indented = 'application/json; indent=4'
+        self.assertEqual(JSONRenderer().render(values, indented), renderers.JSONRenderer().render(values, indented))
+
+    def test_parser(self):
+        parser = parsers.JSONParser()
+        body = '{"name": "Ёмкий", "price": 1.5, "ids": [1, 2]}'.encode()
+        self.assertEqual(parser.parse(BytesIO(body)), {'name': 'Ёмкий', 'price': 1.5, 'ids': [1, 2]})
+        for body in (b'{"a": ', b'{"a": NaN}'):
+            with self.assertRaisesMessage(ParseError, 'JSON parse error'):
+                parser.parse(BytesIO(body))
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/orders/cart/item/', '{"product": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.data['detail'])
+
+    def test_stream_list(self):
+        items = [{'id': i, 'price': Decimal('1.50'), 'name': f'Товар {i}'} for i in range(5)]
+        for size in (1, 2, 5, 10):
+            self.assertEqual(b''.join(stream_list(iter(items), chunk_size=size)), JSONRenderer().render(items))
+        self.assertEqual(b''.join(stream_list([])), b'[]')
+
+
+class AsyncViewsTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones', description='-')
+        brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        user = User.objects.create_user(username='reviewer')
+        cls.products = []
+        for i in range(5):
+            product = Product.objects.create(name=f'Phone {i}', slug=f'phone-{i}', description='-', category=category,
+                                             brand=brand, price=f'{10 + i}.50', discount_percentage=5 * i)
+            ProductImage.objects.create(product=product, image_url=f'https://example.com/{i}.png', is_primary=True)
+            cls.products.append(product)
+        ProductReview.objects.create(product=cls.products[0], user=user, rating=5, title='t', comment='c')
+        RelatedProduct.objects.create(product=cls.products[0], related=cls.products[3], rank=1, score=1)
+
+    async def compare(self, url):
+        cache.get_cache().clear()
+        expected = await sync_to_async(self.client.get)(url)
+        cache.get_cache().clear()
+        with override_settings(ROOT_URLCONF='core.asgi_urls'):
+            response = await self.async_client.get(url)
+            self.assertTrue(response.resolver_match.func.view_class.view_is_async)
+        self.assertEqual((response.status_code, response.content), (expected.status_code, expected.content))
+        return response
+
+    async def test_list_matches_sync_view(self):
+        response = await self.compare('/products/?page_size=2&sort=price')
+        await self.compare(json.loads(response.content)['next'])
+        await self.compare('/products/?fields=id,name,final_price&expand=brand')
+        await self.compare('/products/?min_price=abc')
+        await self.compare('/products/?cat_id=0')
+
+    async def test_detail_matches_sync_view(self):
+        for product in self.products[:2]:
+            await self.compare(f'/products/{product.id}/')
+        await self.compare(f'/products/{self.products[0].id}/?fields=id,images,related_products&expand=images')
+        await self.compare('/products/0/')
+
+        with override_settings(ROOT_URLCONF='core.asgi_urls'):
+            response = await self.async_client.get(f'/products/{self.products[0].id}/')
+            cached = await self.async_client.get(f'/products/{self.products[0].id}/',
+                                                 headers={'If-None-Match': response['ETag']})
+        self.assertEqual(cached.status_code, 304)
+
+
+class ProductSnapshotTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.electronics = Category.objects.create(name='Electronics', slug='electronics', description='-')
+        cls.phones = Category.objects.create(name='Phones', slug='phones', description='-', parent=cls.electronics)
+        cls.books = Category.objects.create(name='Books', slug='books', description='-')
+        cls.brands = [Brand.objects.create(name=name, logo='https://example.com/b.png', description='-')
+                      for name in ('Acme', 'Other')]
+        categories = [cls.electronics, cls.phones, cls.books]
+        for i in range(30):
+            Product.objects.create(
+                name=f'Item {i}', slug=f'item-{i}', description='-', category=categories[i % 3],
+                brand=cls.brands[i % 2], price=f'{(i * 37) % 400 + 10}.{i % 4 * 25:02d}',
+                discount_percentage=(0, 10, 50)[i % 3 - 1], stock_quantity=i % 4, is_featured=not i % 5,
+                is_active=i != 7,
+            )
+        Product.objects.filter(slug__in=['item-3', 'item-4']).update(price='150.00', average_rating=4.5)
+
+    def setUp(self):
+        snapshot.clear_snapshot()
+        self.addCleanup(snapshot.clear_snapshot)
+
+    def pages(self, params):
+        """Every page of the list for ``params``: the result ids and the cursor links."""
+        pages = []
+        url = '/products/'
+        data = {'page_size': 4, **params}
+        while url:
+            response = self.client.get(url, data)
+            if response.status_code == 404:
+                break
+            self.assertEqual(response.status_code, 200)
+            pages.append(([row['id'] for row in response.data['results']],
+                          response.data['next'], response.data['previous']))
+            url, data = response.data['next'], None
+        if pages and pages[-1][2]:
+            response = self.client.get(pages[-1][2])
+            pages.append(([row['id'] for row in response.data['results']], response.data['previous']))
+        return pages
+
+    def assertSnapshotMatches(self, cases):
+        for params in cases:
+            expected = self.pages(params)
+            answers = []
+
+            def page(engine, *args, page=snapshot.Snapshot.page):
+                answers.append(page(engine, *args))
+                return answers[-1]
+
+            with override_settings(PRODUCT_SNAPSHOT_ENABLED=True), mock.patch.object(snapshot.Snapshot, 'page', page):
+                self.assertEqual(self.pages(params), expected, params)
+            self.assertTrue(answers)
+            self.assertNotIn(None, answers)
+
+    def test_pages_match_the_database(self):
+        cases = [
+            {},
+            {'cat_id': self.electronics.id},
+            {'cat_id': f'{self.phones.id},{self.books.id}', 'in_stock': 'true'},
+            {'brand_id': self.brands[0].id, 'min_price': '100'},
+            {'min_price': '100', 'max_price': '200'},
+            {'max_price': '150', 'is_featured': 'false'},
+            {'is_featured': 'true'},
+            {'in_stock': 'false', 'min_rating': '4'},
+            {'cat_id': 999},
+        ]
+        self.assertSnapshotMatches([dict(params, sort=sort) for params in cases for sort in (
+            'newest', 'price', '-price', 'final_price', '-final_price', 'top_rated',
+        )])
+
+    def test_text_search_falls_back_to_the_database(self):
+        with override_settings(PRODUCT_SNAPSHOT_ENABLED=True):
+            response = self.client.get('/products/', {'s': 'item'})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], self.client.get('/products/', {'s': 'item'}).data['results'])
+
+    def test_refresh_applies_changes_since_the_watermark(self):
+        engine = snapshot.Snapshot.load()
+        engine.build_indexes([('-created_at', '-id'), ('price', 'id')])
+        self.assertEqual(len(engine), 29)
+        changed = Product.objects.get(slug='item-1')
+        changed.price = '5.00'
+        changed.save()
+        Product.objects.filter(slug='item-2').update(is_active=False, updated_at=timezone.now())
+        Product.objects.filter(slug='item-7').update(is_active=True, updated_at=timezone.now())
+        Product.objects.create(name='New', slug='new', description='-', category=self.books, brand=self.brands[1],
+                               price='1.00')
+        self.assertEqual(engine.refresh(), Product.objects.count())
+
+        price = ('price', 'id')
+        self.assertEqual(engine.page({}, price, False, None, 2), [
+            Product.objects.get(slug='new').id, changed.id,
+        ])
+        rebuilt = snapshot.Snapshot.load()
+        for filters in ({}, {'cat_id': [self.books.id]}, {'max_price': 100}, {'brand_id': [self.brands[1].id]}):
+            for ordering in (price, ('-created_at', '-id')):
+                self.assertEqual(engine.page(filters, ordering, False, None, 50),
+                                 rebuilt.page(filters, ordering, False, None, 50))
+        with self.assertNumQueries(2), override_settings(PRODUCT_SNAPSHOT_REFRESH_LAG=0):
+            # Only the newest row again.
+            self.assertEqual(engine.refresh(), 1)
+
+    def test_stale_rows_fall_back_to_the_database(self):
+        params = {'page_size': 2, 'sort': 'price'}
+        with override_settings(PRODUCT_SNAPSHOT_ENABLED=True):
+            first = self.client.get('/products/', params).data['results']
+            # Gone from the list, but not from the snapshot until it refreshes.
+            Product.objects.filter(id__in=[row['id'] for row in first]).update(is_active=False)
+            response = self.client.get('/products/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.client.get('/products/', params).data)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_list_loads_only_the_page(self):
+        with override_settings(PRODUCT_SNAPSHOT_ENABLED=True):
+            self.client.get('/products/')
+            with self.assertNumQueries(1):
+                response = self.client.get('/products/', {'page_size': 3, 'brand_id': self.brands[0].id})
+        self.assertEqual(len(response.data['results']), 3)
@@ -0,0 +1,350 @@
+import csv
+import io
+import json
+import re
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import DatabaseError, transaction
+
+from apps.inventory.models import StockMovement
+from apps.inventory.services import set_stock
+from apps.products.cache import bump_versions
+from apps.products.models import Brand, Category, Product, ProductImage
+from apps.products.slugs import SLUG_LENGTH, create_with_unique_slugs
+from core.renderers import stream_list
+
+FORMATS = ('csv', 'jsonl')
+# A JSON array of the same rows; exported only, imports read one row a line.
+EXPORT_FORMATS = FORMATS + ('json',)
+COLUMNS = (
+    'slug', 'name', 'description', 'category', 'brand', 'price', 'discount_percentage', 'stock_quantity',
+    'is_featured', 'is_active', 'images',
+)
+UPDATE_FIELDS = [
+    'name', 'description', 'category', 'brand', 'price', 'discount_percentage', 'stock_quantity', 'is_featured',
+    'is_active', 'updated_at',
+]
+CHUNK_SIZE = 1000
+# CSV rows list their images in one column, separated by this.
+IMAGE_SEPARATOR = '|'
+MAX_REPORTED_ERRORS = 1000
+
+SLUG_RE = re.compile(r'^[-a-zA-Z0-9_]+$')
+TRUE_VALUES = {'1', 'true', 'yes', 't', 'y'}
+FALSE_VALUES = {'0', 'false', 'no', 'f', 'n'}
+
+
+class RowError(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def read_rows(stream, file_format):
+    """Yield ``(line number, dict)`` from a binary CSV or JSONL stream, one line at a time."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+        except ValueError as error:
+            row = error
+        yield line, row
+
+
+def import_products(stream, file_format, chunk_size=CHUNK_SIZE):
+    """
+    Upsert products and their images from a CSV or JSONL stream.
+
+    Rows are matched on ``slug``; rows without one get a fresh slug and are
+    always inserted. Categories are looked up by slug and brands by name in
+    tables loaded once. Each chunk costs a handful of queries whatever its
+    size; invalid rows are reported and skipped without aborting the import.
+    """
+    categories = dict(Category.objects.values_list('slug', 'id'))
+    brands = dict(Brand.objects.values_list('name', 'id'))
+    result = ImportResult()
+    rows = read_rows(stream, file_format)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return result
+        _import_chunk(chunk, categories, brands, result)
+
+
+def _import_chunk(chunk, categories, brands, result):
+    cleaned = {}
+    generated = []
+    for line, row in chunk:
+        try:
+            values, images = clean_row(row, categories, brands)
+        except RowError as error:
+            result.add_error(line, error.errors)
+            continue
+        if values['slug']:
+            # A slug repeated within the chunk: the last row wins.
+            cleaned[values['slug']] = (line, values, images)
+        else:
+            generated.append((line, values, images))
+
+    existing = set(Product.objects.filter(slug__in=list(cleaned)).values_list('slug', flat=True))
+    entries = list(cleaned.values()) + generated
+    try:
+        ids = _write(entries, reserved=cleaned)
+    except DatabaseError:
+        # Retried one row at a time, each in its own savepoint, so only the
+        # rows the database rejects are reported.
+        ids = {}
+        written = []
+        for entry in entries:
+            try:
+                ids.update(_write([entry], reserved=cleaned))
+            except DatabaseError as error:
+                result.add_error(entry[0], {'non_field_errors': [str(error)]})
+            else:
+                written.append(entry)
+        entries = written
+
+    updated = sum(1 for _, values, _ in entries if values['slug'] in existing)
+    result.updated += updated
+    result.created += len(entries) - updated
+    bump_versions(ids.values())
+
+
+def _write(entries, reserved):
+    """Upsert ``entries`` and their images and stock in one transaction; return ``{slug: id}``."""
+    upserts = [Product(**values) for _, values, _ in entries if values['slug']]
+    inserts = [Product(**values) for _, values, _ in entries if not values['slug']]
+    with transaction.atomic():
+        Product.objects.bulk_create(
+            upserts, update_conflicts=True, unique_fields=['slug'], update_fields=UPDATE_FIELDS,
+        )
+        # Generated slugs are plain inserts: a slug taken concurrently
+        # must be re-allocated rather than overwrite someone else's product.
+        create_with_unique_slugs(inserts, reserved=reserved)
+        slugs = iter(product.slug for product in inserts)
+        entries = [(line, {**values, 'slug': values['slug'] or next(slugs)}, images)
+                   for line, values, images in entries]
+        ids = dict(Product.objects.filter(slug__in=[values['slug'] for _, values, _ in entries]).values_list(
+            'slug', 'id',
+        ))
+        _sync_images(entries, ids)
+        # bulk_create skips signals: record the imported stock levels.
+        set_stock({ids[values['slug']]: values['stock_quantity'] for _, values, _ in entries},
+                  kind=StockMovement.IMPORT)
+    return ids
+
+
+def _sync_images(entries, ids):
+    """Make every row's images exactly the listed URLs; rows without images keep theirs."""
+    images = []
+    product_ids = []
+    for _, values, urls in entries:
+        if urls is None:
+            continue
+        product_id = ids[values['slug']]
+        product_ids.append(product_id)
+        images.extend(
+            ProductImage(product_id=product_id, image_url=url, is_primary=order == 0, order=order)
+            for order, url in enumerate(urls)
+        )
+    if not product_ids:
+        return
+    ProductImage.objects.bulk_create(
+        images, update_conflicts=True, unique_fields=['product', 'image_url'], update_fields=['is_primary', 'order'],
+    )
+    keep = {(image.product_id, image.image_url) for image in images}
+    stale = [
+        image_id for image_id, product_id, url in ProductImage.objects.filter(product_id__in=product_ids).values_list(
+            'id', 'product_id', 'image_url',
+        ) if (product_id, url) not in keep
+    ]
+    if stale:
+        ProductImage.objects.filter(id__in=stale).delete()
+
+
+def clean_row(row, categories, brands):
+    """Return ``(product field values, image URLs or None)`` or raise RowError."""
+    if isinstance(row, Exception):
+        raise RowError({'non_field_errors': [f'Invalid JSON: {row}']})
+    if not isinstance(row, dict):
+        raise RowError({'non_field_errors': ['Expected an object']})
+
+    errors = {}
+
+    def field(name, parse, default=None):
+        value = row.get(name)
+        if value is None or value == '':
+            if default is None:
+                errors[name] = ['This field is required.']
+            return default
+        try:
+            return parse(value)
+        except (TypeError, ValueError, InvalidOperation) as error:
+            errors[name] = [str(error) or 'Invalid value.']
+            return default
+
+    values = {
+        'slug': field('slug', _slug, default=''),
+        'name': field('name', _name),
+        'description': field('description', str, default=''),
+        'category_id': field('category', lambda slug: _lookup(categories, slug, 'Category')),
+        'brand_id': field('brand', lambda name: _lookup(brands, name, 'Brand')),
+        'price': field('price', _price),
+        'discount_percentage': field('discount_percentage', lambda value: _int(value, 0, 100), default=0),
+        'stock_quantity': field('stock_quantity', lambda value: _int(value, 0), default=0),
+        'is_featured': field('is_featured', _bool, default=False),
+        'is_active': field('is_active', _bool, default=True),
+    }
+    images = field('images', _images, default=[]) if row.get('images') not in (None, '') else None
+    if errors:
+        raise RowError(errors)
+    return values, images
+
+
+def _slug(value):
+    value = str(value).strip()
+    if len(value) > SLUG_LENGTH or not SLUG_RE.match(value):
+        raise ValueError(f'Enter a valid slug of at most {SLUG_LENGTH} characters.')
+    return value
+
+
+def _name(value):
+    value = str(value).strip()
+    if not value:
+        raise ValueError('Name can not be empty!')
+    return value[:Product._meta.get_field('name').max_length]
+
+
+def _lookup(table, key, model):
+    try:
+        return table[str(key).strip()]
+    except KeyError:
+        raise ValueError(f'{model} {key!r} does not exist.') from None
+
+
+def _price(value):
+    price = Decimal(str(value).strip())
+    if not price.is_finite() or price <= 0:
+        raise ValueError('Price must be positive number!')
+    if price != price.quantize(Decimal('0.01')) or price >= Decimal('1e8'):
+        raise ValueError('Price must have at most 8 digits and 2 decimal places.')
+    return price
+
+
+def _int(value, minimum, maximum=None):
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        number = int(value)
+    except ValueError:
+        raise ValueError('A valid integer is required.') from None
+    if number < minimum or (maximum is not None and number > maximum):
+        bound = f'between {minimum} and {maximum}' if maximum is not None else f'at least {minimum}'
+        raise ValueError(f'Must be {bound}.')
+    return number
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError('Must be a valid boolean.')
+
+
+def _images(value):
+    if isinstance(value, str):
+        value = [url.strip() for url in value.split(IMAGE_SEPARATOR) if url.strip()]
+    if not isinstance(value, list) or not all(isinstance(url, str) for url in value):
+        raise ValueError('Expected a list of URLs.')
+    return list(dict.fromkeys(value))
+
+
+def export_products(file_format, chunk_size=CHUNK_SIZE):
+    """
+    Yield the catalogue as CSV, JSONL or JSON text in import format.
+
+    Products are streamed with ``iterator(chunk_size)``, their images fetched
+    one query per chunk, so memory stays flat whatever the catalogue size.
+    """
+    products = Product.objects.order_by('id').values_list(
+        'id', 'slug', 'name', 'description', 'category__slug', 'brand__name', 'price', 'discount_percentage',
+        'stock_quantity', 'is_featured', 'is_active', named=True,
+    )
+    if file_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(COLUMNS)
+        for row in _with_images(products, chunk_size):
+            writer.writerow([row[column] if column != 'images' else IMAGE_SEPARATOR.join(row['images'])
+                             for column in COLUMNS])
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        return
+    if file_format == 'json':
+        for piece in stream_list(_with_images(products, chunk_size), chunk_size=chunk_size):
+            yield piece.decode()
+        return
+    for row in _with_images(products, chunk_size):
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def _with_images(products, chunk_size):
+    rows = products.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        images = {}
+        for product_id, url in ProductImage.objects.filter(product_id__in=[row.id for row in chunk]).order_by(
+                'product_id', 'order', 'id').values_list('product_id', 'image_url'):
+            images.setdefault(product_id, []).append(url)
+        for row in chunk:
+            yield {
+                'slug': row.slug,
+                'name': row.name,
+                'description': row.description,
+                'category': row.category__slug,
+                'brand': row.brand__name,
+                'price': str(row.price),
+                'discount_percentage': row.discount_percentage,
+                'stock_quantity': row.stock_quantity,
+                'is_featured': row.is_featured,
+                'is_active': row.is_active,
+                'images': images.get(row.id, []),
+            }
@@ -6,7 +6,14 @@ app_name = 'products'
 
 urlpatterns = [
     path('', views.ProductListAPIView.as_view()),
+    path('search/', views.ProductSearchAPIView.as_view()),
+    path('facets/', views.ProductFacetsAPIView.as_view()),
+    path('import/', views.ProductImportAPIView.as_view()),
+    path('export/', views.ProductExportAPIView.as_view()),
+    path('categories/', views.CategoryTreeAPIView.as_view()),
+    path('categories/<int:pk>/', views.CategoryDetailAPIView.as_view()),
     path('<int:pk>/', views.ProductDetailAPIView.as_view()),
+    path('slug/<slug:slug>/', views.ProductBySlugAPIView.as_view()),
     path('<int:pk>/update/', views.ProductPutAPIView.as_view()),
     path('<int:pk>/delete/', views.ProductDeleteAPIView.as_view()),
     path('<int:pk>/partial-update/', views.ProductPatchAPIView.as_view()),
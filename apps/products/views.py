@@ -1,52 +1,160 @@
-from django.db.models import Q
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import aprefetch_related_objects
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apps.products import serializers
-from apps.products.models import Product
+from apps.products import cache, categories, facets, search, serializers, slugs, snapshot, transfer
+from apps.products.filters import ProductFilter
+from apps.products.models import Category, Product
+from apps.products.pagination import ProductPagination, ProductSearchPagination
 from apps.products.serializers import ProductCreateSerializer, ProductDetailSerializer, ProductUpdateSerializer, \
     ProductPartialUpdateSerializer
+from core.views import AsyncAPIView
 
 
 class ProductListAPIView(APIView):
     serializer_class = serializers.ProductListSerializer
+    pagination_class = ProductPagination
     model = Product
 
     def get(self, request):
-        cat_id = request.query_params.get('cat_id')
-        brand_id = request.query_params.get('brand_id')
-        min_price = request.query_params.get('min_price')
-        max_price = request.query_params.get('max_price')
-        is_featured = request.query_params.get('is_featured')
-        s = request.query_params.get('s')
-        products = self.model.objects.filter(is_active=True)
+        products, fields, expand = self.get_products(request)
+        paginator = self.pagination_class()
+        page = self.paginate_snapshot(paginator, products, request)
+        if page is None:
+            page = paginator.paginate_queryset(products, request, view=self)
+        if not page:
+            return Response(data={'message':'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        return paginator.get_paginated_response(self.serialize(page, fields, expand))
+
+    def get_products(self, request):
+        params = request.query_params.dict()
+        params.pop(self.serializer_class.fields_query_param, None)
+        params.pop(self.serializer_class.expand_query_param, None)
+        filters = ProductFilter(data=params)
+        filters.is_valid(raise_exception=True)
+        self.filters = filters.validated_data
+        fields, expand = self.serializer_class.sparse_params(request.query_params)
+
+        products = filters.filter_queryset(self.model.objects.filter(is_active=True))
+        if fields is None:
+            # Full rows take the compiled path over values() tuples.
+            return serializers.product_list_rows.values(products.with_primary_image()), fields, expand
+        return self.serializer_class.sparse_queryset(products, fields, expand), fields, expand
+
+    def paginate_snapshot(self, paginator, products, request):
+        # None without a snapshot or when it can not answer, e.g. text searches.
+        engine = snapshot.get_snapshot()
+        if engine is None:
+            return None
+        return paginator.paginate_snapshot(engine, products, self.filters, request)
+
+    def serialize(self, page, fields, expand):
+        if fields is None:
+            return serializers.product_list_rows.to_representation(page)
+        return self.serializer_class(page, many=True, fields=fields, expand=expand).data
+
+
+class AsyncProductListAPIView(AsyncAPIView, ProductListAPIView):
+    async def get(self, request):
+        # Filtering may look up the category tree.
+        products, fields, expand = await sync_to_async(self.get_products)(request)
+        paginator = self.pagination_class()
+        page = None
+        if settings.PRODUCT_SNAPSHOT_ENABLED:
+            page = await sync_to_async(self.paginate_snapshot)(paginator, products, request)
+        if page is None:
+            page = await paginator.apaginate_queryset(products, request, view=self)
+        if not page:
+            return Response(data={'message':'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        return paginator.get_paginated_response(self.serialize(page, fields, expand))
 
-        if cat_id:
-            products = self.model.objects.filter(cat_id=cat_id)
 
-        if brand_id:
-            products = self.model.objects.filter(brand_id=brand_id)
+class ProductFacetsAPIView(APIView):
+    # Counts for the sidebar of /products/ with the same filter parameters.
+    def get(self, request):
+        filters = ProductFilter(data=request.query_params.dict())
+        filters.is_valid(raise_exception=True)
+        return HttpResponse(facets.facets_json(filters), content_type='application/json')
 
-        if min_price:
-            products = self.model.objects.filter(price__gte=min_price)
 
-        if max_price:
-            products = self.model.objects.filter(price__lte=max_price)
+class ProductSearchAPIView(APIView):
+    serializer_class = serializers.ProductSearchSerializer
+    pagination_class = ProductSearchPagination
+    model = Product
 
-        if is_featured:
-            products = self.model.objects.filter(is_featured=is_featured)
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(data={'message':'Search query is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if s:
-            products = self.model.objects.filter(Q(name__icontains=s) | Q(description__icontains=s))
+        products = search.search(self.model.objects.filter(is_active=True), query)
+        products = search.with_highlights(products).only('id', 'name', 'slug', 'price', 'discount_percentage')
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(products, request, view=self)
+        serializer = self.serializer_class(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class CategoryTreeAPIView(APIView):
+    def get(self, request):
+        return HttpResponse(categories.tree_json(), content_type='application/json')
 
-        if not products.exists():
-            return Response(data={'message':'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = self.serializer_class(products, many=True)
+class CategoryDetailAPIView(APIView):
+    serializer_class = serializers.CategoryDetailSerializer
+
+    def get(self, request, pk):
+        try:
+            category = Category.objects.get(id=pk, is_active=True)
+        except Category.DoesNotExist:
+            return Response(data={'message':'Category not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = self.serializer_class(category)
         return Response(data=serializer.data, status=status.HTTP_200_OK)
 
 
+class ProductImportAPIView(APIView):
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.data.get('file')
+        if upload is None:
+            return Response(data={'message':'File is required'}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.data.get('file_format') or upload.name.rsplit('.', 1)[-1].lower()
+        if file_format not in transfer.FORMATS:
+            return Response(data={'message':'File format must be csv or jsonl'}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = transfer.import_products(upload, file_format)
+        return Response(data=result.as_dict(), status=status.HTTP_200_OK)
+
+
+class ProductExportAPIView(APIView):
+    permission_classes = [IsAdminUser]
+    content_types = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson', 'json': 'application/json'}
+
+    def get(self, request):
+        # Not ``format``: DRF reserves it for picking the renderer.
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in transfer.EXPORT_FORMATS:
+            return Response(data={'message':'File format must be csv, jsonl or json'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(transfer.export_products(file_format),
+                                         content_type=self.content_types[file_format])
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
+
+
 class ProductCreateAPIView(APIView):
     serializer_class = ProductCreateSerializer
     model = Product
@@ -61,14 +169,70 @@ class ProductCreateAPIView(APIView):
 
 class ProductDetailAPIView(APIView):
     serializer_class = ProductDetailSerializer
+
     def get(self, request, pk):
+        fields, expand = self.serializer_class.sparse_params(request.query_params)
+        version = cache.get_version(pk)
+        etag = cache.etag(pk, version, fields, expand)
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
         try:
-            product = Product.objects.get(id=pk)
+            data = cache.get_or_build(cache.detail_key(pk, version, fields, expand),
+                                      lambda: self.build(pk, fields, expand))
         except Product.DoesNotExist:
             return Response(data={'message':'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = self.serializer_class(product)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        return Response(data=data, status=status.HTTP_200_OK, headers={'ETag': etag})
+
+    def build(self, pk, fields=None, expand=None):
+        product = self.serializer_class.sparse_queryset(Product.objects.all(), fields, expand).get(id=pk)
+        return self.serializer_class(product, fields=fields, expand=expand).data
+
+
+class AsyncProductDetailAPIView(AsyncAPIView, ProductDetailAPIView):
+    async def get(self, request, pk):
+        fields, expand = self.serializer_class.sparse_params(request.query_params)
+        version = await cache.aget_version(pk)
+        etag = cache.etag(pk, version, fields, expand)
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        try:
+            data = await cache.aget_or_build(cache.detail_key(pk, version, fields, expand),
+                                             lambda: self.abuild(pk, fields, expand))
+        except Product.DoesNotExist:
+            return Response(data={'message':'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response(data=data, status=status.HTTP_200_OK, headers={'ETag': etag})
+
+    async def abuild(self, pk, fields=None, expand=None):
+        products, prefetches = self.serializer_class.sparse_plan(Product.objects.all(), fields, expand)
+        product = await products.aget(id=pk)
+        serializer = self.serializer_class(product, fields=fields, expand=expand)
+        # Images, reviews and related products only need the product: load them concurrently.
+        loads = [aprefetch_related_objects([product], lookup) for lookup in prefetches]
+        if 'related_products' in serializer.fields:
+            loads.append(self._load_related_products(product))
+        await asyncio.gather(*loads)
+        return serializer.data
+
+    @staticmethod
+    async def _load_related_products(product):
+        product.related_products = await sync_to_async(serializers.related_products)(product)
+
+
+class ProductBySlugAPIView(ProductDetailAPIView):
+    def get(self, request, slug):
+        resolved = slugs.resolve(slug)
+        if resolved is None:
+            return Response(data={'message':'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        pk, current = resolved
+        if current != slug:
+            return Response(status=status.HTTP_301_MOVED_PERMANENTLY,
+                            headers={'Location': f'/products/slug/{current}/'})
+        return super().get(request, pk)
 
 
 class ProductPutAPIView(APIView):
@@ -0,0 +1,25 @@
+from django.contrib import admin
+from .models import Coupon, Promotion, PromotionTier
+
+
+class PromotionTierInline(admin.TabularInline):
+    model = PromotionTier
+    extra = 1
+
+
+@admin.register(Promotion)
+class PromotionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'kind', 'value', 'min_quantity', 'is_active', 'starts_at', 'ends_at')
+    list_filter = ('is_active', 'kind')
+    search_fields = ('name',)
+    autocomplete_fields = ('products', 'categories', 'brands')
+    inlines = [PromotionTierInline]
+
+
+@admin.register(Coupon)
+class CouponAdmin(admin.ModelAdmin):
+    list_display = ('id', 'code', 'kind', 'value', 'min_subtotal', 'times_used', 'max_uses', 'is_active',
+                    'starts_at', 'ends_at')
+    list_filter = ('is_active', 'kind')
+    search_fields = ('code',)
+    readonly_fields = ('times_used',)
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('products', '0012_product_final_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Coupon',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('percent', 'Percent off'), ('fixed', 'Amount off')], default='percent', max_length=10)),
+                ('value', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('is_active', models.BooleanField(default=True)),
+                ('starts_at', models.DateTimeField(blank=True, null=True)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('code', models.CharField(max_length=50, unique=True)),
+                ('min_subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('max_uses', models.PositiveIntegerField(blank=True, null=True)),
+                ('times_used', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('is_active', True)), fields=['starts_at'], name='coupon_active_start_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('percent', 'Percent off'), ('fixed', 'Amount off')], default='percent', max_length=10)),
+                ('value', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('is_active', models.BooleanField(default=True)),
+                ('starts_at', models.DateTimeField(blank=True, null=True)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=100)),
+                ('min_quantity', models.PositiveIntegerField(default=1)),
+                ('brands', models.ManyToManyField(blank=True, related_name='promotions', to='products.brand')),
+                ('categories', models.ManyToManyField(blank=True, related_name='promotions', to='products.category')),
+                ('products', models.ManyToManyField(blank=True, related_name='promotions', to='products.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PromotionTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_quantity', models.PositiveIntegerField()),
+                ('value', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('promotion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tiers', to='promotions.promotion')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='promotion',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['starts_at'], name='promotion_active_start_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='promotiontier',
+            constraint=models.UniqueConstraint(fields=('promotion', 'min_quantity'), name='promotion_tier_quantity_uniq'),
+        ),
+    ]
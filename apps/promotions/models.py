@@ -0,0 +1,95 @@
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models import Q
+
+from apps.products.models import Brand, Category, Product
+
+
+def validate_value(kind, value):
+    if value is not None and (value <= 0 or (kind == Discount.PERCENT and value > 100)):
+        raise ValidationError({'value': 'Enter a positive amount, or a percentage of at most 100.'})
+
+
+class Discount(models.Model):
+    PERCENT = 'percent'
+    FIXED = 'fixed'
+    KIND_CHOICES = [
+        (PERCENT, 'Percent off'),
+        (FIXED, 'Amount off'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=PERCENT)
+    value = models.DecimalField(max_digits=10, decimal_places=2)
+    is_active = models.BooleanField(default=True)
+    # Either end may be left open.
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    def clean(self):
+        validate_value(self.kind, self.value)
+        if self.starts_at and self.ends_at and self.starts_at >= self.ends_at:
+            raise ValidationError({'ends_at': 'The end must be after the start.'})
+
+
+class Promotion(Discount):
+    # Takes ``value`` off every unit of the matching cart lines (a percentage
+    # or an amount per unit) once a line holds ``min_quantity`` units; tiers
+    # give more for larger quantities. Without targets it covers the whole
+    # catalogue, categories include their subcategories. A line gets the
+    # best promotion it qualifies for, see apps.promotions.rules.
+    name = models.CharField(max_length=100)
+    min_quantity = models.PositiveIntegerField(default=1)
+    products = models.ManyToManyField(Product, blank=True, related_name='promotions')
+    categories = models.ManyToManyField(Category, blank=True, related_name='promotions')
+    brands = models.ManyToManyField(Brand, blank=True, related_name='promotions')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['starts_at'], condition=Q(is_active=True), name='promotion_active_start_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class PromotionTier(models.Model):
+    promotion = models.ForeignKey(Promotion, on_delete=models.CASCADE, related_name='tiers')
+    min_quantity = models.PositiveIntegerField()
+    value = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['promotion', 'min_quantity'], name='promotion_tier_quantity_uniq'),
+        ]
+
+    def clean(self):
+        # Same bounds as the promotion's own value, in its kind.
+        if self.promotion_id is not None:
+            validate_value(self.promotion.kind, self.value)
+
+
+class Coupon(Discount):
+    # Taken off the cart total after the line promotions, for carts reaching
+    # ``min_subtotal``. Codes are kept upper-case and matched ignoring case.
+    code = models.CharField(max_length=50, unique=True)
+    min_subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Counted at checkout; None for no limit.
+    max_uses = models.PositiveIntegerField(null=True, blank=True)
+    times_used = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['starts_at'], condition=Q(is_active=True), name='coupon_active_start_idx'),
+        ]
+
+    def __str__(self):
+        return self.code
+
+    def save(self, *args, **kwargs):
+        self.code = self.code.strip().upper()
+        super().save(*args, **kwargs)
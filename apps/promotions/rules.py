@@ -0,0 +1,288 @@
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from decimal import Decimal
+from itertools import chain
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+
+from apps.products import pricing
+from apps.products.cache import get_cache
+from apps.products.models import Category
+from apps.promotions.models import Coupon, Discount, Promotion, PromotionTier
+
+VERSION_KEY = 'promotions:version'
+ZERO = Decimal('0.00')
+
+# A cart line; ``amount`` is what its units cost at their final price.
+Line = namedtuple('Line', ['product_id', 'category_id', 'brand_id', 'quantity', 'amount'])
+CouponRule = namedtuple('CouponRule', ['id', 'code', 'kind', 'value', 'min_subtotal'])
+# ``line_discounts`` follow the lines; ``promotions`` are {'id', 'name', 'amount'} dicts.
+Pricing = namedtuple('Pricing', [
+    'subtotal', 'line_discounts', 'promotions', 'coupon', 'coupon_discount', 'discount', 'total',
+])
+
+
+class Schedule:
+    """
+    The best percentage and the best amount per unit a set of promotions gives a line, by its quantity.
+
+    Built from ``(min_quantity, kind, value, promotion_id)`` tiers. A line
+    reaching several tiers gets the best of them, so it never gets less for
+    buying more.
+    """
+    __slots__ = ('quantities', 'percent', 'fixed')
+
+    def __init__(self, tiers):
+        self.quantities = []
+        self.percent = []
+        self.fixed = []
+        best = {Discount.PERCENT: (ZERO, None), Discount.FIXED: (ZERO, None)}
+        for quantity, kind, value, promotion_id in sorted(tiers, key=lambda tier: tier[0]):
+            if value > best[kind][0]:
+                best[kind] = (value, promotion_id)
+            if self.quantities and self.quantities[-1] == quantity:
+                self.percent[-1], self.fixed[-1] = best[Discount.PERCENT], best[Discount.FIXED]
+            else:
+                self.quantities.append(quantity)
+                self.percent.append(best[Discount.PERCENT])
+                self.fixed.append(best[Discount.FIXED])
+
+    def discount(self, quantity, amount):
+        """Return ``(discount, promotion_id)`` for a line; ``(0, None)`` when no tier is reached."""
+        index = bisect_right(self.quantities, quantity) - 1
+        if index < 0:
+            return ZERO, None
+        percent, percent_id = self.percent[index]
+        fixed, fixed_id = self.fixed[index]
+        by_percent = min(pricing.percent_of(amount, percent), amount) if percent_id is not None else ZERO
+        by_amount = min(fixed * quantity, amount)
+        if by_amount > by_percent:
+            return by_amount, fixed_id
+        return by_percent, percent_id
+
+
+class RuleIndex:
+    """
+    The live promotions and coupons, compiled for pricing carts.
+
+    Promotions are merged into one Schedule per product, per category (with
+    those of its ancestors), per brand and one for the whole catalogue, so a
+    line is priced from at most four lookups whatever the number of
+    promotions, and a cart in time linear in its lines without queries.
+    ``valid_until`` is the next start or end of a promotion or coupon, when
+    the index has to be compiled again.
+    """
+
+    def __init__(self, version=None, valid_until=None):
+        self.version = version
+        self.valid_until = valid_until
+        self.by_product = {}
+        self.by_category = {}
+        self.by_brand = {}
+        self.everywhere = None
+        self.names = {}
+        self.coupons = {}
+
+    @classmethod
+    def build(cls, promotions, tiers, targets, category_paths, coupons, version=None, valid_until=None):
+        """
+        Compile rows read from the database, or generated by the benchmarks.
+
+        ``promotions`` are ``(id, name, kind, value, min_quantity)``, ``tiers``
+        ``(promotion_id, min_quantity, value)``, ``targets`` ``(promotion_id,
+        'product' | 'category' | 'brand', target_id)`` and ``coupons``
+        CouponRules. ``category_paths`` maps category ids to their paths.
+        """
+        index = cls(version=version, valid_until=valid_until)
+        kinds = {}
+        schedules = {}
+        for promotion_id, name, kind, value, min_quantity in promotions:
+            index.names[promotion_id] = name
+            kinds[promotion_id] = kind
+            schedules[promotion_id] = [(min_quantity, kind, value, promotion_id)]
+        for promotion_id, min_quantity, value in tiers:
+            if promotion_id in schedules:
+                schedules[promotion_id].append((min_quantity, kinds[promotion_id], value, promotion_id))
+
+        grouped = {'product': {}, 'category': {}, 'brand': {}}
+        targeted = set()
+        for promotion_id, target, target_id in targets:
+            if promotion_id in schedules:
+                grouped[target].setdefault(target_id, []).extend(schedules[promotion_id])
+                targeted.add(promotion_id)
+
+        index.by_product = {key: Schedule(rows) for key, rows in grouped['product'].items()}
+        index.by_brand = {key: Schedule(rows) for key, rows in grouped['brand'].items()}
+        by_category = grouped['category']
+        if by_category:
+            for category_id, path in category_paths.items():
+                rows = list(chain.from_iterable(
+                    by_category.get(int(ancestor), ()) for ancestor in path.strip('/').split('/') if ancestor
+                ))
+                if rows:
+                    index.by_category[category_id] = Schedule(rows)
+        everywhere = list(chain.from_iterable(rows for key, rows in schedules.items() if key not in targeted))
+        if everywhere:
+            index.everywhere = Schedule(everywhere)
+        index.coupons = {coupon.code: coupon for coupon in coupons}
+        return index
+
+    def expired(self, now=None):
+        return self.valid_until is not None and (now or timezone.now()) >= self.valid_until
+
+    def evaluate(self, lines, coupon_code=''):
+        """
+        Price ``lines`` (Lines) and the coupon ``coupon_code``, if any, and return a Pricing.
+
+        Each line gets its best promotion; promotions do not add up. The
+        coupon comes off what is left, when that reaches its minimum; an
+        unknown or expired code is ignored and ``coupon`` is None.
+        """
+        subtotal = ZERO
+        line_discounts = []
+        applied = {}
+        by_product, by_category, by_brand = self.by_product, self.by_category, self.by_brand
+        for line in lines:
+            subtotal += line.amount
+            best, best_id = ZERO, None
+            for schedule in (by_product.get(line.product_id), by_category.get(line.category_id),
+                             by_brand.get(line.brand_id), self.everywhere):
+                if schedule is not None:
+                    discount, promotion_id = schedule.discount(line.quantity, line.amount)
+                    if discount > best:
+                        best, best_id = discount, promotion_id
+            line_discounts.append(best)
+            if best_id is not None:
+                applied[best_id] = applied.get(best_id, ZERO) + best
+
+        left = subtotal - sum(applied.values(), ZERO)
+        coupon = self.coupons.get(coupon_code.strip().upper()) if coupon_code else None
+        coupon_discount = ZERO
+        if coupon is not None and left > 0 and left >= coupon.min_subtotal:
+            if coupon.kind == Discount.PERCENT:
+                coupon_discount = pricing.percent_of(left, coupon.value)
+            else:
+                coupon_discount = min(coupon.value, left)
+        else:
+            coupon = None
+        discount = subtotal - left + coupon_discount
+        return Pricing(
+            subtotal=subtotal,
+            line_discounts=line_discounts,
+            promotions=[{'id': promotion_id, 'name': self.names[promotion_id], 'amount': amount}
+                        for promotion_id, amount in applied.items()],
+            coupon=coupon,
+            coupon_discount=coupon_discount,
+            discount=discount,
+            total=subtotal - discount,
+        )
+
+
+def _live(now):
+    return Q(is_active=True) & (Q(starts_at__isnull=True) | Q(starts_at__lte=now)) & (
+        Q(ends_at__isnull=True) | Q(ends_at__gt=now)
+    )
+
+
+def compile_rules(now=None, version=None):
+    """Read the promotions and coupons live at ``now`` into a new RuleIndex."""
+    now = now or timezone.now()
+    live = Promotion.objects.filter(_live(now))
+    promotions = list(live.values_list('id', 'name', 'kind', 'value', 'min_quantity', 'ends_at'))
+    ids = live.values('id')
+    tiers = PromotionTier.objects.filter(promotion__in=ids).values_list('promotion_id', 'min_quantity', 'value')
+    targets = []
+    for target, field in (('product', Promotion.products), ('category', Promotion.categories),
+                          ('brand', Promotion.brands)):
+        column = f'{target}_id'
+        targets.extend((promotion_id, target, target_id) for promotion_id, target_id in
+                       field.through.objects.filter(promotion__in=ids).values_list('promotion_id', column))
+    category_paths = {}
+    if any(target == 'category' for _, target, _ in targets):
+        category_paths = dict(Category.objects.values_list('id', 'path'))
+    coupons = list(Coupon.objects.filter(_live(now)).filter(
+        Q(max_uses__isnull=True) | Q(times_used__lt=F('max_uses')),
+    ).values_list('id', 'code', 'kind', 'value', 'min_subtotal', 'ends_at'))
+
+    # Compiled again at the next start or end.
+    boundaries = [ends_at for *_, ends_at in chain(promotions, coupons) if ends_at is not None]
+    for model in (Promotion, Coupon):
+        boundaries.append(model.objects.filter(is_active=True, starts_at__gt=now).aggregate(
+            start=Min('starts_at'),
+        )['start'])
+    return RuleIndex.build(
+        [row[:-1] for row in promotions], tiers, targets, category_paths,
+        [CouponRule(*row[:-1]) for row in coupons],
+        version=version, valid_until=min(filter(None, boundaries), default=None),
+    )
+
+
+_compiled = None
+_lock = threading.Lock()
+
+
+def get_version():
+    """The version of the promotions, a nanosecond timestamp like the product cache versions."""
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def bump_version():
+    get_cache().set(VERSION_KEY, time.time_ns(), None)
+    # Another process may compile the uncommitted state meanwhile.
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: get_cache().set(VERSION_KEY, time.time_ns(), None))
+
+
+def get_rules():
+    """
+    Return this process's RuleIndex.
+
+    It is compiled on first use and again once the promotions' version has
+    moved on, or a promotion or coupon started or ended since. Each call
+    costs one cache read.
+    """
+    global _compiled
+    version = get_version()
+    rules = _compiled
+    if rules is None or rules.version != version or rules.expired():
+        with _lock:
+            rules = _compiled
+            if rules is None or rules.version != version or rules.expired():
+                rules = _compiled = compile_rules(version=version)
+    return rules
+
+
+async def aget_rules():
+    """Async get_rules(); compiling runs in a thread."""
+    version = await get_cache().aget(VERSION_KEY)
+    rules = _compiled
+    if version is None or rules is None or rules.version != version or rules.expired():
+        return await sync_to_async(get_rules)()
+    return rules
+
+
+def clear_rules():
+    global _compiled
+    _compiled = None
+
+
+def redeem(coupon):
+    """Count a use of ``coupon`` (a CouponRule), unless it ran out meanwhile; returns whether it was counted."""
+    counted = Coupon.objects.filter(
+        Q(max_uses__isnull=True) | Q(times_used__lt=F('max_uses')), pk=coupon.id, is_active=True,
+    ).update(times_used=F('times_used') + 1)
+    # The last use takes the coupon out of the index.
+    if counted and Coupon.objects.filter(pk=coupon.id, times_used__gte=F('max_uses')).exists():
+        bump_version()
+    return bool(counted)
@@ -0,0 +1,18 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from apps.products.models import Category
+from apps.promotions.models import Coupon, Promotion, PromotionTier
+from apps.promotions.rules import bump_version
+
+
+# Category moves change which categories a category promotion covers.
+@receiver([post_save, post_delete], sender=Promotion)
+@receiver([post_save, post_delete], sender=PromotionTier)
+@receiver([post_save, post_delete], sender=Coupon)
+@receiver([post_save, post_delete], sender=Category)
+@receiver(m2m_changed, sender=Promotion.products.through)
+@receiver(m2m_changed, sender=Promotion.categories.through)
+@receiver(m2m_changed, sender=Promotion.brands.through)
+def invalidate_rules(sender, **kwargs):
+    bump_version()
@@ -0,0 +1,184 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from apps.orders.models import Cart, CartItem, Order
+from apps.products.models import Brand, Category, Product
+from apps.promotions import rules
+from apps.promotions.models import Coupon, Discount, Promotion, PromotionTier
+from apps.promotions.rules import Line
+
+User = get_user_model()
+
+
+class RulesTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.phones = Category.objects.create(name='Phones', slug='phones', description='-')
+        cls.android = Category.objects.create(name='Android', slug='android', description='-', parent=cls.phones)
+        cls.books = Category.objects.create(name='Books', slug='books', description='-')
+        cls.acme = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        cls.other = Brand.objects.create(name='Other', logo='https://example.com/o.png', description='-')
+        cls.phone = Product.objects.create(name='Phone', slug='phone', description='-', category=cls.android,
+                                           brand=cls.acme, price='100.00', stock_quantity=10)
+        cls.book = Product.objects.create(name='Book', slug='book', description='-', category=cls.books,
+                                          brand=cls.other, price='20.00', stock_quantity=10)
+
+    def setUp(self):
+        # The compiled index outlives the rolled back test data.
+        rules.clear_rules()
+        self.addCleanup(rules.clear_rules)
+
+    def line(self, product, quantity=1):
+        return Line(product.id, product.category_id, product.brand_id, quantity, product.final_price * quantity)
+
+    def promotion(self, name, value, kind=Discount.PERCENT, **targets):
+        promotion = Promotion.objects.create(name=name, kind=kind, value=value)
+        for field, objects in targets.items():
+            getattr(promotion, field).set(objects)
+        return promotion
+
+
+class RuleIndexTest(RulesTestCase):
+    def test_targets(self):
+        self.promotion('Phones', 10, categories=[self.phones])
+        self.promotion('Acme', 15, brands=[self.acme])
+        self.promotion('Book', 5, products=[self.book])
+        priced = rules.get_rules().evaluate([self.line(self.phone), self.line(self.book, 2)])
+        # Each line gets its best promotion, they do not add up.
+        self.assertEqual(priced.line_discounts, [Decimal('15.00'), Decimal('2.00')])
+        self.assertEqual(sorted(promotion['name'] for promotion in priced.promotions), ['Acme', 'Book'])
+        self.assertEqual((priced.subtotal, priced.discount, priced.total),
+                         (Decimal('140.00'), Decimal('17.00'), Decimal('123.00')))
+
+    def test_sitewide_and_fixed_amounts(self):
+        self.promotion('Everything', 5)
+        self.promotion('Books', '30.00', kind=Discount.FIXED, categories=[self.books])
+        priced = rules.get_rules().evaluate([self.line(self.phone), self.line(self.book, 2)])
+        # An amount per unit never takes a line below zero.
+        self.assertEqual(priced.line_discounts, [Decimal('5.00'), Decimal('40.00')])
+
+    def test_tiers(self):
+        promotion = Promotion.objects.create(name='Bulk', value=5, min_quantity=2)
+        promotion.products.set([self.book])
+        PromotionTier.objects.create(promotion=promotion, min_quantity=5, value=10)
+        PromotionTier.objects.create(promotion=promotion, min_quantity=10, value=20)
+        index = rules.get_rules()
+        self.assertEqual([index.evaluate([self.line(self.book, quantity)]).discount for quantity in (1, 2, 5, 12)],
+                         [Decimal('0.00'), Decimal('2.00'), Decimal('10.00'), Decimal('48.00')])
+
+    def test_discount_never_exceeds_the_line(self):
+        promotion = Promotion.objects.create(name='Bulk', value=10, min_quantity=1)
+        PromotionTier.objects.create(promotion=promotion, min_quantity=2, value=150)
+        priced = rules.get_rules().evaluate([self.line(self.phone, 2)])
+        self.assertEqual((priced.discount, priced.total), (Decimal('200.00'), Decimal('0.00')))
+        with self.assertRaises(ValidationError):
+            PromotionTier(promotion=promotion, min_quantity=3, value=150).full_clean()
+        with self.assertRaises(ValidationError):
+            PromotionTier(promotion=promotion, min_quantity=3, value=0).full_clean()
+        PromotionTier(promotion=promotion, min_quantity=3, value=100).full_clean()
+        fixed = Promotion.objects.create(name='Fixed', kind=Discount.FIXED, value=5)
+        PromotionTier(promotion=fixed, min_quantity=3, value=150).full_clean()
+
+    def test_schedule(self):
+        now = timezone.now()
+        Promotion.objects.create(name='Over', value=50, ends_at=now - timedelta(hours=1))
+        Promotion.objects.create(name='Later', value=10, starts_at=now + timedelta(hours=1))
+        Promotion.objects.create(name='Inactive', value=90, is_active=False)
+        index = rules.compile_rules(now)
+        self.assertEqual(index.evaluate([self.line(self.book)]).discount, Decimal('0.00'))
+        self.assertEqual(index.valid_until, now + timedelta(hours=1))
+        self.assertTrue(index.expired(now + timedelta(hours=2)))
+        self.assertEqual(rules.compile_rules(now + timedelta(hours=2)).evaluate([self.line(self.book)]).discount,
+                         Decimal('2.00'))
+
+    def test_recompiled_when_promotions_change(self):
+        self.assertEqual(rules.get_rules().evaluate([self.line(self.phone)]).discount, Decimal('0.00'))
+        promotion = self.promotion('Phones', 10, categories=[self.phones])
+        self.assertEqual(rules.get_rules().evaluate([self.line(self.phone)]).discount, Decimal('10.00'))
+        # Moving the category out of Phones takes it out of the promotion.
+        self.android.parent = None
+        self.android.save()
+        self.assertEqual(rules.get_rules().evaluate([self.line(self.phone)]).discount, Decimal('0.00'))
+        promotion.categories.add(self.android)
+        self.assertEqual(rules.get_rules().evaluate([self.line(self.phone)]).discount, Decimal('10.00'))
+        promotion.delete()
+        self.assertEqual(rules.get_rules().evaluate([self.line(self.phone)]).discount, Decimal('0.00'))
+
+    def test_evaluate_runs_no_queries(self):
+        self.promotion('Phones', 10, categories=[self.phones])
+        index = rules.get_rules()
+        lines = [self.line(self.phone, quantity) for quantity in range(1, 51)]
+        with self.assertNumQueries(0):
+            priced = index.evaluate(lines, 'NONE')
+        self.assertEqual(priced.discount, Decimal('12750.00'))
+
+    def test_coupon(self):
+        self.promotion('Books', 50, categories=[self.books])
+        Coupon.objects.create(code='save10', value=10, min_subtotal='100.00')
+        Coupon.objects.create(code='FIVE', kind=Discount.FIXED, value=5)
+        index = rules.get_rules()
+        # Taken off what is left after the promotions, once that reaches the minimum.
+        priced = index.evaluate([self.line(self.phone), self.line(self.book)], ' Save10')
+        self.assertEqual((priced.coupon.code, priced.coupon_discount, priced.total),
+                         ('SAVE10', Decimal('11.00'), Decimal('99.00')))
+        priced = index.evaluate([self.line(self.book, 2)], 'SAVE10')
+        self.assertEqual((priced.coupon, priced.total), (None, Decimal('20.00')))
+        self.assertEqual(index.evaluate([self.line(self.book)], 'five').total, Decimal('5.00'))
+
+    def test_redeem_respects_max_uses(self):
+        Coupon.objects.create(code='ONCE', value=10, max_uses=1)
+        coupon = rules.get_rules().coupons['ONCE']
+        self.assertTrue(rules.redeem(coupon))
+        self.assertFalse(rules.redeem(coupon))
+        self.assertNotIn('ONCE', rules.get_rules().coupons)
+
+
+class CartPromotionsAPITest(RulesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_user(username='buyer')
+        cls.cart = Cart.objects.create(user=cls.user)
+        CartItem.objects.create(cart=cls.cart, product=cls.phone, quantity=2)
+        CartItem.objects.create(cart=cls.cart, product=cls.book, quantity=1)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.promotion('Acme', 10, brands=[self.acme])
+        Coupon.objects.create(code='SAVE5', kind=Discount.FIXED, value=5, max_uses=1)
+
+    def test_cart_totals(self):
+        self.assertEqual(self.client.post('/orders/cart/coupon/', {'code': 'nope'}).status_code, 400)
+        response = self.client.post('/orders/cart/coupon/', {'code': 'save5'})
+        self.assertEqual(response.data, {'code': 'SAVE5'})
+        response = self.client.get('/orders/cart/')
+        self.assertEqual(response.data['coupon_code'], 'SAVE5')
+        self.assertEqual(response.data['promotions'][0]['amount'], Decimal('20.00'))
+        self.assertEqual((response.data['coupon_discount'], response.data['discount_amount'],
+                          response.data['total_amount']), (Decimal('5'), Decimal('25.00'), Decimal('195.00')))
+        self.assertEqual(self.client.delete('/orders/cart/coupon/').status_code, 204)
+        self.assertEqual(self.client.get('/orders/cart/').data['total_amount'], Decimal('200.00'))
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post('/orders/cart/coupon/', {'code': 'SAVE5'}).status_code, 403)
+        self.assertEqual(self.client.delete('/orders/cart/coupon/').status_code, 403)
+
+    def test_checkout(self):
+        self.client.post('/orders/cart/coupon/', {'code': 'SAVE5'})
+        response = self.client.post('/orders/checkout/', {'shipping_address': 'Tashkent, Amir Temur 1',
+                                                          'phone': '+998901234567'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual((order.total_amount, order.discount_amount, order.coupon_code),
+                         (Decimal('195.00'), Decimal('25.00'), 'SAVE5'))
+        self.assertEqual(sorted(order.items.values_list('product__slug', 'discount_amount')),
+                         [('book', Decimal('0.00')), ('phone', Decimal('20.00'))])
+        self.assertEqual(Coupon.objects.get().times_used, 1)
+        self.assertEqual(Cart.objects.get().coupon_code, '')
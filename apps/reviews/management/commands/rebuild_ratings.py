@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.reviews.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized rating aggregates on Product from ProductReview.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--verify', action='store_true',
+                            help='Only report products whose aggregates are out of date.')
+
+    def handle(self, *args, **options):
+        drifted = rebuild_ratings(batch_size=options['batch_size'], dry_run=options['verify'])
+        if options['verify']:
+            if drifted:
+                raise CommandError(f'{len(drifted)} product(s) have stale ratings: {drifted[:20]}')
+            self.stdout.write(self.style.SUCCESS('All product ratings are up to date.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt ratings, {len(drifted)} product(s) updated.'))
@@ -18,6 +18,9 @@ class ProductReview(models.Model):
 
     class Meta:
         unique_together = ['product', 'user']
+        indexes = [
+            models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx'),
+        ]
 
 
 class Wishlist(models.Model):
@@ -0,0 +1,83 @@
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from apps.products.models import Product
+from apps.reviews.models import ProductReview
+
+RATINGS = range(1, 6)
+
+
+def apply_rating(product_id, rating, sign):
+    """
+    Add (sign=1) or remove (sign=-1) one rating from a product's aggregates.
+
+    A single UPDATE with F-expressions, so concurrent reviews never lose counts.
+    All right-hand sides see the pre-update row, hence the ``-sign`` guard.
+    """
+    count = F('rating_count') + sign
+    total = F('rating_sum') + sign * rating
+    updates = {
+        'updated_at': timezone.now(),
+        'rating_count': count,
+        'rating_sum': total,
+        'average_rating': Case(
+            When(rating_count__gt=-sign, then=Cast(total, FloatField()) / Cast(count, FloatField())),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+    }
+    if rating in RATINGS:
+        updates[f'rating_{rating}_count'] = F(f'rating_{rating}_count') + sign
+    Product.objects.filter(pk=product_id).update(**updates)
+
+
+def compute_ratings(product_ids):
+    """Return the aggregates recomputed from ProductReview for ``product_ids``."""
+    rows = ProductReview.objects.filter(product_id__in=product_ids).values('product_id').annotate(
+        rating_count=Count('id'),
+        rating_sum=Sum('rating'),
+        **{f'rating_{rating}_count': Count('id', filter=Q(rating=rating)) for rating in RATINGS},
+    )
+    empty = {field: 0 for field in Product.RATING_COUNTER_FIELDS}
+    result = {product_id: dict(empty, average_rating=0.0) for product_id in product_ids}
+    for row in rows:
+        values = {field: row[field] for field in Product.RATING_COUNTER_FIELDS}
+        values['average_rating'] = values['rating_sum'] / values['rating_count']
+        result[row['product_id']] = values
+    return result
+
+
+def rebuild_ratings(batch_size=1000, dry_run=False):
+    """
+    Recompute the aggregates for every product in id batches.
+
+    Only drifted rows are written. Returns the ids that were out of date.
+    """
+    drifted = []
+    last_id = 0
+    while True:
+        products = list(
+            Product.objects.filter(id__gt=last_id).order_by('id').only('id', *Product.RATING_FIELDS)[:batch_size]
+        )
+        if not products:
+            return drifted
+        last_id = products[-1].id
+        expected = compute_ratings([product.id for product in products])
+        changed = []
+        for product in products:
+            values = expected[product.id]
+            if any(not _same(getattr(product, field), value) for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(product, field, value)
+                product.updated_at = timezone.now()
+                changed.append(product)
+        drifted.extend(product.id for product in changed)
+        if changed and not dry_run:
+            Product.objects.bulk_update(changed, [*Product.RATING_FIELDS, 'updated_at'])
+
+
+def _same(current, expected):
+    if isinstance(expected, float):
+        return abs(current - expected) < 1e-9
+    return current == expected
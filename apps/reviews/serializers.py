@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from rest_framework import serializers
+
+from apps.reviews.models import ProductReview
+
+User = get_user_model()
+
+
+class InlineReviewUserSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('id', 'username')
+
+
+class ProductReviewListSerializer(serializers.ModelSerializer):
+    user = InlineReviewUserSerializer(read_only=True)
+
+    class Meta:
+        model = ProductReview
+        fields = ('id', 'user', 'rating', 'title', 'comment', 'is_verified_purchase', 'created_at')
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from apps.products.cache import bump_versions
+from apps.reviews.models import ProductReview
+from apps.reviews.ratings import apply_rating
+
+
+@receiver(pre_save, sender=ProductReview)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if instance.pk and not raw:
+        instance._previous_rating = (
+            sender.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+        )
+
+
+@receiver(post_save, sender=ProductReview)
+def update_rating_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    current = (instance.product_id, instance.rating)
+    bump_versions([instance.product_id] + ([previous[0]] if previous else []))
+    if previous == current:
+        return
+    if previous is not None:
+        apply_rating(*previous, sign=-1)
+    apply_rating(*current, sign=1)
+
+
+@receiver(post_delete, sender=ProductReview)
+def update_rating_on_delete(sender, instance, **kwargs):
+    apply_rating(instance.product_id, instance.rating, sign=-1)
+    bump_versions([instance.product_id])
@@ -1,3 +1,87 @@
-from django.test import TestCase
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from rest_framework.test import APITestCase
+
+from apps.products.models import Brand, Category, Product
+from apps.reviews.models import ProductReview
+
+User = get_user_model()
+
+
+class ProductReviewListAPITest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones', description='-')
+        brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        cls.product = Product.objects.create(name='Phone', slug='phone', description='-', category=category,
+                                             brand=brand, price='10.00')
+        for i in range(5):
+            user = User.objects.create_user(username=f'user{i}')
+            ProductReview.objects.create(product=cls.product, user=user, rating=5, title='t', comment='c')
+
+    def test_reviews_are_paginated_newest_first(self):
+        response = self.client.get(f'/reviews/products/{self.product.id}/', {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['user']['username'] for row in response.data['results']], ['user4', 'user3'])
+        with self.assertNumQueries(2):
+            response = self.client.get(response.data['next'])
+        self.assertEqual([row['user']['username'] for row in response.data['results']], ['user2', 'user1'])
+
+    def test_unknown_product(self):
+        self.assertEqual(self.client.get('/reviews/products/999/').status_code, 404)
+
+
+class ProductRatingAggregatesTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones', description='-')
+        brand = Brand.objects.create(name='Acme', logo='https://example.com/a.png', description='-')
+        cls.product = Product.objects.create(name='Phone', slug='phone', description='-', category=category,
+                                             brand=brand, price='10.00')
+        cls.other = Product.objects.create(name='Other', slug='other', description='-', category=category,
+                                           brand=brand, price='10.00')
+        cls.users = [User.objects.create_user(username=f'user{i}') for i in range(3)]
+
+    def review(self, user, rating, product=None):
+        return ProductReview.objects.create(product=product or self.product, user=user, rating=rating,
+                                            title='t', comment='c')
+
+    def assertRatings(self, product, count, average, histogram):
+        product.refresh_from_db()
+        self.assertEqual(product.rating_count, count)
+        self.assertAlmostEqual(product.average_rating, average)
+        self.assertEqual([getattr(product, f'rating_{i}_count') for i in range(1, 6)], histogram)
+
+    def test_aggregates_follow_review_changes(self):
+        first = self.review(self.users[0], 5)
+        self.review(self.users[1], 2)
+        self.assertRatings(self.product, 2, 3.5, [0, 1, 0, 0, 1])
+
+        first.rating = 4
+        first.save()
+        self.assertRatings(self.product, 2, 3.0, [0, 1, 0, 1, 0])
+
+        first.product = self.other
+        first.save()
+        self.assertRatings(self.product, 1, 2.0, [0, 1, 0, 0, 0])
+        self.assertRatings(self.other, 1, 4.0, [0, 0, 0, 1, 0])
+
+        ProductReview.objects.filter(product=self.product).delete()
+        self.assertRatings(self.product, 0, 0.0, [0, 0, 0, 0, 0])
+
+    def test_detail_without_reviews(self):
+        response = self.client.get(f'/products/{self.product.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['average_rating'], 0)
+        self.assertEqual(response.data['reviews_count'], 0)
+
+    def test_rebuild_command(self):
+        self.review(self.users[0], 3)
+        Product.objects.filter(pk=self.product.pk).update(rating_count=7, average_rating=1.0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_ratings', '--verify', stdout=StringIO())
+        call_command('rebuild_ratings', '--batch-size', '1', stdout=StringIO())
+        self.assertRatings(self.product, 1, 3.0, [0, 0, 1, 0, 0])
+        call_command('rebuild_ratings', '--verify', stdout=StringIO())
@@ -0,0 +1,9 @@
+from django.urls import path
+
+from apps.reviews import views
+
+app_name = 'reviews'
+
+urlpatterns = [
+    path('products/<int:product_id>/', views.ProductReviewListAPIView.as_view()),
+]
@@ -1,3 +1,24 @@
-from django.shortcuts import render
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-# Create your views here.
+from apps.products.models import Product
+from apps.reviews.models import ProductReview
+from apps.reviews.serializers import ProductReviewListSerializer
+from core.pagination import KeysetPagination
+
+
+class ProductReviewListAPIView(APIView):
+    serializer_class = ProductReviewListSerializer
+    pagination_class = KeysetPagination
+    model = ProductReview
+
+    def get(self, request, product_id):
+        if not Product.objects.filter(id=product_id, is_active=True).exists():
+            return Response(data={'message':'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        reviews = self.model.objects.filter(product_id=product_id).select_related('user')
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(reviews, request, view=self)
+        serializer = self.serializer_class(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
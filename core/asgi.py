@@ -9,8 +9,20 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler, ASGIRequest
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup(set_prefix=False)
 
-application = get_asgi_application()
+
+class AsyncRequest(ASGIRequest):
+    # Serve the read endpoints that have async views with them.
+    urlconf = 'core.asgi_urls'
+
+
+class AsyncHandler(ASGIHandler):
+    request_class = AsyncRequest
+
+
+application = AsyncHandler()
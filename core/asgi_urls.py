@@ -0,0 +1,18 @@
+"""
+URL configuration for requests served over ASGI, see core.asgi.
+
+The catalogue and cart read endpoints are routed to their async views; all
+other URLs are the same as in core.urls.
+"""
+from django.urls import path
+
+from apps.orders.views import AsyncCartRetrieveAPIView
+from apps.products.views import AsyncProductDetailAPIView, AsyncProductListAPIView
+from core.urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('products/', AsyncProductListAPIView.as_view()),
+    path('products/<int:pk>/', AsyncProductDetailAPIView.as_view()),
+    path('orders/cart/', AsyncCartRetrieveAPIView.as_view()),
+    *sync_urlpatterns,
+]
@@ -0,0 +1,162 @@
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.settings import ISO_8601, api_settings
+
+
+class Method:
+    """Computed value: ``func`` applied to the values of ``lookups`` (full ORM paths)."""
+
+    def __init__(self, func, *lookups):
+        self.func = func
+        self.lookups = lookups
+
+
+def decimal_converter(field):
+    """Return a converter matching ``field.to_representation`` for values with the field's precision."""
+    coerce = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce or field.localize:
+        return field.to_representation
+    exponent = -field.decimal_places
+
+    def convert(value):
+        if value is None:
+            return None
+        # Database values already carry the field's precision; anything else
+        # takes DRF's quantizing path.
+        if value.as_tuple().exponent != exponent:
+            return field.to_representation(value)
+        return f'{value:f}'
+    return convert
+
+
+def datetime_converter(field):
+    """
+    Return a converter matching ``field.to_representation`` for aware datetimes.
+
+    It takes the current timezone as a second argument, so callers look it up
+    once rather than per value.
+    """
+    iso = getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601 and not getattr(field, 'timezone', None)
+
+    def convert(value, tz):
+        if value is None:
+            return None
+        if not iso or value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(tz).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    convert.needs_timezone = True
+    return convert
+
+
+# Fields whose representation is the database value itself.
+_IDENTITY_FIELDS = (
+    serializers.IntegerField, serializers.CharField, serializers.BooleanField, serializers.FloatField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+
+def converter_for(field):
+    """Return the converter for ``field``'s database values, None when they are used as they are."""
+    if isinstance(field, serializers.DecimalField):
+        return decimal_converter(field)
+    if isinstance(field, serializers.DateTimeField):
+        return datetime_converter(field)
+    if isinstance(field, _IDENTITY_FIELDS) and not getattr(field, 'coerce_to_string', False):
+        return None
+    return _skip_none(field.to_representation)
+
+
+def _skip_none(convert):
+    # DRF never calls to_representation for None.
+    return lambda value: None if value is None else convert(value)
+
+
+class RowSerializer:
+    """
+    Read-only serializer compiled from a DRF serializer into one function over ``values_list()`` rows.
+
+    The output has the same keys, nesting and values as the DRF serializer,
+    so it renders to identical JSON, but skips model instances and the per
+    field machinery. Method fields must be given in ``methods`` (keyed by
+    dotted path, e.g. ``'product.final_price'``) as a lookup or a Method.
+    Compilation happens on first use, once the app registry is ready.
+    """
+
+    def __init__(self, serializer_class, methods=None):
+        self.serializer_class = serializer_class
+        self.methods = methods or {}
+        self._build = None
+        self._lock = threading.Lock()
+        self.lookups = []
+
+    def values(self, queryset):
+        """``queryset`` as named rows of the compiled lookups plus its annotations (read by keyset cursors)."""
+        self._compile()
+        extra = [name for name in queryset.query.annotation_select if name not in self.lookups]
+        return queryset.values_list(*self.lookups, *extra, named=True)
+
+    def to_representation(self, rows):
+        self._compile()
+        build = self._build
+        tz = timezone.get_current_timezone()
+        return [build(row, tz) for row in rows]
+
+    def _compile(self):
+        if self._build is not None:
+            return
+        with self._lock:
+            if self._build is None:
+                namespace = {}
+                expression = self._compile_serializer(self.serializer_class(), '', '', namespace)
+                exec(f'def build(row, tz):\n    return {expression}\n', namespace)
+                self._build = namespace['build']
+
+    def _compile_serializer(self, serializer, prefix, path, namespace):
+        items = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            dotted = f'{path}{name}'
+            lookup = f'{prefix}{field.source}'
+            if dotted in self.methods:
+                expression = self._compile_method(self.methods[dotted], namespace)
+            elif isinstance(field, serializers.SerializerMethodField):
+                raise ImproperlyConfigured(f'{type(self).__name__} needs a method for {dotted!r}')
+            elif isinstance(field, serializers.ListSerializer):
+                raise ImproperlyConfigured(f'{dotted!r} is a to-many relation and can not be read from one row')
+            elif isinstance(field, serializers.BaseSerializer):
+                nested = self._compile_serializer(field, f'{lookup}__', f'{dotted}.', namespace)
+                expression = f'(None if row[{self._index(lookup)}] is None else {nested})'
+            else:
+                expression = self._column(lookup, converter_for(field), namespace)
+            items.append(f'{name!r}: {expression}')
+        return '{' + ', '.join(items) + '}'
+
+    def _compile_method(self, method, namespace):
+        if isinstance(method, str):
+            return self._column(method, None, namespace)
+        name = f'f{len(namespace)}'
+        namespace[name] = method.func
+        arguments = ', '.join(f'row[{self._index(lookup)}]' for lookup in method.lookups)
+        return f'{name}({arguments})'
+
+    def _column(self, lookup, convert, namespace):
+        reference = f'row[{self._index(lookup)}]'
+        if convert is None:
+            return reference
+        name = f'c{len(namespace)}'
+        namespace[name] = convert
+        if getattr(convert, 'needs_timezone', False):
+            return f'{name}({reference}, tz)'
+        return f'{name}({reference})'
+
+    def _index(self, lookup):
+        if lookup not in self.lookups:
+            self.lookups.append(lookup)
+        return self.lookups.index(lookup)
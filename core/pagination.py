@@ -0,0 +1,184 @@
+import base64
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a unique composite key such as (created_at, id).
+
+    Each page is fetched with ``WHERE key > cursor ORDER BY key LIMIT n``, so
+    page 1000 costs the same as page 1 and only one page is ever held in memory.
+    The last ordering field must be unique (normally ``id``) to keep it stable.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    sort_query_param = 'sort'
+    invalid_cursor_message = 'Invalid cursor'
+
+    # Named orderings a client can pick with ?sort=; the first one is the default.
+    orderings = {
+        'newest': ('-created_at', '-id'),
+    }
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset, reverse, position = self._page_queryset(queryset, request)
+        return self._paginate(list(queryset), reverse, position)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset, reverse, position = self._page_queryset(queryset, request)
+        return self._paginate([row async for row in queryset], reverse, position)
+
+    def _page_queryset(self, queryset, request):
+        reverse, position = self._prepare(request, queryset.model)
+        ordering = self.ordering
+        if reverse:
+            ordering = [self._flip(field) for field in ordering]
+        queryset = self._load_ordering(queryset).order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+        return queryset[:self.page_size + 1], reverse, position
+
+    def _prepare(self, request, model):
+        # Reads the page size, ordering and cursor, returning (reverse, position).
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.sort, self.ordering = self.get_ordering(request)
+        return self.decode_cursor(request, model)
+
+    def _paginate(self, rows, reverse, position):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_position = self.previous_position = None
+        if rows:
+            if has_more or reverse:
+                self.next_position = self._position(rows[-1])
+            if position is not None and (has_more or not reverse):
+                self.previous_position = self._position(rows[0])
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, request):
+        sort = request.query_params.get(self.sort_query_param)
+        if sort not in self.orderings:
+            sort = next(iter(self.orderings))
+        return sort, self.orderings[sort]
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(False, self.next_position)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(True, self.previous_position)
+
+    def encode_cursor(self, reverse, position):
+        payload = json.dumps({'s': self.sort, 'r': int(reverse), 'p': position}, default=self._encode_value)
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return False, None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            if payload['s'] != self.sort or len(payload['p']) != len(self.ordering):
+                raise ValueError
+            position = [
+                self._to_python(model, field, value) for field, value in zip(self.ordering, payload['p'])
+            ]
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return bool(payload.get('r')), position
+
+    def _load_ordering(self, queryset):
+        # The cursor is read from the last row: keep its fields out of only()
+        # or every page pays one more query to load them.
+        loaded, deferred = queryset.query.deferred_loading
+        if deferred or not loaded:
+            return queryset
+        opts = queryset.model._meta
+        names = []
+        for field in self.ordering:
+            try:
+                names.append(opts.get_field(field.lstrip('-')).name)
+            except FieldDoesNotExist:
+                continue
+        return queryset.only(*loaded, *names)
+
+    def _position(self, row):
+        return [getattr(row, field.lstrip('-')) for field in self.ordering]
+
+    @staticmethod
+    def _encode_value(value):
+        # Full precision: the cursor is compared for equality against the key.
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return value.isoformat()
+        if isinstance(value, decimal.Decimal):
+            return str(value)
+        raise TypeError(f'Cannot encode {type(value).__name__} in a cursor')
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _to_python(model, field, value):
+        try:
+            return model._meta.get_field(field.lstrip('-')).to_python(value)
+        except FieldDoesNotExist:
+            return value
+
+    @staticmethod
+    def _after(ordering, position):
+        # (a, b, c) > (x, y, z)  ==  a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
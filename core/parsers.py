@@ -0,0 +1,27 @@
+import io
+
+from django.conf import settings
+from rest_framework import parsers
+
+from core.renderers import JSONRenderer, orjson
+
+
+class JSONParser(parsers.JSONParser):
+    """
+    DRF's JSONParser backed by orjson for UTF-8 bodies when it is installed.
+
+    Anything orjson rejects is handed to DRF's parser, so invalid bodies get
+    the same ParseError messages and non-strict constants keep working.
+    """
+    renderer_class = JSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,181 @@
+import json
+import logging
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('core.profiling')
+
+# Frames from these files are skipped when looking for the code that ran a query.
+_SKIPPED_PATHS = (__file__, 'site-packages', 'dist-packages', '/lib/python')
+
+_IN_LIST_RE = re.compile(r'\bIN \((?:\s*%s\s*,?)+\)', re.IGNORECASE)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Reduce ``sql`` to its shape, so queries differing only in values group together."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def call_site():
+    """Return ``path:line in function`` for the innermost project frame."""
+    root = str(settings.BASE_DIR)
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(root) and not any(skipped in filename for skipped in _SKIPPED_PATHS):
+            return f'{filename[len(root) + 1:]}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+class QueryRecorder:
+    """
+    ``connection.execute_wrapper`` that times every query and remembers where it came from.
+
+    Install it with ``profile_queries()``; ``report()`` summarises what ran.
+    """
+
+    def __init__(self, threshold=None):
+        if threshold is None:
+            threshold = getattr(settings, 'QUERY_PROFILER_N_PLUS_ONE_THRESHOLD', 5)
+        self.threshold = threshold
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': params,
+                'alias': context['connection'].alias,
+                'duration': time.perf_counter() - start,
+                'site': call_site(),
+            })
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(query['duration'] for query in self.queries)
+
+    def report(self):
+        """
+        Return counts, DB time, repeated query shapes and the N+1 suspects.
+
+        ``duplicates`` are identical statements with identical parameters;
+        ``similar`` are shapes run more than once with any parameters. A shape
+        repeated at least ``threshold`` times is reported under ``n_plus_one``.
+        """
+        exact = defaultdict(int)
+        shapes = defaultdict(lambda: {'count': 0, 'duration': 0.0, 'sites': defaultdict(int)})
+        for query in self.queries:
+            exact[(query['sql'], repr(query['params']))] += 1
+            shape = shapes[fingerprint(query['sql'])]
+            shape['count'] += 1
+            shape['duration'] += query['duration']
+            shape['sites'][query['site']] += 1
+
+        similar = [
+            {
+                'fingerprint': sql,
+                'count': shape['count'],
+                'duration_ms': round(shape['duration'] * 1000, 3),
+                'sites': dict(shape['sites']),
+            }
+            for sql, shape in sorted(shapes.items(), key=lambda item: -item[1]['count'])
+            if shape['count'] > 1
+        ]
+        return {
+            'queries': self.count,
+            'duration_ms': round(self.duration * 1000, 3),
+            'duplicates': sum(count - 1 for count in exact.values()),
+            'similar': similar,
+            'n_plus_one': [shape for shape in similar if shape['count'] >= self.threshold],
+        }
+
+
+@contextmanager
+def profile_queries(threshold=None, using=None):
+    """Record the queries run on this thread's connections (or only ``using``) in the block."""
+    recorder = QueryRecorder(threshold)
+    aliases = [using] if using else list(connections)
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield recorder
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(max_queries, using=None):
+    """
+    Fail when the block runs more than ``max_queries`` queries.
+
+    Unlike ``assertNumQueries`` a cheaper endpoint passes, and the failure
+    lists the repeated query shapes with the lines that issued them::
+
+        with query_budget(3):
+            self.client.get('/orders/cart/')
+    """
+    with profile_queries(using=using) as recorder:
+        yield recorder
+    if recorder.count > max_queries:
+        report = recorder.report()
+        lines = [f'{recorder.count} queries executed, budget is {max_queries}']
+        for shape in report['similar']:
+            lines.append(f'{shape["count"]}x {shape["fingerprint"]}')
+            lines.extend(f'    {count}x from {site}' for site, count in shape['sites'].items())
+        raise QueryBudgetExceeded('\n'.join(lines))
+
+
+class QueryProfilerMiddleware:
+    """
+    Profile the queries of every request.
+
+    Adds a ``Server-Timing`` header with the query count and DB time, logs the
+    report as JSON to the ``core.profiling`` logger, at WARNING when an N+1
+    pattern is detected. Enabled by ``QUERY_PROFILER_ENABLED``. Queries run
+    while a streaming response is consumed are not counted. The middleware is
+    sync only: while it is enabled, async views run in a thread under ASGI.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with profile_queries() as recorder:
+            response = self.get_response(request)
+
+        report = recorder.report()
+        timings = [f'db;dur={report["duration_ms"]};desc="{report["queries"]} queries"']
+        if report['n_plus_one']:
+            timings.append(f'nplusone;desc="{len(report["n_plus_one"])} repeated query shapes"')
+        response['Server-Timing'] = ', '.join(filter(None, [response.get('Server-Timing'), *timings]))
+
+        level = logging.WARNING if report['n_plus_one'] else logging.DEBUG
+        if logger.isEnabledFor(level):
+            report.update(method=request.method, path=request.path, status=response.status_code)
+            logger.log(level, json.dumps(report), extra={'query_profile': report})
+        return response
@@ -0,0 +1,75 @@
+import decimal
+
+from rest_framework import renderers
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# Floats outside this range are written with an exponent, which orjson
+# formats differently from json.dumps (1e16 vs 1e+16).
+_PLAIN_FLOATS = (1e-4, 1e16)
+_LINE_SEPARATORS = (('\u2028'.encode(), b'\\u2028'), ('\u2029'.encode(), b'\\u2029'))
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    DRF's JSONRenderer backed by orjson when it is installed.
+
+    The output is byte for byte what DRF renders: Decimal values left by
+    method fields become floats and dates go through DRF's encoder, while
+    decimal model fields are already strings. Whatever orjson can not
+    reproduce exactly (indented output, ASCII-only output, integers over 64
+    bits, exponent floats from Decimals) is rendered by DRF instead. Unlike
+    DRF with ``STRICT_JSON``, NaN and infinite floats become ``null``.
+    """
+    options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+               if orjson else 0)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (orjson is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        encoder = self.encoder_class()
+
+        def default(obj):
+            if isinstance(obj, decimal.Decimal):
+                value = float(obj)
+                if value and not _PLAIN_FLOATS[0] <= abs(value) < _PLAIN_FLOATS[1]:
+                    raise TypeError('Exponent float')
+                return value
+            return encoder.default(obj)
+
+        try:
+            ret = orjson.dumps(data, default=default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80' in ret:
+            for separator, escaped in _LINE_SEPARATORS:
+                ret = ret.replace(separator, escaped)
+        return ret
+
+
+def stream_list(items, renderer=None, chunk_size=500):
+    """
+    Yield the JSON array of ``items`` in pieces, rendering ``chunk_size`` items at a time.
+
+    The pieces join to what ``renderer`` gives for the whole list, so a
+    ``StreamingHttpResponse`` over them never holds the full document.
+    """
+    renderer = renderer or JSONRenderer()
+    yield b'['
+    separator = b''
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield separator + renderer.render(chunk)[1:-1]
+            separator = b','
+            chunk = []
+    if chunk:
+        yield separator + renderer.render(chunk)[1:-1]
+    yield b']'
@@ -0,0 +1,105 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+
+class SparseFieldsMixin:
+    """
+    Lets clients trim a ModelSerializer with ``?fields=`` and ``?expand=``.
+
+    ``fields`` keeps only the listed fields. Nested relations among them are
+    rendered as primary keys unless also named in ``expand``, which nests them
+    in full and implies the field. Without ``fields`` the output is unchanged.
+
+    ``sparse_queryset()`` narrows a queryset to the columns, joins and
+    prefetches the kept fields read. ``Meta.field_sources`` lists the columns
+    behind method fields and ``Meta.field_querysets`` the queryset hooks
+    (annotations, prefetches) a field needs.
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None:
+            return
+        expand = set(expand or ())
+        keep = set(fields) | expand
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
+            elif name not in expand and isinstance(self.fields[name], serializers.BaseSerializer):
+                many = isinstance(self.fields[name], serializers.ListSerializer)
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, many=many)
+
+    @classmethod
+    def sparse_params(cls, query_params):
+        """Return ``(fields, expand)`` from the query string; ``fields`` is None when not given."""
+        def names(param):
+            value = query_params.get(param)
+            if value is None:
+                return None
+            return list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+
+        fields = names(cls.fields_query_param)
+        expand = names(cls.expand_query_param) or []
+        available = cls().fields
+        unknown = [name for name in (fields or []) + expand if name not in available]
+        if unknown:
+            raise ValidationError({cls.fields_query_param: [f'Unknown fields: {", ".join(unknown)}']})
+        flat = [name for name in expand if not isinstance(available[name], serializers.BaseSerializer)]
+        if flat:
+            raise ValidationError({cls.expand_query_param: [f'Not expandable: {", ".join(flat)}']})
+        return fields, expand
+
+    @classmethod
+    def sparse_queryset(cls, queryset, fields=None, expand=None):
+        """Return ``queryset`` loading only what the selected fields read."""
+        queryset, prefetches = cls.sparse_plan(queryset, fields, expand)
+        return queryset.prefetch_related(*prefetches)
+
+    @classmethod
+    def sparse_plan(cls, queryset, fields=None, expand=None):
+        """Like ``sparse_queryset()``, but return the prefetches apart, e.g. to run them concurrently."""
+        prefetches = []
+        meta = cls.Meta
+        sources = getattr(meta, 'field_sources', {})
+        hooks = getattr(meta, 'field_querysets', {})
+        opts = meta.model._meta
+        columns = {opts.pk.name}
+        for name, field in cls(fields=fields, expand=expand).fields.items():
+            if name in hooks:
+                queryset = hooks[name](queryset)
+            if name in sources:
+                columns.update(sources[name])
+                continue
+            try:
+                model_field = opts.get_field(field.source)
+            except FieldDoesNotExist:
+                continue
+
+            if isinstance(field, serializers.BaseSerializer):
+                nested = field.child if isinstance(field, serializers.ListSerializer) else field
+                if model_field.concrete:
+                    related = model_field.related_model._meta
+                    queryset = queryset.select_related(name)
+                    columns.add(name)
+                    columns.update(f'{name}__{child}' for child in nested.fields if _is_column(related, child))
+                else:
+                    prefetches.append(name)
+            elif isinstance(field, serializers.ManyRelatedField):
+                related = model_field.related_model
+                prefetches.append(Prefetch(
+                    name, queryset=related.objects.only(related._meta.pk.name, model_field.field.name),
+                ))
+            elif model_field.concrete:
+                columns.add(name)
+        return queryset.only(*columns), prefetches
+
+
+def _is_column(opts, name):
+    try:
+        return opts.get_field(name).concrete
+    except FieldDoesNotExist:
+        return False
@@ -43,10 +43,14 @@ INSTALLED_APPS = [
     'apps.products',
     'apps.reviews',
     'apps.orders',
+    'apps.inventory',
+    'apps.promotions',
+    'apps.benchmarks',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.profiling.QueryProfilerMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,10 +87,71 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Writers take the database lock up front and queue on it instead of
+        # failing with "database is locked" when upgrading a read transaction.
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # A file instead of the shared in-memory database, whose table locks
+        # fail immediately rather than waiting, so concurrency tests are real.
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+PRODUCT_DETAIL_CACHE_TIMEOUT = 300
+CATEGORY_TREE_CACHE_TIMEOUT = 600
+PRODUCT_FACETS_CACHE_TIMEOUT = 60
+# Lower bounds of the price facet buckets, on the discounted price.
+PRODUCT_PRICE_FACET_BUCKETS = ['0', '25', '50', '100', '250', '500', '1000']
+
+# In-process column store answering the product list, see apps.products.snapshot.
+# Refreshed from Product.updated_at every REFRESH_INTERVAL seconds, reading
+# REFRESH_LAG seconds back, and loaded again every RELOAD_INTERVAL seconds.
+PRODUCT_SNAPSHOT_ENABLED = False
+PRODUCT_SNAPSHOT_REFRESH_INTERVAL = 5
+PRODUCT_SNAPSHOT_REFRESH_LAG = 30
+PRODUCT_SNAPSHOT_RELOAD_INTERVAL = 60 * 60
+
+# Stock counter rows per product and reservation lifetimes in seconds, see apps.inventory.
+INVENTORY_COUNTER_SHARDS = 8
+INVENTORY_CART_HOLD_TIMEOUT = 15 * 60
+INVENTORY_CHECKOUT_HOLD_TIMEOUT = 10 * 60
+
+# Per-request query profiling, see core.profiling.
+QUERY_PROFILER_ENABLED = DEBUG
+QUERY_PROFILER_N_PLUS_ONE_THRESHOLD = 5
+
+# Seeded data and stored results of the benchmark commands, see apps.benchmarks.
+BENCHMARK_DATABASE_NAME = BASE_DIR / 'benchmark.sqlite3'
+BENCHMARK_BASELINE = BASE_DIR / 'apps' / 'benchmarks' / 'baseline.json'
+
+# DRF's defaults with the orjson-backed JSON renderer and parser, see core.renderers.
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
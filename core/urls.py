@@ -21,5 +21,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('products/', include('apps.products.urls', namespace='products')),
     path('orders/', include('apps.orders.urls', namespace='orders')),
-    # path('reviews/', include('apps.reviews.urls', namespace='reviews')),
+    path('reviews/', include('apps.reviews.urls', namespace='reviews')),
 ]